@@ -0,0 +1,299 @@
+# Copyright(c) 2024 STMicroelectronics International N.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Gang programming of data factory images: the boards of a fixture, each connected to its own ST-LINK
+# probe, are flashed concurrently. The per-device images (binary files, a -batch manifest or a container
+# file of genFactoryData.py) are queued, and one worker per probe takes the next image from the queue and
+# flashes it (with the optional M0 and M4 firmware) in a single programmer session, retrying on failure.
+# An image which failed on a probe is given back to the other probes. The result of each image is appended
+# to a Json lines log.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+from genFactoryData import (GREEN, RED, BLUE, RESET, dataFactoryContainer, flashingType,
+                            programmerCommand, programmerSession)
+
+def readImages(args, temp_dir):
+    """
+    Returns the queue content: list of (serial number, image file, source) of the devices to flash, from the
+    binary files, the -batch manifest or the container file given on the command line. source gives the origin
+    of the image in the results log: {"file": binary file} or {"container": container file}.
+    The images of a container are extracted to temp_dir, as the programmer flashes files.
+    """
+    images = [(os.path.splitext(os.path.basename(file))[0], file, {"file": file}) for file in args.images]
+    if args.manifest is not None:
+        with open(args.manifest, "r") as f:
+            for entry in json.load(f):
+                if entry.get("status") == "OK":
+                    serial_number = entry.get("serialNumber", os.path.splitext(os.path.basename(entry["file"]))[0])
+                    images.append((serial_number, entry["file"], {"file": entry["file"]}))
+    if args.container is not None:
+        with dataFactoryContainer(args.container) as container:
+            for position in range(len(container)):
+                serial_number, offset, length = container.entry(position)
+                file = os.path.join(temp_dir, f"{position}.bin")
+                with open(file, "wb") as f:
+                    f.write(container.buffer[offset:offset + length])
+                images.append((serial_number, file, {"container": args.container}))
+    return images
+
+def newSession(args, probe, image_file):
+    """ Returns the programmer session flashing the firmware (if any) and image_file on the board of probe """
+    programmer_path = args.programmerPath
+    session = programmerSession(programmerCommand(programmer_path, args.programmerCmd),
+                                programmer_path + "\\ExternalLoader\\" + args.externalLoader + ".stldr", probe)
+    if args.flashM0 is not None:
+        session.flash(args.flashM0, args.M0Addr, flashingType.M0)
+    if args.flashM4 is not None:
+        session.flash(args.flashM4, args.M4Addr, flashingType.M4)
+    session.flash(image_file, args.flashAddr, flashingType.DATAFACTORY)
+    return session
+
+async def runCommand(command, timeout):
+    """ Runs command, returns its exit code (None on timeout) and output """
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.STDOUT)
+    try:
+        output, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return None, b"timeout"
+    return process.returncode, output
+
+async def flashBoard(args, probe, serial_number, image_file, source):
+    """ Flashes image_file on the board of probe, retrying on failure. Returns the result of the board """
+    result = {"probe": probe, "serialNumber": serial_number, **source}
+    try:
+        with open(image_file, "rb") as f:
+            result["sha256"] = hashlib.sha256(f.read()).hexdigest()
+    except OSError as e:
+        result.update(status="ERROR", attempts=0, duration=0.0, error=str(e))
+        return result
+
+    start = time.perf_counter()
+    result["start"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    for attempt in range(1, args.retries + 2):
+        session = newSession(args, probe, image_file)
+        attempt_start = time.perf_counter()
+        try:
+            returncode, output = await runCommand(session.command(), args.timeout)
+        except OSError as e:
+            returncode, output = 1, str(e).encode("utf-8")
+        result["attempts"] = attempt
+        result["lastAttemptDuration"] = round(time.perf_counter() - attempt_start, 3)
+        if returncode == 0:
+            result["status"] = "OK"
+            result.pop("error", None)
+            break
+        # the last line of the programmer output gives the error
+        lines = output.decode("utf-8", "replace").strip().splitlines()
+        result["status"] = "ERROR"
+        result["error"] = lines[-1] if lines else f"exit code {returncode}"
+        print(f"{RED}[{probe}] {serial_number} attempt {attempt} failed: {result['error']}{RESET}")
+        # Reset the board before retrying
+        try:
+            await runCommand(session.resetCommand(), args.timeout)
+        except OSError:
+            pass
+        if attempt <= args.retries:
+            await asyncio.sleep(args.retryDelay)
+    result["duration"] = round(time.perf_counter() - start, 3)
+    return result
+
+class flashingQueue:
+    """
+    Images waiting to be flashed, shared by the probe workers. An image which failed on a probe is given
+    back to the probes which did not try it yet; it is recorded as failed when no such probe is left.
+    """
+
+    def __init__(self, images, probes, log):
+        # [serial number, image file, source, probes the image failed on, last failed result]
+        self.pending = [[serial_number, image_file, source, [], None] for serial_number, image_file, source in images]
+        self.probes = set(probes)
+        self.log = log
+        self.results = []
+        # number of images being flashed, which may be given back to the queue
+        self.flashing = 0
+        self.changed = asyncio.Condition()
+
+    async def take(self, probe):
+        """ Returns the next image to flash on the board of probe, or None when there is none left for it """
+        async with self.changed:
+            while True:
+                for image in self.pending:
+                    if probe not in image[3]:
+                        self.pending.remove(image)
+                        self.flashing += 1
+                        return image
+                if self.flashing == 0:
+                    return None
+                await self.changed.wait()
+
+    async def done(self, probe, image, result, disable=False):
+        """
+        Records the result of image flashed on the board of probe, giving the image back on failure.
+        With disable, probe is not given images anymore, including this one.
+        """
+        async with self.changed:
+            self.flashing -= 1
+            if disable:
+                self.probes.discard(probe)
+            if result["status"] == "OK":
+                self._record(result, image[3])
+            else:
+                image[3].append(probe)
+                image[4] = result
+                if self.probes.difference(image[3]):
+                    print(f"{RED}[{probe}] {image[0]} given back to the other probes{RESET}")
+                    self.pending.append(image)
+                else:
+                    self._record(result, image[3])
+            self.changed.notify_all()
+
+    async def leave(self, probe):
+        """ Removes probe: the pending images which only it could flash are recorded as failed """
+        async with self.changed:
+            self.probes.discard(probe)
+            for image in list(self.pending):
+                if not self.probes.difference(image[3]):
+                    self.pending.remove(image)
+                    self._record(self._notFlashed(image), image[3])
+            self.changed.notify_all()
+
+    def _notFlashed(self, image):
+        # result of an image no probe is left to flash
+        serial_number, _, source, _, result = image
+        if result is not None:
+            return result
+        return {"serialNumber": serial_number, **source, "status": "ERROR", "attempts": 0, "duration": 0.0,
+                "error": "not flashed, all the probes were disabled"}
+
+    def _record(self, result, failed_probes):
+        if failed_probes:
+            result["failedProbes"] = list(failed_probes)
+        self.results.append(result)
+        self.log.write(json.dumps(result) + "\n")
+        self.log.flush()
+        if result["status"] == "OK":
+            print(f"{GREEN}[{result['probe']}] {result['serialNumber']} flashed in {result['duration']:.2f} s "
+                  f"({result['attempts']} attempt(s)){RESET}")
+        else:
+            print(f"{RED}{result['serialNumber']} FAILED, no probe left to flash it: {result['error']}{RESET}")
+
+async def probeWorker(args, probe, images):
+    # Flash the images of the queue one after the other on the board of probe, until there is none left for
+    # it or the probe is given up after args.probeFailures boards failed in a row
+    failures = 0
+    while failures < args.probeFailures:
+        image = await images.take(probe)
+        if image is None:
+            break
+        serial_number, image_file, source = image[:3]
+        print(f"{BLUE}[{probe}] Flashing {serial_number}...{RESET}")
+        result = await flashBoard(args, probe, serial_number, image_file, source)
+        if result["status"] == "OK":
+            failures = 0
+        else:
+            print(f"{RED}[{probe}] {serial_number} failed after {result['attempts']} attempt(s){RESET}")
+            failures += 1
+            if failures == args.probeFailures:
+                print(f"{RED}[{probe}] {failures} board(s) failed in a row, probe disabled{RESET}")
+        await images.done(probe, image, result, failures == args.probeFailures)
+    await images.leave(probe)
+
+async def gangFlash(args, probes, images, log):
+    """ Flashes images on the boards of probes concurrently, one worker per probe. Returns the results """
+    queue = flashingQueue(images, probes, log)
+    await asyncio.gather(*(probeWorker(args, probe, queue) for probe in probes))
+    return queue.results
+
+def main():
+    programmer_path = "c:\\Program Files\\STMicroelectronics\\STM32Cube\\STM32CubeProgrammer\\bin"
+
+    parser = argparse.ArgumentParser(description="Flash data factory images on several boards concurrently, one per ST-LINK probe")
+    parser.add_argument("-probes", "-p", required=True, type=lambda probes: [probe for probe in probes.split(",") if probe],
+                        help="Serial numbers of the ST-LINK probes of the fixture, separated by commas. ex : -probes 0001,0002")
+    parser.add_argument("-flashAddr", "-fa", required=True,
+                        help="Address where the data factory images are flashed. ex : 0x901C0000")
+    parser.add_argument("-manifest", "-mf",
+                        help="Manifest of the images generated by genFactoryData.py -batch")
+    parser.add_argument("-container", "-ci",
+                        help="Container file of the images generated by genFactoryData.py -containerOut")
+    parser.add_argument("-flashM4", "-m4",
+                        help="M4 firmware flashed on each board before its data factory image")
+    parser.add_argument("-M4Addr", "-4a", default="0x08000000",
+                        help="Address where the M4 firmware is flashed. If not set, 0x08000000 will be used")
+    parser.add_argument("-flashM0", "-m0",
+                        help="M0 firmware upgraded on each board before its data factory image")
+    parser.add_argument("-M0Addr", "-0a",
+                        help="Address where the M0 firmware is flashed. Mandatory if -flashM0 option is used.")
+    parser.add_argument("-retries", "-r", type=int, default=2,
+                        help="Number of retries of a board after a failure. If not set, 2")
+    parser.add_argument("-retryDelay", "-rd", type=float, default=1.0,
+                        help="Delay in seconds before retrying a board. If not set, 1")
+    parser.add_argument("-probeFailures", "-pf", type=int, default=3,
+                        help="Number of boards failing in a row after which a probe is disabled. If not set, 3")
+    parser.add_argument("-timeout", "-t", type=float, default=300.0,
+                        help="Timeout in seconds of a programmer invocation. If not set, 300")
+    parser.add_argument("-log", "-l", default="gang_results.jsonl",
+                        help="Json lines file the result of each board is appended to. If not set, gang_results.jsonl")
+    parser.add_argument("-programmerPath", "-pp", default=programmer_path,
+                        help="Path to STM32CubeProgrammer. If not set, " + programmer_path + " will be used.")
+    parser.add_argument("-programmerCmd", "-pcmd",
+                        help="Command line running the programmer, overriding -programmerPath. ex : -programmerCmd \"py -3 stubProgrammer.py\"")
+    parser.add_argument("-externalLoader", "-el", default="S25FL128S_STM32WB5MM-DK",
+                        help="External loader file to use. If not set, S25FL128S_STM32WB5MM-DK will be used.")
+    parser.add_argument("images", nargs="*",
+                        help="Data factory binary files, named by serial number")
+    args = parser.parse_args()
+
+    if args.flashM0 is not None and args.M0Addr is None:
+        parser.error("-M0Addr is mandatory if -flashM0 option is used")
+    if not args.probes:
+        parser.error("no probe serial number given")
+    if len(set(args.probes)) != len(args.probes):
+        parser.error("the probe serial numbers must be distinct")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            images = readImages(args, temp_dir)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"{RED}Error reading the images: {e}{RESET}")
+            return 1
+        if not images:
+            print(f"{RED}No image to flash{RESET}")
+            return 1
+
+        print(f"{BLUE}Flashing {len(images)} image(s) with {len(args.probes)} probe(s)...{RESET}")
+        start = time.perf_counter()
+        with open(args.log, "a") as log:
+            results = asyncio.run(gangFlash(args, args.probes, images, log))
+        elapsed = time.perf_counter() - start
+
+    errors = [result for result in results if result["status"] != "OK"]
+    color = RED if errors else GREEN
+    print(f"{color}Gang flashing: {len(results) - len(errors)} board(s) flashed in {elapsed:.2f} s, "
+          f"{len(errors)} failure(s). Results appended to {args.log}{RESET}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -22,6 +22,16 @@ import tempfile
 import os
 import re
 import ssl
+import csv
+import hashlib
+import time
+import contextlib
+import concurrent.futures
+import functools
+import mmap
+import shlex
+import sys
+import collections
 from enum import Enum, auto
 
 class dataType(Enum):
@@ -72,6 +82,42 @@ name_map = {
 
 paramToName = {key.lower().replace("_", ""): key for key, value in name_map.items()}
 
+# Reverse index of name_map: ID -> name
+idToName = {value["id"]: key for key, value in name_map.items()}
+
+# Binary format: ID (32-bit, native byte order) and length (32-bit, little-endian) of each TLV, followed by its value
+tlv_id_struct = struct.Struct("I")
+tlv_length_struct = struct.Struct("<I")
+
+# Container of several binary images: header (magic, version, number of images), index of the images sorted by
+# serial number (serial number zero-padded to 32 bytes, offset and length of the image), then the images
+container_magic = b"STDF"
+container_version = 1
+container_serial_size = 32
+container_header_struct = struct.Struct("<4sII")
+container_entry_struct = struct.Struct(f"<{container_serial_size}sQI")
+
+# Decoders of the binary values, per data type: (format of the value or None for variable length, display format)
+binary_decoders = {
+    dataType.INT8: (struct.Struct("b"), '02x'),
+    dataType.INT16: (struct.Struct("<h"), '04x'),
+    dataType.INT32: (struct.Struct("<i"), '08x'),
+    dataType.STRING: (None, 'string'),
+    dataType.ARRAY8: (None, 'none'),
+}
+
+# Parameters given as pem or der files, and the kind of data to extract from them
+crypto_files = {
+    "CERTIFICATION_DECLARATION": cryptoType.CERT,
+    "FIRMWARE_INFORMATION": cryptoType.CERT,
+    "DEVICE_ATTESTATION_CERTIFICATE": cryptoType.CERT,
+    "PAI_CERTIFICATE": cryptoType.CERT,
+    "DEVICE_ATTESTATION_PRIV_KEY": cryptoType.PRIVATE,
+    "DEVICE_ATTESTATION_PUB_KEY": cryptoType.PUBLIC,
+    "SPAKE2_SALT": cryptoType.CERT,
+    "SPAKE2_VERIFIER": cryptoType.CERT,
+}
+
 # Define ANSI escape codes for text formatting
 RED = '\033[91m'       # Red text
 GREEN = '\033[92m'     # Green text
@@ -294,24 +340,31 @@ def writeJson(data_dict, file_path):
         print(f"{RED}Write to Json file {file_path} return ERROR -->{RESET}")
         print(e)
 
+# Function to encode data_dict to the binary data factory format
+def encodeBinary(data_dict):
+    """
+    Encodes a dictionary of TLVs to the binary data factory format, sorted by ID.
+
+    Args:
+        data_dict (dict): A dictionary of TLVs where the keys are IDs and the values are tuples of (value, type, name).
+
+    Returns:
+        bytes: The binary data factory image.
+    """
+    chunks = []
+    # Loop through ID/value/type tuples sorted by ID
+    for id, (value, _, _) in sorted(data_dict.items()):
+        # ID in native byte order and length in little-endian byte order, both 32-bit, followed by the value
+        chunks.append(tlv_id_struct.pack(id) + tlv_length_struct.pack(len(value)))
+        chunks.append(value)
+    return b"".join(chunks)
+
 # Function to write data_dict to binary file
 def writeBinary(data_dict, file_path):
-    # Sort data_dict by ID
-    data_dict = dict(sorted(data_dict.items()))
-
     # Open binary file for writing
     try:
         with open(file_path, "wb") as f:
-            # Loop through ID/value/type tuples
-            for id, (value, _, _) in data_dict.items():
-                # Verify that value does not exceed length
-                length = len(value)
-                # Convert ID to 32-bit binary format in native byte order
-                id_bin = struct.pack("I", id)
-                # Convert length to 32-bit binary format in little-endian byte order
-                len_bin = struct.pack("<I", length)
-                # Write TLV to binary file
-                f.write(id_bin + len_bin + value)
+            f.write(encodeBinary(data_dict))
             print(f"{GREEN}Write to binary file{file_path} successful{RESET}")
             return 0
     except IOError as e:
@@ -319,12 +372,46 @@ def writeBinary(data_dict, file_path):
         print(e)
         return 1
 
+# Yields the (ID, value) of the TLVs of a binary data factory buffer (bytes, bytearray, mmap...)
+# from offset to end. A value truncated by the end of the buffer is returned as is, as done when
+# reading a file; a TLV header truncated by the end of the buffer ends the iteration.
+def iterBinary(buffer, offset=0, end=None):
+    if end is None or end > len(buffer):
+        end = len(buffer)
+    header_size = tlv_id_struct.size + tlv_length_struct.size
+    while offset + header_size <= end:
+        id = tlv_id_struct.unpack_from(buffer, offset)[0]
+        length = tlv_length_struct.unpack_from(buffer, offset + tlv_id_struct.size)[0]
+        offset += header_size
+        yield id, bytes(buffer[offset:min(offset + length, end)])
+        offset += length
+    if offset < end:
+        print(f"{RED}  Read binary TLV header truncated at offset {offset}, the end of the data will be skipped{RESET}")
+
+# This function decodes the TLVs of a binary buffer, from offset to end, into the dictionary data_dict,
+# the TLVs being identified by their unique IDs. The data type of each TLV is given by the name_map
+# dictionary (through the idToName index), and its value is checked with the decoder of its type.
+# With quiet, the values set are not displayed.
+def decodeBinary(buffer, data_dict, who="Read binary", quiet=False, offset=0, end=None):
+    for id, value_bin in iterBinary(buffer, offset, end):
+        name = idToName.get(id)
+        if name is None:
+            print(f"{RED}  {who} Type {id} incorrect, this value will be skipped{RESET}")
+            continue
+        type = name_map[name]["type"]
+        value_struct, display_format = binary_decoders[type]
+        if value_struct is not None and len(value_bin) != value_struct.size:
+            print(f"{RED}  {who} {name} has an incorrect length {len(value_bin)}, this value will be skipped{RESET}")
+            continue
+        if not quiet:
+            displayChangedValue(data_dict, who, name, id, value_bin, display_format)
+        # Add ID/value/type tuple to dictionary
+        data_dict[id] = (value_bin, type, name)
+    return data_dict
+
 # This function reads a binary file containing TLVs and returns a dictionary data_dict containing
-# the TLVs and their values. The TLVs are identified by their unique IDs and contain values of
-# different data types such as integers, floats, strings, and booleans. The function uses the struct
-# module to unpack the binary data based on the data type specified in the name_map dictionary.
-# The resulting dictionary can be used to access the TLVs and their values.
-def readBinary(file_path, data_dict):
+# the TLVs and their values (see decodeBinary). The file is mapped in memory and decoded in place.
+def readBinary(file_path, data_dict, quiet=False):
     # Open binary file for reading
     try:
         f = open(file_path, "rb")
@@ -332,130 +419,283 @@ def readBinary(file_path, data_dict):
         print(f"{RED}Error: binary file {file_path} not found{RESET}")
         return None
 
-    # Loop through binary data
-    while True:
-        # Read ID (4 bytes)
-        id_bin = f.read(4)
-        if not id_bin:
-            # End of file
-            break
-        # Convert ID from binary to integer
-        id = struct.unpack("I", id_bin)[0]
-        
-        # Read length (4 bytes)
-        len_bin = f.read(4)
-        # Convert length from binary to integer
-        length = struct.unpack("<I", len_bin)[0]
-        
-        # Read value (length bytes)
-        value_bin = f.read(length)
-        
-        # Determine data type based on ID
-        if id in [v["id"] for v in name_map.values()]:
-            # Get name of TLV from name_map dictionary
-            name = [k for k, v in name_map.items() if v["id"] == id][0]
-            # Get data type from name_map dictionary
-            type = name_map[name]["type"]
-            # Unpack value based on data type
-            if type == dataType.INT8:
-                value = struct.unpack("b", value_bin)[0]
-                displayChangedValue(data_dict, "Read binary", name, id, value_bin, '02x')
-            elif type == dataType.INT16:
-                value = struct.unpack("<h", value_bin)[0]
-                displayChangedValue(data_dict, "Read binary", name, id, value_bin, '04x')
-            elif type == dataType.INT32:
-                value = struct.unpack("<i", value_bin)[0]
-                displayChangedValue(data_dict, "Read binary", name, id, value_bin, '08x')
-            elif type == "float":
-                value = struct.unpack("<f", value_bin)[0]
-            elif type == "bool":
-                value = struct.unpack("<?", value_bin)[0]
-            elif type == dataType.STRING:
-                value = value_bin.decode("utf-8")
-                displayChangedValue(data_dict, "Read binary", name, id, value_bin, 'string')
+    with f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file, it can't be mapped
+            return data_dict
+        with buffer:
+            return decodeBinary(buffer, data_dict, quiet=quiet)
+
+# Function to write several images to a container file
+def writeContainer(images, file_path):
+    """
+    Writes binary data factory images to a container file, with an index sorted by serial number at its beginning.
+
+    Args:
+        images (iterable): (serial number, image) pairs, the image being a data_dict (encoded as by writeBinary)
+                           or an already encoded binary image.
+        file_path (str): The path to the output container file.
+
+    Returns:
+        int: 0 on success, 1 on error.
+    """
+    try:
+        entries = {}
+        for serial_number, image in images:
+            serial_bin = serial_number.encode("utf-8")
+            if not serial_bin or len(serial_bin) > container_serial_size or b"\0" in serial_bin:
+                raise ValueError(f"invalid serial number {serial_number!r}")
+            if serial_bin in entries:
+                raise ValueError(f"duplicate serial number {serial_number}")
+            entries[serial_bin] = image if isinstance(image, (bytes, bytearray)) else encodeBinary(image)
+
+        offset = container_header_struct.size + len(entries) * container_entry_struct.size
+        index = []
+        for serial_bin in sorted(entries):
+            index.append(container_entry_struct.pack(serial_bin, offset, len(entries[serial_bin])))
+            offset += len(entries[serial_bin])
+
+        with open(file_path, "wb") as f:
+            f.write(container_header_struct.pack(container_magic, container_version, len(entries)))
+            f.write(b"".join(index))
+            for serial_bin in sorted(entries):
+                f.write(entries[serial_bin])
+        print(f"{GREEN}Write {len(entries)} images to container file {file_path} successful{RESET}")
+        return 0
+    except (IOError, ValueError) as e:
+        print(f"{RED}Write to container file {file_path} return ERROR -->{RESET}")
+        print(e)
+        return 1
+
+class dataFactoryContainer:
+    """
+    Read access to a container file written by writeContainer. The file is mapped in memory: an image
+    is located by a binary search of its serial number in the index, and decoded in place.
+    """
+
+    def __init__(self, file_path):
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < container_header_struct.size:
+                raise ValueError(f"{file_path} is not a data factory container file")
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.count = container_header_struct.unpack_from(self.buffer, 0)
+            if magic != container_magic or version != container_version:
+                raise ValueError(f"{file_path} is not a data factory container file")
+            if container_header_struct.size + self.count * container_entry_struct.size > len(self.buffer):
+                raise ValueError(f"container file {file_path} is truncated")
+        except ValueError:
+            self.buffer.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.buffer.close()
+
+    def entry(self, position):
+        """ Returns the (serial number, offset, length) of the image at position in the index """
+        serial_bin, offset, length = container_entry_struct.unpack_from(
+            self.buffer, container_header_struct.size + position * container_entry_struct.size)
+        self._checkImage(serial_bin, offset, length)
+        return serial_bin.rstrip(b"\0").decode("utf-8"), offset, length
+
+    def serialNumbers(self):
+        """ Returns the serial numbers of the images, sorted """
+        return [container_entry_struct.unpack_from(self.buffer, container_header_struct.size + position *
+                                                   container_entry_struct.size)[0].rstrip(b"\0").decode("utf-8")
+                for position in range(self.count)]
+
+    def find(self, serial_number):
+        """ Returns the (offset, length) of the image of serial_number, or None """
+        key = serial_number.encode("utf-8").ljust(container_serial_size, b"\0")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            entry_offset = container_header_struct.size + middle * container_entry_struct.size
+            serial_bin = self.buffer[entry_offset:entry_offset + len(key)]
+            if serial_bin < key:
+                low = middle + 1
+            elif serial_bin > key:
+                high = middle
             else:
-                value = value_bin
-                displayChangedValue(data_dict, "Read binary", name, id, value_bin, 'none')
-            # Add ID/value/type tuple to dictionary
-            value = value_bin
-            data_dict[id] = (value, type, name)
-            #print(f"  Name: {name}, ID: {id}, Type: {type}, Value: {value}")
-        else:
-            print(f"{RED}  Read binary Type {id} incorrect, this value will be skipped{RESET}")
-    f.close()
-    return data_dict
+                return self._checkImage(*container_entry_struct.unpack_from(self.buffer, entry_offset))
+        return None
 
-def flashBinary(binaryFile, flashAddr, programmer_path, external_loader_path, external_loader, type):
-            
-    # Construct the command to flash the binary file to the specified address
-    command = [
-        programmer_path + "\\STM32_Programmer_CLI.exe", "-c", "port=SWD", "mode=UR", "-el", external_loader_path + "\\" + external_loader + ".stldr",
-        "-d", binaryFile, flashAddr, "-V", "-rst"
-    ]
-    if type == flashingType.M4:
-        displayStr = "M4 firmware"
-    elif type == flashingType.M0:
-        command = [
-                programmer_path + "\\STM32_Programmer_CLI.exe", "-c", "port=SWD", "mode=UR",
-                "-ob nSWboot0=0 nboot1=1 nboot0=1", "-startfus",
-                "-fwupgrade", binaryFile, flashAddr, "-V"
-            ]
-        displayStr = "M0 firmware"
-    else:
-        displayStr = "data factory"
+    def _checkImage(self, serial_bin, offset, length):
+        # the index of a truncated container file refers to images beyond the end of the file
+        if offset + length > len(self.buffer):
+            serial_number = serial_bin.rstrip(b"\0").decode("utf-8", "replace")
+            raise ValueError(f"image of {serial_number} exceeds the container file, which is truncated")
+        return offset, length
 
-    # Run the command using check_output()
+    def readImage(self, serial_number):
+        """ Returns the binary image of serial_number, or None """
+        location = self.find(serial_number)
+        if location is None:
+            return None
+        offset, length = location
+        return self.buffer[offset:offset + length]
+
+    def readDevice(self, serial_number, data_dict, quiet=False):
+        """ Decodes the image of serial_number into data_dict (see decodeBinary), returns None if not found """
+        location = self.find(serial_number)
+        if location is None:
+            return None
+        offset, length = location
+        return decodeBinary(self.buffer, data_dict, "Read container", quiet, offset, offset + length)
+
+# Function to read the image of a device from a container file into data_dict
+def readContainer(file_path, serial_number, data_dict):
     try:
-        subprocess.check_output(command, stderr=subprocess.STDOUT)
-        # Print a message indicating that the binary file was successfully flashed to the specified address
-        print(f"{GREEN}Flash {displayStr} file {binaryFile} to address {flashAddr} successful{RESET}")
-    except subprocess.CalledProcessError as e:
-        # Print an error message if the flashing failed and print the output of the command
-        print(f"{RED}Flash {displayStr} file {binaryFile} to address {flashAddr} returned ERROR -->{RESET}")
-        print(e.output)
-        
-        # Reset the board
+        with dataFactoryContainer(file_path) as container:
+            retValue = container.readDevice(serial_number, data_dict)
+    except FileNotFoundError:
+        print(f"{RED}Error: container file {file_path} not found{RESET}")
+        return None
+    except ValueError as e:
+        print(f"{RED}Error: {e}{RESET}")
+        return None
+    if retValue is None:
+        print(f"{RED}Error: serial number {serial_number} not found in container file {file_path}{RESET}")
+    return retValue
+
+def programmerCommand(programmer_path, programmer_cmd=None):
+    """
+    Returns the command line prefix running STM32_Programmer_CLI from programmer_path, or the command line
+    programmer_cmd split as done by the shell (e.g. "python stubProgrammer.py" to run without hardware).
+    """
+    if programmer_cmd is None:
+        return [programmer_path + "\\STM32_Programmer_CLI.exe"]
+    if os.name == "nt":
+        # keep the backslashes of Windows paths, only remove the quotes
+        return [token.strip('"') for token in shlex.split(programmer_cmd, posix=False)]
+    return shlex.split(programmer_cmd)
+
+class programmerSession:
+    """
+    Flashing session of a board: the operations (M0 firmware upgrade, flash of binary files, read of the flash)
+    are queued, then run() executes them all in a single STM32_Programmer_CLI invocation, chaining the commands,
+    so that the board is connected and reset only once.
+
+    Args:
+        programmer_cmd (list): Command line prefix running the programmer (see programmerCommand).
+        external_loader_file (str): Path to the external loader (.stldr), used by flash and read operations.
+        serial_number (str): Serial number of the ST-LINK probe of the board, None for the only connected probe.
+    """
+
+    def __init__(self, programmer_cmd, external_loader_file, serial_number=None):
+        self.programmer_cmd = list(programmer_cmd)
+        self.external_loader_file = external_loader_file
+        self.connect = ["-c", "port=SWD", "mode=UR"]
+        if serial_number is not None:
+            self.connect.append("sn=" + serial_number)
+        # queued operations: (message, command arguments, uses external loader, operation type)
+        self.operations = []
+
+    def pending(self):
+        return len(self.operations)
+
+    def flash(self, binaryFile, flashAddr, type):
+        """ Queues the flash of binaryFile at flashAddr, type being a flashingType """
         if type == flashingType.M0:
-            command = [programmer_path + "\\STM32_Programmer_CLI.exe", "-c",  "port=swd",  "mode=UR", "-ob nSWboot0=1 nboot1=1 nboot0=1", "-rst"]
+            self.operations.append((f"Flash M0 firmware file {binaryFile} to address {flashAddr}",
+                                    ["-ob", "nSWboot0=0", "nboot1=1", "nboot0=1", "-startfus",
+                                     "-fwupgrade", binaryFile, flashAddr, "-V"], False, type))
         else:
-            command = [programmer_path + "\\STM32_Programmer_CLI.exe", "-c", "port=SWD", "mode=UR", "-rst"]
-        subprocess.run(command)
+            displayStr = "M4 firmware" if type == flashingType.M4 else "data factory"
+            self.operations.append((f"Flash {displayStr} file {binaryFile} to address {flashAddr}",
+                                    ["-d", binaryFile, flashAddr, "-V"], True, type))
 
-def readFlash(flashAddr, length, programmer_path, external_loader_path, external_loader, data_dict):
-    with tempfile.NamedTemporaryFile(suffix=".bin", delete=False) as tmp_file:
-        # Use the temporary file
-        # The temporary file will be automatically deleted when the 'with' block ends
-        print("  Temporary file name:", tmp_file.name)
+    def read(self, flashAddr, length, binaryOut):
+        """ Queues the read of length bytes of the flash from flashAddr to the file binaryOut """
+        self.operations.append((f"Read flash from address {flashAddr}",
+                                ["-r", flashAddr, str(length), binaryOut], True, None))
 
-        binaryOut = tmp_file.name
-        # Construct the command to read the binary file from the specified address
-        command = [
-            programmer_path + "\\STM32_Programmer_CLI.exe", "-c", "port=SWD", "mode=UR", "-el", external_loader_path + "\\" + external_loader + ".stldr",
-            "-r " + flashAddr, str(length), "\"" + binaryOut + "\"", "-rst"
-        ]
-        # print (command)
-        # Run the command using check_output()
+    def command(self):
+        """ Returns the command line running the queued operations """
+        return self._command(self.operations)
+
+    def _command(self, operations):
+        command = self.programmer_cmd + self.connect
+        if any(uses_loader for _, _, uses_loader, _ in operations):
+            command += ["-el", self.external_loader_file]
+        for _, arguments, _, _ in operations:
+            command += arguments
+        return command + ["-rst"]
+
+    def resetCommand(self):
+        """ Returns the command line resetting the board after a failure of the queued operations """
+        return self._resetCommand(self.operations)
+
+    def _resetCommand(self, operations):
+        # restore the boot option bytes if the M0 firmware was being upgraded
+        if any(type == flashingType.M0 for _, _, _, type in operations):
+            return self.programmer_cmd + self.connect + ["-ob", "nSWboot0=1", "nboot1=1", "nboot0=1", "-rst"]
+        return self.programmer_cmd + self.connect + ["-rst"]
+
+    def run(self):
+        """
+        Runs the queued operations in a single programmer invocation and empties the queue.
+        On failure, the board is reset (restoring the boot option bytes if the M0 firmware was being upgraded).
+
+        Returns:
+            bool: True if all the operations succeeded.
+        """
+        operations, self.operations = self.operations, []
+        if not operations:
+            return True
         try:
-            subprocess.check_output(command, stderr=subprocess.STDOUT)
-            # Print a message indicating that the binary file was successfully read frem the specified address
-            print(f"{GREEN}Read flash from address {flashAddr} successful{RESET}")
-            print(f"{BLUE}Read from temporary binary file {binaryOut}...{RESET}")
-            retValue = readBinary(binaryOut, data_dict)
-            
-            if retValue is not None:
-                print(f"{GREEN}Read from temporary binary file {binaryOut} successful{RESET}")
-                toBeReturn = retValue
-            else:
-                toBeReturn = data_dict
-        except subprocess.CalledProcessError as e:
-            # Print an error message if the reading failed and print the output of the command
-            print(f"{RED}Read flash from address {flashAddr} returned ERROR -->{RESET}")
-            print(e.output.decode("utf-8"))
-            
+            subprocess.check_output(self._command(operations), stderr=subprocess.STDOUT)
+        except (subprocess.CalledProcessError, OSError) as e:
+            for message, _, _, _ in operations:
+                print(f"{RED}{message} returned ERROR -->{RESET}")
+            output = getattr(e, "output", None)
+            print(output.decode("utf-8", "replace") if isinstance(output, bytes) else e)
+
             # Reset the board
-            command = [programmer_path + "\\STM32_Programmer_CLI.exe", "-c", "port=SWD", "mode=UR", "-rst"]
-            subprocess.run(command)
-            toBeReturn =  data_dict
+            try:
+                subprocess.run(self._resetCommand(operations))
+            except OSError as e:
+                print(e)
+            return False
+        for message, _, _, _ in operations:
+            print(f"{GREEN}{message} successful{RESET}")
+        return True
+
+def flashBinary(binaryFile, flashAddr, programmer_path, external_loader_path, external_loader, type):
+    # Flash the binary file to the specified address in its own programmer session
+    session = programmerSession(programmerCommand(programmer_path),
+                                external_loader_path + "\\" + external_loader + ".stldr")
+    session.flash(binaryFile, flashAddr, type)
+    return session.run()
+
+def readFlash(flashAddr, length, programmer_path, external_loader_path, external_loader, data_dict, session=None):
+    # Read the flash in the given programmer session (running its queued operations too) or in its own session
+    if session is None:
+        session = programmerSession(programmerCommand(programmer_path),
+                                    external_loader_path + "\\" + external_loader + ".stldr")
+    with tempfile.NamedTemporaryFile(suffix=".bin", delete=False) as tmp_file:
+        print("  Temporary file name:", tmp_file.name)
+        binaryOut = tmp_file.name
+
+    session.read(flashAddr, length, binaryOut)
+    toBeReturn = data_dict
+    if session.run():
+        print(f"{BLUE}Read from temporary binary file {binaryOut}...{RESET}")
+        retValue = readBinary(binaryOut, data_dict)
+        if retValue is not None:
+            print(f"{GREEN}Read from temporary binary file {binaryOut} successful{RESET}")
+            toBeReturn = retValue
 
     os.remove(binaryOut)
     return toBeReturn
@@ -463,13 +703,19 @@ def readFlash(flashAddr, length, programmer_path, external_loader_path, external
 def read_certificate(cert_file, type):
     """
     Reads a PEM-encoded SSL/TLS certificate file and returns its contents as a byte array.
+    The files are only read and decoded once: the shared certificates of a batch are read a single time.
 
     Args:
         cert_file (str): The path to the PEM-encoded certificate file.
 
     Returns:
-        bytearray: A byte array containing the contents of the certificate file.
+        list: The bytes of the certificate as hex strings, or None on error.
     """
+    value = _read_certificate_cached(os.path.abspath(cert_file), type)
+    return None if value is None else list(value)
+
+@functools.lru_cache(maxsize=None)
+def _read_certificate_cached(cert_file, type):
     sep = '  '
     extension = os.path.splitext(cert_file)[1]
     try:
@@ -507,7 +753,7 @@ def read_certificate(cert_file, type):
             raise ValueError(f'extension {extension} of {cert_file} is not known') 
         
         # Return the byte array
-        return [f"0x{b:02x}" for b in byte_array]
+        return tuple(f"0x{b:02x}" for b in byte_array)
 
     except FileNotFoundError:
         print(f"{sep}{RED}Error: File '{cert_file}' not found.{RESET}")
@@ -525,6 +771,187 @@ def read_certificate(cert_file, type):
         print(f"{sep}{RED}Error: Failed to read certificate file '{cert_file}': {e}.{RESET}")
         return None
     
+# Template data_dict of the batch worker processes, set once per process by _initBatchWorker
+_batch_template = None
+
+def readBatchFile(file_path):
+    """
+    Reads the per-device overrides of a batch from a CSV file (one column per parameter, with a header line)
+    or a JSONL file (one JSON object per line). Empty CSV cells are ignored.
+
+    Args:
+        file_path (str): The path to the .csv or .jsonl file.
+
+    Returns:
+        list: One dictionary of parameter name -> value per device.
+    """
+    if os.path.splitext(file_path)[1].lower() == ".csv":
+        with open(file_path, "r", newline="", encoding="utf-8-sig") as f:
+            return [{key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+                    for row in csv.DictReader(f)]
+    devices = []
+    with open(file_path, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            if line.strip():
+                devices.append(json.loads(line))
+    return devices
+
+def applyOverrides(data_dict, overrides):
+    """
+    Sets the values of the parameters of overrides in data_dict, as the command line parameters do.
+    Parameters are named as in the Json files (SERIAL_NUMBER) or as the command line options (serialNumber).
+    Certificates and keys are given as pem or der file paths, hex strings or lists of hex bytes.
+
+    Args:
+        data_dict (dict): A dictionary of TLVs where the keys are IDs and the values are tuples of (value, type, name).
+        overrides (dict): parameter name -> value. The binaryOut key, if any, is ignored.
+
+    Returns:
+        None. Raises ValueError if a parameter is unknown or a file can't be read.
+    """
+    for key, value in overrides.items():
+        if key == "binaryOut":
+            continue
+        name = paramToName.get(key.lower().replace("_", ""))
+        if name is None:
+            raise ValueError(f"unknown parameter {key}")
+        if name_map[name]["type"] == dataType.ARRAY8 and isinstance(value, str):
+            if os.path.splitext(value)[1] in (".pem", ".der"):
+                value = read_certificate(value, crypto_files.get(name, cryptoType.CERT))
+                if value is None:
+                    raise ValueError(f"can't read {key} file {overrides[key]}")
+            else:
+                hex_string = value[2:] if value.startswith("0x") else value
+                value = [hex_string[i:i + 2] for i in range(0, len(hex_string), 2)]
+        elif not isinstance(value, list):
+            value = str(value)
+        fillData(name, value, data_dict, "Batch")
+
+def _initBatchWorker(template):
+    global _batch_template
+    _batch_template = template
+
+def buildDeviceBinary(job):
+    """
+    Builds the binary data factory image of a device of a batch: the overrides of the device are applied
+    on a copy of the template data_dict, and the image is written to the output file.
+    The messages of the data factory functions are not displayed.
+
+    Args:
+        job (tuple): (index of the device, overrides of the device, output file path)
+
+    Returns:
+        dict: The manifest entry of the device.
+    """
+    index, overrides, file_path = job
+    entry = {"index": index, "file": file_path}
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            data_dict = dict(_batch_template)
+            applyOverrides(data_dict, overrides)
+            data = encodeBinary(data_dict)
+        with open(file_path, "wb") as f:
+            f.write(data)
+    except (OSError, ValueError, struct.error) as e:
+        entry["status"] = "ERROR"
+        entry["error"] = str(e)
+        return entry
+    serial_number = data_dict.get(name_map["SERIAL_NUMBER"]["id"])
+    if serial_number is not None:
+        entry["serialNumber"] = serial_number[0].decode("utf-8", "replace")
+    entry["size"] = len(data)
+    entry["sha256"] = hashlib.sha256(data).hexdigest()
+    entry["status"] = "OK"
+    return entry
+
+def buildBatch(data_dict, batch_file, output_dir, manifest_path, jobs, container_path=None):
+    """
+    Builds the binary data factory images of all the devices of batch_file, on top of the template data_dict,
+    in a pool of jobs worker processes, and writes the manifest of the images with their sha256 hash.
+    Without binaryOut column, the image of a device is named after its serial number (or the one of the template).
+    Devices sharing an output file or a serial number are rejected, as their images could not be told apart.
+    With container_path, the images are also written to a container file, indexed by serial number.
+
+    Returns:
+        int: The number of devices in error, plus one if the container file can not be written.
+    """
+    try:
+        devices = readBatchFile(batch_file)
+    except (OSError, ValueError) as e:
+        print(f"{RED}Read batch file {batch_file} return ERROR -->{RESET}")
+        print(e)
+        return 1
+
+    os.makedirs(output_dir, exist_ok=True)
+    template_serial = data_dict.get(name_map["SERIAL_NUMBER"]["id"])
+    template_serial = template_serial[0].decode("utf-8", "replace") if template_serial is not None else None
+    batch_jobs = []
+    serial_numbers = []
+    for index, overrides in enumerate(devices):
+        serial_number = next((str(value) for key, value in overrides.items()
+                              if paramToName.get(key.lower().replace("_", "")) == "SERIAL_NUMBER"), template_serial)
+        file_name = overrides.get("binaryOut")
+        if file_name is None:
+            file_name = f"{serial_number}.bin" if serial_number else f"device_{index}.bin"
+        batch_jobs.append((index, overrides, os.path.join(output_dir, file_name)))
+        serial_numbers.append(serial_number)
+
+    # Two devices with the same output file would overwrite each other, and two devices with the same
+    # serial number can not be told apart in the container: all of them are rejected
+    file_counts = collections.Counter(os.path.normcase(os.path.abspath(file_path)) for _, _, file_path in batch_jobs)
+    serial_counts = collections.Counter(serial_number for serial_number in serial_numbers if serial_number)
+    rejected = {}
+    for (index, overrides, file_path), serial_number in zip(batch_jobs, serial_numbers):
+        if file_counts[os.path.normcase(os.path.abspath(file_path))] > 1:
+            rejected[index] = {"index": index, "file": file_path, "status": "ERROR",
+                               "error": f"output file {file_path} is shared with another device"}
+        elif serial_number and serial_counts[serial_number] > 1:
+            rejected[index] = {"index": index, "file": file_path, "status": "ERROR",
+                               "error": f"serial number {serial_number} is shared with another device"}
+    batch_jobs = [job for job in batch_jobs if job[0] not in rejected]
+
+    start = time.perf_counter()
+    if jobs == 1:
+        _initBatchWorker(data_dict)
+        built = [buildDeviceBinary(job) for job in batch_jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_initBatchWorker,
+                                                    initargs=(data_dict,)) as executor:
+            chunksize = max(1, len(batch_jobs) // (4 * jobs))
+            built = list(executor.map(buildDeviceBinary, batch_jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+    manifest = sorted(built + list(rejected.values()), key=lambda entry: entry["index"])
+
+    errors = [entry for entry in manifest if entry["status"] != "OK"]
+    for entry in errors:
+        print(f"{RED}  Device {entry['index']} ({entry['file']}) ERROR: {entry['error']}{RESET}")
+
+    try:
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=4)
+        print(f"{GREEN}Write to manifest file {manifest_path} successful{RESET}")
+    except IOError as e:
+        print(f"{RED}Write to manifest file {manifest_path} return ERROR -->{RESET}")
+        print(e)
+
+    color = RED if errors else GREEN
+    print(f"{color}Batch: {len(manifest) - len(errors)} binary files written in {elapsed:.2f} s, "
+          f"{len(errors)} error(s){RESET}")
+
+    if container_path is not None:
+        images = []
+        for entry in manifest:
+            if entry["status"] != "OK":
+                continue
+            if "serialNumber" not in entry:
+                print(f"{RED}  Device {entry['index']} ({entry['file']}) has no serial number, it is not added to the container{RESET}")
+                continue
+            with open(entry["file"], "rb") as f:
+                images.append((entry["serialNumber"], f.read()))
+        # the container is counted as one more error if it can not be written
+        return len(errors) + writeContainer(images, container_path)
+    return len(errors)
+
 def display_help(parser):
     """
     Display the help message for the script.
@@ -558,6 +985,11 @@ def main():
                         "will be read first, and then Binary input file will be read, eventualy overriding jsin input file values")
     parser.add_argument("-binaryOut", "-bo",
                         help="Binary output file path")
+    parser.add_argument("-containerIn", "-ci",
+                        help="Container input file path (see -containerOut). The image of the device set by -containerSerial is read after " +\
+                        "the Json and binary input files, eventually overriding their values")
+    parser.add_argument("-containerSerial", "-cs",
+                        help="Serial number of the device to read from the -containerIn container file")
     parser.add_argument("-flashIn", "-fi",
                         help="Input data are read from flash from this address. Will override data read from "+\
                         "Json input file or binary input file")
@@ -642,6 +1074,22 @@ def main():
     parser.add_argument("-externalLoader", "-el",
                         help="External loader file to use. If not set, " + external_loader + " will be used. External loader is in this folder : " +\
                             external_loader_path +" . Used if option flashIn or flashAddr is set.")
+    parser.add_argument("-batch", "-ba",
+                        help="CSV or JSONL file of per-device parameters. One binary file per device is generated, " +\
+                            "with the parameters of the device overriding the ones read from files, flash or command line.")
+    parser.add_argument("-batchOutDir", "-bd", default=".",
+                        help="Directory of the binary files generated by -batch. If not set, the current directory is used.")
+    parser.add_argument("-manifest", "-mf",
+                        help="Manifest file of the binary files generated by -batch. If not set, manifest.json in the -batchOutDir directory.")
+    parser.add_argument("-containerOut", "-co",
+                        help="Container file path. The binary files generated by -batch are also written to this single file, indexed by serial number.")
+    parser.add_argument("-jobs", "-j", type=int, default=os.cpu_count(),
+                        help="Number of worker processes generating the binary files of -batch. If not set, the number of CPUs.")
+    parser.add_argument("-programmerCmd", "-pcmd",
+                        help="Command line running the programmer, overriding -programmerPath. ex : -programmerCmd \"python stubProgrammer.py\" " +\
+                            "to run without hardware.")
+    parser.add_argument("-probeSerial", "-ps",
+                        help="Serial number of the ST-LINK probe of the board (sn= connection parameter). If not set, the only connected probe is used.")
     parser.add_argument("-showHelp", "-sh",
                         action="store_true",
                         help="Show this help message and exit")
@@ -662,16 +1110,21 @@ def main():
     if args.externalLoader is not None:
         external_loader =  args.externalLoader
 
+    # All the flashing operations on the board are run in a single programmer invocation, or two if the
+    # flash must be read before writing the data factory
+    session = programmerSession(programmerCommand(programmer_path, args.programmerCmd),
+                                external_loader_path + "\\" + external_loader + ".stldr", args.probeSerial)
+
     if args.flashM0 is not None:
         if args.M0Addr is not None:
             print(f"{BLUE}Flashing M0 firmware {args.flashM0} to address {args.M0Addr} ...{RESET}")
-            flashBinary(args.flashM0, args.M0Addr, programmer_path, external_loader_path, external_loader, flashingType.M0)
+            session.flash(args.flashM0, args.M0Addr, flashingType.M0)
         else:
             print(f"{RED}Flashing M0 firmware {args.flashM4} is missing M0 firmware flash address. use -M0Addr option to set address.{RESET}")
 
     if args.flashM4 is not None:
         print(f"{BLUE}Flashing M4 firmware {args.flashM4} to address {M4_address} ...{RESET}")
-        flashBinary(args.flashM4, M4_address, programmer_path, external_loader_path, external_loader, flashingType.M4)
+        session.flash(args.flashM4, M4_address, flashingType.M4)
 
     if args.jsonIn is not None:
         print(f"{BLUE}Read from Json file {args.jsonIn}...{RESET}")
@@ -688,26 +1141,27 @@ def main():
             print(f"{GREEN}Read from binary file {args.binaryIn} successful{RESET}")
             data_dict = retValue
         
+    if args.containerIn is not None:
+        if args.containerSerial is not None:
+            print(f"{BLUE}Read device {args.containerSerial} from container file {args.containerIn}...{RESET}")
+            retValue = readContainer(args.containerIn, args.containerSerial, data_dict)
+            if retValue is not None:
+                print(f"{GREEN}Read device {args.containerSerial} from container file {args.containerIn} successful{RESET}")
+                data_dict = retValue
+        else:
+            print(f"{RED}Read from container file {args.containerIn} is missing the serial number of the device. use -containerSerial option to set it.{RESET}")
+
     if args.flashIn is not None:
         print(f"{BLUE}Read from flash address {args.flashIn}...{RESET}")
-        data_dict = readFlash(args.flashIn, 2048, programmer_path, external_loader_path, external_loader, data_dict)
+        data_dict = readFlash(args.flashIn, 2048, programmer_path, external_loader_path, external_loader, data_dict, session)
 
     print(f"{BLUE}Analyze cli parameters (if any)...{RESET}")
     # Parse parameters corresponding to data factory data and add to data_dict
     for attr in dir(args):
         if (not attr.startswith('_')) and (getattr(args, attr) is not None) and (attr.lower() in paramToName):
             value = getattr(args, attr)
-            if attr.lower() == "certificationdeclaration" or \
-               attr.lower() == "firmwareinformation" or \
-               attr.lower() == "deviceattestationcertificate" or \
-               attr.lower() == "paicertificate" or \
-               attr.lower() == "spake2salt" or \
-               attr.lower() == "spake2verifier":
-                value = read_certificate(getattr(args, attr), cryptoType.CERT)
-            elif attr.lower() == "deviceattestationprivkey":
-                value = read_certificate(getattr(args, attr), cryptoType.PRIVATE)
-            elif attr.lower() == "deviceattestationpubkey":
-                value = read_certificate(getattr(args, attr), cryptoType.PUBLIC)
+            if paramToName[attr.lower()] in crypto_files:
+                value = read_certificate(getattr(args, attr), crypto_files[paramToName[attr.lower()]])
             # print(f'{attr}: {getattr(args, attr)} --- {paramToName[attr.lower()]} -> {getattr(args, attr)}')
             if value is not None:
                 fillData(paramToName[attr.lower()], value, data_dict, "Cli parameter")
@@ -742,11 +1196,21 @@ def main():
             if retValue == 0:
                 # Print a message indicating that the binary file is being flashed to the specified address
                 print(f"{BLUE}Flashing data factory file {args.binaryOut} to address {args.flashAddr} ...{RESET}")
-                flashBinary(args.binaryOut, args.flashAddr, programmer_path, external_loader_path, external_loader, flashingType.DATAFACTORY)
+                session.flash(args.binaryOut, args.flashAddr, flashingType.DATAFACTORY)
             else:
                 print(f"{RED}Flashing data factory file {args.binaryOut} to address {args.flashAddr} Impossible "+\
                     f"as binary data factory file can't be written{RESET}")
 
+    if session.pending():
+        print(f"{BLUE}Running {session.pending()} flashing operation(s) in a single programmer session...{RESET}")
+        session.run()
+
+    if args.batch is not None:
+        print(f"{BLUE}Build batch {args.batch}...{RESET}")
+        manifest_path = args.manifest if args.manifest is not None else os.path.join(args.batchOutDir, "manifest.json")
+        if buildBatch(data_dict, args.batch, args.batchOutDir, manifest_path, max(1, args.jobs or 1), args.containerOut):
+            sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
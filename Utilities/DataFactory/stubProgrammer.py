@@ -0,0 +1,169 @@
+# Copyright(c) 2024 STMicroelectronics International N.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Stub of STM32_Programmer_CLI, to run the flashing operations of genFactoryData.py without hardware:
+#   py -3 .\genFactoryData.py -programmerCmd "py -3 stubProgrammer.py" ...
+#
+# The commands used by genFactoryData.py are supported, chained in a single invocation as the real
+# programmer does: -c (connect), -el, -d (download), -V, -r (read), -ob, -startfus, -fwupgrade, -rst.
+# The flash of each board (one per probe serial number, sn= connection parameter) is simulated in a
+# Json state file of the state directory, which also counts the connections and resets of the board.
+# The state directory is set by --state-dir (before the programmer commands) or by the
+# STUB_PROGRAMMER_DIR environment variable, and is <temporary directory>/stub_programmer by default.
+#
+# To exercise gangFlash.py, the following environment variables simulate a slow or unreliable fixture:
+#   STUB_PROGRAMMER_DELAY       duration in seconds of each invocation (the time taken by the flashing)
+#   STUB_PROGRAMMER_FAIL_RATE   probability (0 to 1) of an invocation failing as if the board was not found
+#   STUB_PROGRAMMER_FAIL_PROBES serial numbers of probes, separated by commas, whose invocations always fail
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+def stateFile(state_dir, serial_number):
+    return os.path.join(state_dir, f"board_{serial_number or 'default'}.json")
+
+def loadState(file_path):
+    try:
+        with open(file_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"connections": 0, "resets": 0, "optionBytes": {}, "segments": [], "log": []}
+
+def saveState(file_path, state):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_file = file_path + ".tmp"
+    with open(temp_file, "w") as f:
+        json.dump(state, f)
+    os.replace(temp_file, file_path)
+
+def readMemory(state, address, length):
+    # Erased flash reads as 0xFF, the segments are applied in the order they were written
+    memory = bytearray(b"\xff" * length)
+    for segment_address, data_hex in state["segments"]:
+        data = bytes.fromhex(data_hex)
+        start = max(address, segment_address)
+        end = min(address + length, segment_address + len(data))
+        if start < end:
+            memory[start - address:end - address] = data[start - segment_address:end - segment_address]
+    return bytes(memory)
+
+def writeMemory(state, address, file_path):
+    with open(file_path, "rb") as f:
+        data = f.read()
+    state["segments"].append([address, data.hex()])
+    return len(data)
+
+def takeParameters(args, position):
+    # Returns the parameters following the command at position (up to the next command) and the next position
+    end = position + 1
+    while end < len(args) and not args[end].startswith("-"):
+        end += 1
+    return args[position + 1:end], end
+
+def connectionFails(serial_number):
+    # Simulated connection failures, see STUB_PROGRAMMER_FAIL_PROBES and STUB_PROGRAMMER_FAIL_RATE
+    fail_probes = os.environ.get("STUB_PROGRAMMER_FAIL_PROBES", "").split(",")
+    if serial_number is not None and serial_number in fail_probes:
+        return True
+    return random.random() < float(os.environ.get("STUB_PROGRAMMER_FAIL_RATE", "0"))
+
+def run(args, state_dir):
+    position = 0
+    state = None
+    file_path = None
+    status = 0
+    while status == 0 and position < len(args):
+        command = args[position]
+        parameters, next_position = takeParameters(args, position)
+
+        if command in ("-c", "--connect"):
+            connection = dict(parameter.split("=", 1) for parameter in parameters if "=" in parameter)
+            if connectionFails(connection.get("sn")):
+                print("Error: No STM32 target found!")
+                status = 1
+                break
+            file_path = stateFile(state_dir, connection.get("sn"))
+            state = loadState(file_path)
+            state["connections"] += 1
+            state["log"].append(args)
+            print(f"ST-LINK SN  : {connection.get('sn', 'default')}")
+            print("Connected to the board")
+        elif state is None:
+            print(f"Error: command {command} requires a connection (-c)")
+            status = 1
+        elif command in ("-el", "--extload"):
+            next_position = position + 2
+        elif command in ("-d", "--download", "-fwupgrade"):
+            if len(parameters) < 2:
+                print(f"Error: command {command} requires a file and an address")
+                status = 1
+                break
+            try:
+                length = writeMemory(state, int(parameters[1], 0), parameters[0])
+            except (OSError, ValueError) as e:
+                print(f"Error: {e}")
+                status = 1
+                break
+            print(f"Memory Programming ... {length} bytes at address {parameters[1]}")
+            print("File download complete")
+        elif command in ("-V", "--verify"):
+            print("Download verified successfully")
+        elif command in ("-r", "--read", "-u", "--upload"):
+            if len(parameters) < 3:
+                print(f"Error: command {command} requires an address, a size and a file")
+                status = 1
+                break
+            try:
+                data = readMemory(state, int(parameters[0], 0), int(parameters[1], 0))
+                with open(parameters[2], "wb") as f:
+                    f.write(data)
+            except (OSError, ValueError) as e:
+                print(f"Error: {e}")
+                status = 1
+                break
+            print(f"Reading data ... {len(data)} bytes from address {parameters[0]}")
+            print("Upload completed successfully")
+        elif command in ("-ob", "--optionbytes"):
+            state["optionBytes"].update(dict(parameter.split("=", 1) for parameter in parameters if "=" in parameter))
+            print("Option Bytes successfully programmed")
+        elif command == "-startfus":
+            print("FUS started")
+        elif command in ("-rst", "--reset"):
+            state["resets"] += 1
+            print("MCU Reset")
+        else:
+            print(f"Error: unknown command {command}")
+            status = 1
+        position = next_position
+
+    # the operations done before an error are kept, as on the board
+    if state is not None:
+        saveState(file_path, state)
+    return status
+
+def main():
+    args = sys.argv[1:]
+    state_dir = os.environ.get("STUB_PROGRAMMER_DIR", os.path.join(tempfile.gettempdir(), "stub_programmer"))
+    if args[:1] == ["--state-dir"]:
+        state_dir = args[1]
+        args = args[2:]
+    time.sleep(float(os.environ.get("STUB_PROGRAMMER_DELAY", "0")))
+    sys.exit(run(args, state_dir))
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,8 @@
         -m4 followed by full path to M4 binary (mandatory)
         -m0 followed by full path to M0 binary (optional)
         -o followed by output bin (optional)
+        -da followed by a digest algorithm, e.g. sha256 (optional): the digest of the
+            output bin is saved to <output bin>.<algorithm> for ST_ota_image_tool.py
 
     You can use -h or --help to display help.
 
@@ -43,6 +45,7 @@
 import os
 import struct
 import argparse
+import hashlib
 
 CreateMatterBin_about_name = "CreateMatterBin"
 CreateMatterBin_about_version = "v1.0"
@@ -50,40 +53,90 @@ CreateMatterBin_about_date = "2024-03-21"
 
 DEFAULT_OUTPUT_MATTER_BIN = "MatterM4M0.bin"
 
+# Buffer size used to stream the M4 and M0 binaries to the Matter binary
+STREAM_BUFFER_SIZE = 256 * 1024
+
+# Digest algorithms supported by -da (the shake algorithms have no fixed digest size)
+DIGEST_ALGORITHMS = sorted(algorithm for algorithm in hashlib.algorithms_guaranteed
+                           if not algorithm.startswith('shake_'))
+
+# #################################################################
+#  make_header function
+# Return : header of a Matter binary made of M4 and M0 binaries of
+#          the given sizes
+# #################################################################
+def make_header(M4BinarySize, M0BinarySize):
+    return struct.pack("II", M4BinarySize, M0BinarySize)
+
+# #################################################################
+#  file_chunks function
+#  Yield the content of the file at file_path in chunks. The chunks
+#  are views on a single reused buffer, each of them must be used
+#  before the next one is requested.
+# #################################################################
+def file_chunks(file_path):
+
+    buffer = memoryview(bytearray(STREAM_BUFFER_SIZE))
+
+    with open(file_path, 'rb') as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            yield buffer[:count]
+
+# #################################################################
+#  matter_bin_chunks function
+#  Yield the content of the Matter binary made of Header, the M4
+#  binary and the M0 binary (optional) in chunks, streaming the
+#  component files (see file_chunks)
+# #################################################################
+def matter_bin_chunks(Header, file_path_M4, file_path_M0):
+
+    yield Header
+    yield from file_chunks(file_path_M4)
+    if file_path_M0:
+        yield from file_chunks(file_path_M0)
+
 # #################################################################
 #  make_bin function
 #  Create Matter binary files made of:
 #   - Header
 #   - M4 binary file
 #   - M0 binary file (optional)
+#  The component files are streamed to the output file, they are
+#  never loaded in memory.
+#  If digest_algorithm is set (e.g. "sha256"), the digest of the
+#  Matter binary is computed while it is written and saved to
+#  <file_path_Matter>.<digest_algorithm> (sha256sum format), so that
+#  ST_ota_image_tool.py --digest-file does not need to hash it again.
+#  If progress is set, it is called with the number of bytes written
+#  and the total size of the Matter binary after each chunk.
 # Return code : 0 if success
 # #################################################################
-def make_bin(file_path_M4, file_path_M0, file_path_Matter):
+def make_bin(file_path_M4, file_path_M0, file_path_Matter, digest_algorithm=None, progress=None):
+
+    if digest_algorithm and digest_algorithm not in DIGEST_ALGORITHMS:
+        print(f"Error, unsupported digest algorithm {digest_algorithm}")
+        return(1)
 
-    # Read M4 bin content
+    # Get M4 bin size
     try:
         M4BinarySize = os.path.getsize(file_path_M4)
-        with open(file_path_M4,'rb') as f:
-            dataM4 = f.read()
-            f.close()
     except:
         print("Error opening M4 binary")
         return(1)    
      
-    # Read M0 bin content  
+    # Get M0 bin size
     if file_path_M0:
         try:
             M0BinarySize = os.path.getsize(file_path_M0)                
-            with open(file_path_M0,'rb') as f:
-                dataM0 = f.read()
-                f.close()
         except:
             print("Error opening M0 binary")
             return(1)     
     else:
         # if no M0 bin provided, uses an empty M0 bin 
         M0BinarySize = 0
-        dataM0 = b''
 
     print("*** M4 binary ***")
     print(file_path_M4)    
@@ -94,26 +147,48 @@ def make_bin(file_path_M4, file_path_M0, file_path_Matter):
 
     # Create the header
     print("*** MATTER binary ***")
-    Header = struct.pack("II", M4BinarySize, M0BinarySize)
+    Header = make_header(M4BinarySize, M0BinarySize)
     print("Header = ", Header)
 
+    digest = hashlib.new(digest_algorithm) if digest_algorithm else None
+
     # Write Matter bin content   
     try:        
         with open(file_path_Matter,'wb') as f:
-            f.write(Header + dataM4 + dataM0)
-            f.close()
+            size = 0
+            for chunk in matter_bin_chunks(Header, file_path_M4, file_path_M0):
+                f.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                size += len(chunk)
+                if progress is not None:
+                    progress(size, len(Header) + M4BinarySize + M0BinarySize)
             print("Output= ", file_path_Matter)
     except:
         print("Error during binary creation")
         return(1)      
 
+    if size != len(Header) + M4BinarySize + M0BinarySize:
+        print("Error, binary size changed during binary creation")
+        return(1)
+
+    # Write Matter bin digest
+    if digest is not None:
+        try:
+            with open(file_path_Matter + "." + digest_algorithm, 'w') as f:
+                f.write(f"{digest.hexdigest()}  {os.path.basename(file_path_Matter)}\n")
+            print(f"{digest_algorithm} = ", digest.hexdigest())
+        except:
+            print("Error during digest file creation")
+            return(1)
+
     # success
     return(0) 
 
 # #################################################################
 #  parse_input_args function
 #  This function parse input arguments
-#  Returns: M4_path, M0_path
+#  Returns: M4_path, M0_path, output bin, digest algorithm
 # #################################################################
 def parse_input_args():
     # arguments parsing
@@ -124,10 +199,13 @@ def parse_input_args():
                         help='full path to M0 bin file', default=None)
     parser.add_argument('-o', type=str,
                         help='output bin file name')
+    parser.add_argument('-da', type=str, choices=DIGEST_ALGORITHMS,
+                        help='digest algorithm (e.g. sha256) of the output bin, saved to <output bin>.<algorithm>',
+                        default=None)
 
     args = parser.parse_args()
 
-    return args.m4, args.m0, args.o  
+    return args.m4, args.m0, args.o, args.da
 
 # #################################################################
 #  main function
@@ -136,14 +214,14 @@ def main():
 
     print("< create Matter bin started >")
     # parse input arguments
-    M4_path, M0_path, output_bin = parse_input_args()
+    M4_path, M0_path, output_bin, digest_algorithm = parse_input_args()
 
     if output_bin is None:
         output_bin = DEFAULT_OUTPUT_MATTER_BIN
 
     if M4_path:
         # all mandatory args are present, create the Matter bin
-        ret = make_bin(M4_path, M0_path, output_bin)  
+        ret = make_bin(M4_path, M0_path, output_bin, digest_algorithm)  
         if ret != 0:
             print("Matter binary creation failed.")
         else:
@@ -25,11 +25,22 @@
     This script provides a Graphic User Interface for various scripts:
         > CreateMatterBin.py: for STM32WB, assemble M4 binary + M0 binary with a header
         > ota_image_tool.py: create Matter OTA image file
+        > ST_ota_image_tool.py: create Matter OTA image file directly from the
+          M4 binary + M0 binary
+
+    The builds run in a background worker thread, so that the window stays
+    responsive. Several builds may be queued, and the running build reports
+    its progress (bytes processed, MB/s, ETA) and can be cancelled.
 
     note: PySimpleGUI library is required.
 """
 
+import copy
 import os
+import queue
+import sys
+import threading
+import time
 
 # === import third party libraries ===
 import PySimpleGUI as sg
@@ -41,6 +52,7 @@ from ota_image_tool import generate_image as OTA_generate_image
 # === import custom libraries ===
 from ST_ota_image_tool import HeaderAttributes
 from ST_ota_image_tool import extract_data_from_chip_config
+from ST_ota_image_tool import generate_matter_image
 from CreateMatterBin import parse_input_args as CMB_parse_input_args
 from CreateMatterBin import make_bin as CMB_make_bin
 
@@ -52,6 +64,180 @@ DEFAULT_OUTPUT_MATTER_BIN = "MatterM4M0.bin"
 DEFAULT_OTA_IMAGE = "M4M0-Matter-fw.ota"
 CURRENT_FOLDER = os.getcwd()
 
+# minimum delay (in seconds) between two progress events posted to the window
+PROGRESS_EVENT_PERIOD = 0.1
+
+# maximum delay (in seconds) waiting for the running build to stop when the window is closed
+STOP_TIMEOUT = 2.0
+
+#################################################################
+# BuildCancelled exception
+# Raised from the progress callback of a build to abort it
+#################################################################
+class BuildCancelled(Exception):
+    pass
+
+#################################################################
+# WorkerOutput class
+# Replacement of sys.stdout/sys.stderr forwarding the text printed
+# by the worker thread to the window as -BUILD_OUTPUT- events (the
+# window must only be updated from the GUI thread). Text printed by
+# other threads, or once the window is closing, goes to the original
+# stream.
+#################################################################
+class WorkerOutput():
+
+    def __init__(self, stream, worker):
+        self.stream = stream
+        self.worker = worker
+
+    def write(self, text):
+        if threading.current_thread() is not self.worker.thread or not self.worker.post('-BUILD_OUTPUT-', text):
+            self.stream.write(text)
+
+    def flush(self):
+        if threading.current_thread() is not self.thread:
+            self.stream.flush()
+# end of class WorkerOutput
+
+#################################################################
+# BuildWorker class
+# Background thread running the queued build jobs one at a time.
+# It posts the following events to the window:
+#   -BUILD_PROGRESS- (name, processed bytes, total bytes, MB/s, ETA)
+#   -BUILD_DONE-, -BUILD_FAILED-, -BUILD_CANCELLED- (name, message)
+#   -BUILD_OUTPUT- text printed by the job
+# No event is posted once stop() was called: the window is closing
+# and the GUI thread does not read the events anymore.
+#################################################################
+class BuildWorker():
+
+    def __init__(self, window):
+        self.window = window
+        self.jobs = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.closing = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        sys.stdout = WorkerOutput(sys.stdout, self)
+        sys.stderr = WorkerOutput(sys.stderr, self)
+        self.thread.start()
+    # end of function __init
+
+    def submit(self, name, function, *args, output_file=None):
+        """
+        queue function(*args, progress=callback) for execution, output_file is
+        removed if the job is cancelled. Returns the number of queued jobs.
+        """
+        self.jobs.put((name, function, args, output_file))
+        return self.jobs.qsize()
+    # end of function submit
+
+    def cancel(self):
+        """
+        cancel the running job and drop the queued ones
+        """
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                break
+        self.cancel_event.set()
+    # end of function cancel
+
+    def stop(self):
+        """
+        cancel the builds and wait (at most STOP_TIMEOUT) for the thread to exit,
+        called by the GUI thread when the window is closing
+        """
+        self.closing.set()
+        self.cancel()
+        self.jobs.put(None)
+        # the thread is a daemon: if the running build does not check its progress
+        # callback in time, it is abandoned when the application exits
+        self.thread.join(STOP_TIMEOUT)
+        sys.stdout = sys.stdout.stream
+        sys.stderr = sys.stderr.stream
+    # end of function stop
+
+    def post(self, event, value):
+        """
+        post event to the window, unless it is closing. Returns True if posted
+        """
+        if self.closing.is_set():
+            return False
+        try:
+            self.window.write_event_value(event, value)
+        except Exception:
+            # the window was closed meanwhile
+            if not self.closing.is_set():
+                raise
+            return False
+        return True
+    # end of function post
+
+    def run(self):
+        while (job := self.jobs.get()) is not None:
+            name, function, args, output_file = job
+            self.cancel_event.clear()
+            start_time = time.monotonic()
+            last_event_time = 0
+
+            def progress(processed, total):
+                nonlocal last_event_time
+                if self.cancel_event.is_set():
+                    raise BuildCancelled()
+                now = time.monotonic()
+                if now - last_event_time < PROGRESS_EVENT_PERIOD and processed != total:
+                    return
+                last_event_time = now
+                rate = processed / max(now - start_time, 1e-6)
+                eta = (total - processed) / rate if total and rate else None
+                self.post('-BUILD_PROGRESS-',
+                          (name, processed, total, rate / (1024 * 1024), eta))
+
+            try:
+                ret = function(*args, progress=progress)
+                if self.cancel_event.is_set():
+                    raise BuildCancelled()
+                if ret:
+                    self.post('-BUILD_FAILED-', (name, f"returned {ret}"))
+                else:
+                    self.post('-BUILD_DONE-', (name, f"{time.monotonic() - start_time:.1f} s"))
+            except BuildCancelled:
+                if output_file is not None and os.path.exists(output_file):
+                    os.remove(output_file)
+                self.post('-BUILD_CANCELLED-', (name, ""))
+            except SystemExit:
+                # ota_image_tool reports errors on stderr, then calls sys.exit()
+                self.post('-BUILD_FAILED-', (name, ""))
+            except Exception as e:
+                self.post('-BUILD_FAILED-', (name, str(e)))
+    # end of function run
+# end of class BuildWorker
+
+#################################################################
+# build_ota_image function
+# Build job: validate the header attributes and create the OTA image
+#################################################################
+def build_ota_image(ota_args, progress=None):
+    OTA_validate_header_attributes(ota_args)    
+    print("OTA: validate_header_attributes done.")
+    OTA_generate_image(ota_args, progress=progress)                  
+    print("OTA: generate_image done.")                       
+# end of function build_ota_image
+
+#################################################################
+# build_matter_ota_image function
+# Build job: validate the header attributes and create the OTA image
+# directly from M4 bin + M0 bin
+#################################################################
+def build_matter_ota_image(ota_args, file_path_M4, file_path_M0, file_path_Matter, progress=None):
+    OTA_validate_header_attributes(ota_args)    
+    print("OTA: validate_header_attributes done.")
+    generate_matter_image(ota_args, ota_args.output_file, file_path_M4, file_path_M0, file_path_Matter, progress)
+    print("OTA: generate_matter_image done.")
+# end of function build_matter_ota_image
+
 #################################################################
 # application class
 # This the application class which creates the application window(s)
@@ -129,9 +315,18 @@ class application():
                     [sg.Text('Ouput OTA image: '),
                     sg.Input(self.ota_args.output_file, size=(50, 1), key='-FILENAME_OTA_IMAGE-')],                
                     # Bottom buttons row for OTA image
-                    [sg.Button('Create OTA image', key="-BUTTON_OTA_IMAGE-", button_color=('white', 'red'))],
+                    [sg.Button('Create OTA image', key="-BUTTON_OTA_IMAGE-", button_color=('white', 'red')),
+                     sg.Button('Create OTA image from M4/M0', key="-BUTTON_MATTER_OTA-", button_color=('white', 'red')),
+                     sg.Checkbox('Keep Matter binary', default=False, key='-KEEP_MATTER_BIN-')],
                     [sg.HorizontalSeparator()],                                                            
                     ]]
+
+        section_Build = [[
+                    # Background build progress
+                    [sg.Text('Idle', size=(60, 1), key='-BUILD_STATUS-')],
+                    [sg.ProgressBar(1000, orientation='h', size=(40, 15), key='-BUILD_PROGRESS_BAR-'),
+                     sg.Button('Cancel builds', key="-BUTTON_CANCEL-")],
+                    ]]
         
 
         # === application layout ===
@@ -142,6 +337,9 @@ class application():
             # Create OTA firmware section
             section_OTA_Fw,
 
+            # Background builds section
+            section_Build,
+
             # Output window (all prints are rerouted to -OUTPUT_WINDOW-)                      
             [sg.Output(size=(50,10), expand_x=True, key='-OUTPUT_WINDOW-')],
 
@@ -152,7 +350,11 @@ class application():
         ]
 
         # create app window         
-        self.window = sg.Window(APPLICATION_NAME + " - " + APP_VERSION_STRING, layout)
+        self.window = sg.Window(APPLICATION_NAME + " - " + APP_VERSION_STRING, layout, finalize=True)
+
+        # start the background build worker (after the output window reroutes prints)
+        self.worker = BuildWorker(self.window)
+        self.queued_builds = 0
 
         self.initialized = True         
     # end of function __init
@@ -174,7 +376,8 @@ class application():
         close properly the application
         add clean operations here if needed...
         """
-        pass
+        self.worker.stop()
+        self.window.close()
     # end of function closeApp
 
     def check_event_app(self, event, values):
@@ -188,13 +391,12 @@ class application():
         # Create Matter bin (header + M4 bin + M0 bin)
         elif event == '-BUTTON_MATTER_BIN-':   
             print("-=-=-=-=-=-=-=-=-=-=-")
-            ret = CMB_make_bin(values['-FILENAME_M4-'], 
-                               values['-FILENAME_M0-'], 
-                               values['-FILENAME_OUT_BIN-'])  
-            if ret != 0:
-                print("Matter binary creation failed.")
-            else:
-                print("Matter binary created successfully.")
+            self.submit_build("Matter binary", CMB_make_bin,
+                              values['-FILENAME_M4-'], 
+                              values['-FILENAME_M0-'], 
+                              values['-FILENAME_OUT_BIN-'],
+                              None,
+                              output_file=values['-FILENAME_OUT_BIN-'])
 
         # Extract infos from CHIP config file
         elif event == '-BUTTON_EXTRACT_DATA-':  
@@ -212,21 +414,57 @@ class application():
         elif event == '-BUTTON_OTA_IMAGE-':
             print("-=-=-=-=-=-=-=-=-=-=-")
             # update self.ota_args parameters
-            self.ota_args.vendor_id = int(values['-VENDOR_ID-'], 16)
-            self.ota_args.product_id = int(values['-PRODUCT_ID-'], 16)
-            self.ota_args.version = int(values['-VERSION-'])
-            self.ota_args.version_str = values['-VERSION_STR-']
-            # update files name
-            self.ota_args.input_files = [values['-FILENAME_OUT_BIN-']]
-            self.ota_args.output_file = values['-FILENAME_OTA_IMAGE-']
+            self.update_ota_args(values)
 
             #self.ota_args.print()
 
-            # call CHIPTOOL functions
-            OTA_validate_header_attributes(self.ota_args)    
-            print("OTA: validate_header_attributes done.")
-            OTA_generate_image(self.ota_args)                  
-            print("OTA: generate_image done.")                       
+            # call CHIPTOOL functions in the background
+            self.submit_build("OTA image", build_ota_image, copy.deepcopy(self.ota_args),
+                              output_file=self.ota_args.output_file)
+
+        # Create OTA firmware image directly from M4 bin + M0 bin, the Matter
+        # binary is only written if requested
+        elif event == '-BUTTON_MATTER_OTA-':
+            print("-=-=-=-=-=-=-=-=-=-=-")
+            # update self.ota_args parameters
+            self.update_ota_args(values)
+            matter_bin = values['-FILENAME_OUT_BIN-'] if values['-KEEP_MATTER_BIN-'] else None
+
+            self.submit_build("OTA image from M4/M0", build_matter_ota_image, copy.deepcopy(self.ota_args),
+                              values['-FILENAME_M4-'],
+                              values['-FILENAME_M0-'],
+                              matter_bin,
+                              output_file=self.ota_args.output_file)
+
+        elif event == '-BUTTON_CANCEL-':
+            self.worker.cancel()
+            self.queued_builds = 0
+
+        # Background build events
+        elif event == '-BUILD_OUTPUT-':
+            print(values[event], end='')
+
+        elif event == '-BUILD_PROGRESS-':
+            name, processed, total, rate, eta = values[event]
+            status = f"{name}: {processed / (1024 * 1024):.1f}"
+            if total:
+                status += f"/{total / (1024 * 1024):.1f}"
+                self.window['-BUILD_PROGRESS_BAR-'].update(current_count=int(1000 * processed / total))
+            status += f" MB, {rate:.1f} MB/s"
+            if eta is not None:
+                status += f", ETA {eta:.0f} s"
+            if self.queued_builds > 1:
+                status += f" ({self.queued_builds - 1} queued)"
+            self.window['-BUILD_STATUS-'].update(status)
+
+        elif event in ('-BUILD_DONE-', '-BUILD_FAILED-', '-BUILD_CANCELLED-'):
+            name, message = values[event]
+            result = {'-BUILD_DONE-': "done", '-BUILD_FAILED-': "failed", '-BUILD_CANCELLED-': "cancelled"}[event]
+            print(f"{name} {result}. {message}")
+            self.queued_builds = max(self.queued_builds - 1, 0)
+            if self.queued_builds == 0:
+                self.window['-BUILD_STATUS-'].update(f"Idle (last build: {name} {result})")
+                self.window['-BUILD_PROGRESS_BAR-'].update(current_count=0)
 
         elif event == '-BUTTON_CLEAR-':
             # Clear M4 binary
@@ -254,6 +492,29 @@ class application():
         return running        
     # end of function  def check_event_app()
 
+    def submit_build(self, name, function, *args, output_file=None):
+        """
+        queue a build job in the background worker
+        """
+        self.worker.submit(name, function, *args, output_file=output_file)
+        self.queued_builds += 1
+        if self.queued_builds > 1:
+            print(f"{name} queued ({self.queued_builds - 1} build(s) ahead).")
+    # end of function submit_build
+
+    def update_ota_args(self, values):
+        """
+        update self.ota_args parameters from the window values
+        """
+        self.ota_args.vendor_id = int(values['-VENDOR_ID-'], 16)
+        self.ota_args.product_id = int(values['-PRODUCT_ID-'], 16)
+        self.ota_args.version = int(values['-VERSION-'])
+        self.ota_args.version_str = values['-VERSION_STR-']
+        # update files name
+        self.ota_args.input_files = [values['-FILENAME_OUT_BIN-']]
+        self.ota_args.output_file = values['-FILENAME_OTA_IMAGE-']
+    # end of function update_ota_args
+
 # end of class application()
  
 
@@ -263,7 +524,7 @@ class application():
 if __name__ == "__main__":
 
     # arguments parsing
-    m4_path, m0_path, output_bin = CMB_parse_input_args()
+    m4_path, m0_path, output_bin, _digest_algorithm = CMB_parse_input_args()
 
     if output_bin is None:
         output_bin = DEFAULT_OUTPUT_MATTER_BIN
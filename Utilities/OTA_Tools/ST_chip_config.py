@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+
+# Copyright(c) 2024 STMicroelectronics International N.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    @file    ST_chip_config.py
+    @author  Matter Team
+    @brief   Parsed index of the macros defined by a CHIP configuration
+             file (CHIPProjectConfig.h) and the files it includes.
+
+    The configuration file is tokenized in a single pass: every object-like
+    #define is recorded, "#include" chains are followed and #ifdef/#ifndef/#if
+    blocks are evaluated. The resulting index is cached in memory and on disk,
+    keyed by the path of the configuration file and the modification times of
+    all the files it was built from, so repeated builds reuse it instantly.
+
+    Usage examples:
+    python ./ST_chip_config.py CHIPProjectConfig.h
+    python ./ST_chip_config.py -I ../Inc CHIPProjectConfig.h CHIP_DEVICE_CONFIG_DEVICE_VENDOR_ID
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import sys
+
+# default location of the on-disk cache
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'st_mft', 'chip_config_index.json')
+
+# version of the cache content, to be increased when the index format or the
+# evaluation of the #if expressions changes
+CACHE_VERSION = 2
+
+DIRECTIVE_RE = re.compile(r'^\s*#\s*(\w+)\s*(.*)$')
+DEFINE_RE = re.compile(r'^(\w+)(\(?)\s*(.*)$')
+INCLUDE_RE = re.compile(r'^(?:"([^"]+)"|<([^>]+)>)')
+COMMENT_RE = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\])*"', re.DOTALL)
+DEFINED_RE = re.compile(r'\bdefined\s*(?:\(\s*(\w+)\s*\)|(\w+))')
+IDENTIFIER_RE = re.compile(r'\b[A-Za-z_]\w*\b')
+INT_SUFFIX_RE = re.compile(r'\b((?:0[xX][0-9a-fA-F]+)|\d+)[uUlL]+\b')
+INT_RE = re.compile(r'\b(?:0[xX][0-9a-fA-F]+|\d+)\b')
+UNARY_OPERAND_RE = re.compile(r'\s*(?:(\()|([!~+-])|(\w+))')
+STRING_RE = re.compile(r'"((?:\\.|[^"\\])*)"')
+
+# in-memory cache: (path, include dirs) -> ChipConfigIndex
+_index_cache = {}
+
+
+# #################################################################
+#  strip_comments function
+#  Returns: text without C and C++ comments (string literals are kept)
+# #################################################################
+def strip_comments(text):
+    return COMMENT_RE.sub(lambda m: m.group(0) if m.group(0).startswith('"') else ' ', text)
+
+
+# #################################################################
+#  _translate_not function
+#  Replaces the C operator ! by Python not. The operand of ! (a
+#  unary expression) is parenthesized with it, as not has a lower
+#  precedence than the comparisons in Python
+#  Returns: translated expression
+# #################################################################
+def _translate_not(expression):
+    position = expression.find('!')
+    while position >= 0:
+        if expression.startswith('!=', position):
+            position = expression.find('!', position + 2)
+            continue
+        end = _unary_operand_end(expression, position + 1)
+        expression = (expression[:position] + '(not ' + expression[position + 1:end] + ')' + expression[end:])
+        position = expression.find('!', position)
+    return expression
+
+
+def _unary_operand_end(expression, position):
+    # Returns the end of the unary expression starting at position
+    match = UNARY_OPERAND_RE.match(expression, position)
+    if match is None:
+        raise ValueError("missing operand of !")
+    if match.group(2):
+        return _unary_operand_end(expression, match.end())
+    if match.group(3):
+        return match.end()
+    depth = 1
+    position = match.end()
+    while depth:
+        if position == len(expression):
+            raise ValueError("unbalanced parentheses")
+        if expression[position] == '(':
+            depth += 1
+        elif expression[position] == ')':
+            depth -= 1
+        position += 1
+    return position
+
+
+# #################################################################
+#  class _IntExpressionEvaluator
+#  Evaluates the integer expression of a #if directive, with the C
+#  semantics: integer division and modulo truncated toward zero,
+#  comparisons and logical operators giving 0 or 1. The expression,
+#  written with the Python operators and, or and not, is parsed
+#  with ast; the constructs without an equivalent in the C
+#  preprocessor (or whose precedence differs) are rejected
+# #################################################################
+class _IntExpressionEvaluator:
+
+    BINARY_OPERATORS = {
+        ast.Add: lambda a, b: a + b,
+        ast.Sub: lambda a, b: a - b,
+        ast.Mult: lambda a, b: a * b,
+        ast.Div: lambda a, b: _c_division(a, b),
+        ast.Mod: lambda a, b: a - b * _c_division(a, b),
+        ast.LShift: lambda a, b: a << b,
+        ast.RShift: lambda a, b: a >> b,
+        ast.BitAnd: lambda a, b: a & b,
+        ast.BitOr: lambda a, b: a | b,
+        ast.BitXor: lambda a, b: a ^ b,
+    }
+    UNARY_OPERATORS = {
+        ast.UAdd: lambda a: a,
+        ast.USub: lambda a: -a,
+        ast.Invert: lambda a: ~a,
+        ast.Not: lambda a: int(not a),
+    }
+    EQUALITY_OPERATORS = {
+        ast.Eq: lambda a, b: a == b,
+        ast.NotEq: lambda a, b: a != b,
+    }
+    RELATIONAL_OPERATORS = {
+        ast.Lt: lambda a, b: a < b,
+        ast.LtE: lambda a, b: a <= b,
+        ast.Gt: lambda a, b: a > b,
+        ast.GtE: lambda a, b: a >= b,
+    }
+    COMPARISON_OPERATORS = {**EQUALITY_OPERATORS, **RELATIONAL_OPERATORS}
+    BITWISE_OPERATORS = (ast.BitAnd, ast.BitOr, ast.BitXor)
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+
+    def evaluate(self):
+        return self._evaluate(ast.parse(self.expression, mode='eval').body)
+
+    def _parenthesized(self, node):
+        # True if node is written between parentheses (the ast does not keep them)
+        before = self.expression[:node.col_offset].rstrip()
+        after = self.expression[node.end_col_offset:].lstrip()
+        return before.endswith('(') and after.startswith(')')
+
+    def _evaluate(self, node):
+        if isinstance(node, ast.Constant) and type(node.value) is int:
+            return node.value
+        if isinstance(node, ast.Name):
+            # identifier remaining after the macro expansion
+            return 0
+        if isinstance(node, ast.BinOp) and type(node.op) in self.BINARY_OPERATORS:
+            left, right = self._evaluate(node.left), self._evaluate(node.right)
+            return self.BINARY_OPERATORS[type(node.op)](left, right)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in self.UNARY_OPERATORS:
+            return self.UNARY_OPERATORS[type(node.op)](self._evaluate(node.operand))
+        if isinstance(node, ast.BoolOp):
+            # short-circuit evaluation, as in C
+            value = isinstance(node.op, ast.And)
+            for operand in node.values:
+                if bool(self._evaluate(operand)) != value:
+                    return int(not value)
+            return int(value)
+        if isinstance(node, ast.Compare):
+            return self._compare(node)
+        raise ValueError(f"unsupported construct '{ast.get_source_segment(self.expression, node)}'")
+
+    def _compare(self, node):
+        operands = [node.left] + node.comparators
+        for operand in operands:
+            # C: the bitwise operators have a lower precedence than the comparisons
+            if (isinstance(operand, ast.BinOp) and isinstance(operand.op, self.BITWISE_OPERATORS)
+                    and not self._parenthesized(operand)):
+                raise ValueError("bitwise operator mixed with a comparison, parentheses are required")
+        equality = [type(op) in self.EQUALITY_OPERATORS for op in node.ops]
+        if any(equality) and not all(equality):
+            # C: the relational operators have a higher precedence than == and !=
+            raise ValueError("relational and equality operators mixed, parentheses are required")
+        # C: a < b < c is (a < b) < c
+        value = self._evaluate(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            if type(op) not in self.COMPARISON_OPERATORS:
+                raise ValueError(f"unsupported comparison '{ast.get_source_segment(self.expression, node)}'")
+            value = int(self.COMPARISON_OPERATORS[type(op)](value, self._evaluate(comparator)))
+        return value
+# end of class _IntExpressionEvaluator
+
+
+def _c_division(a, b):
+    if b == 0:
+        raise ValueError("division by zero")
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+# #################################################################
+#  class ChipConfigIndex
+#  Macros defined by a CHIP configuration file and its includes
+# #################################################################
+class ChipConfigIndex:
+
+    def __init__(self, path, macros, files):
+        # path of the configuration file
+        self.path = path
+        # macro name -> replacement text (as written in the file)
+        self.macros = macros
+        # path -> modification time (ns) of every file read to build the index
+        self.files = files
+
+    def get(self, name, default=None):
+        """ Returns the replacement text of macro name """
+        return self.macros.get(name, default)
+
+    def get_int(self, name, default=None):
+        """ Returns the value of macro name as an int (decimal or hexadecimal, with optional suffix) """
+        value = self.macros.get(name)
+        if value is None:
+            return default
+        try:
+            return int(INT_SUFFIX_RE.sub(r'\1', value).strip('() '), 0)
+        except ValueError:
+            return default
+
+    def get_str(self, name, default=None):
+        """ Returns the value of macro name as a string, adjacent string literals being concatenated """
+        value = self.macros.get(name)
+        if value is None:
+            return default
+        literals = STRING_RE.findall(value)
+        if not literals:
+            return default
+        return ''.join(literals)
+
+    def is_up_to_date(self):
+        """ Returns True if none of the files read to build the index changed """
+        for path, mtime in self.files.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def to_dict(self):
+        return {'path': self.path, 'macros': self.macros, 'files': self.files}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['path'], data['macros'], data['files'])
+# end of class ChipConfigIndex
+
+
+# #################################################################
+#  class ChipConfigParser
+#  One-pass tokenizer of the preprocessor directives of a header
+#  file, following its #include chain
+# #################################################################
+class ChipConfigParser:
+
+    def __init__(self, include_dirs=()):
+        self.include_dirs = list(include_dirs)
+        self.macros = {}
+        self.files = {}
+
+    def parse(self, path):
+        path = os.path.abspath(path)
+        self._parse_file(path)
+        return ChipConfigIndex(path, self.macros, self.files)
+
+    def _resolve_include(self, current_dir, quoted, angled):
+        name = quoted or angled
+        search_dirs = ([current_dir] if quoted else []) + self.include_dirs
+        for directory in search_dirs:
+            candidate = os.path.abspath(os.path.join(directory, name))
+            if os.path.isfile(candidate):
+                return candidate
+        # system or unknown header: not part of the configuration
+        return None
+
+    def _evaluate(self, expression):
+        """ Evaluates a #if expression, raises ValueError if it is not supported """
+        source = expression
+        expression = DEFINED_RE.sub(lambda m: '1' if (m.group(1) or m.group(2)) in self.macros else '0', expression)
+        for _ in range(8):
+            expanded = IDENTIFIER_RE.sub(lambda m: self.macros.get(m.group(0)) or '0', expression)
+            if expanded == expression:
+                break
+            expression = expanded
+        expression = INT_SUFFIX_RE.sub(r'\1', expression)
+        # octal literals are not valid Python: all the literals are written in decimal
+        expression = INT_RE.sub(lambda m: str(int(m.group(0), 16 if m.group(0)[1:2] in 'xX' else
+                                                  8 if m.group(0).startswith('0') else 10)), expression)
+        expression = expression.replace('&&', ' and ').replace('||', ' or ')
+        try:
+            expression = _translate_not(expression)
+            return bool(_IntExpressionEvaluator(expression).evaluate())
+        except SyntaxError as e:
+            raise ValueError(f"unsupported #if expression '{source}': {e.msg}") from None
+        except ValueError as e:
+            raise ValueError(f"unsupported #if expression '{source}': {e}") from None
+
+    def _evaluate_in(self, path, expression):
+        """ Evaluates a #if expression of path, an unsupported expression evaluating to false """
+        try:
+            return self._evaluate(expression)
+        except ValueError as e:
+            # the branch is skipped: the headers included by the configuration may use constructs
+            # (e.g. function-like macros) which the CHIP configuration macros do not depend on
+            sys.stderr.write(f"warning: {path}: {e}, the branch is skipped\n")
+            return False
+
+    def _logical_lines(self, path):
+        """ Yields the lines of path without comments, continuation lines being joined """
+        with open(path, 'r', errors='replace') as f:
+            text = strip_comments(f.read().replace('\\\n', ''))
+        return text.splitlines()
+
+    def _parse_file(self, path):
+        if path in self.files:
+            # already parsed (include guard or include cycle)
+            return
+        self.files[path] = os.stat(path).st_mtime_ns
+
+        current_dir = os.path.dirname(path)
+        # stack of (branch active, a branch was already taken, parent active)
+        conditions = []
+        active = True
+
+        for line in self._logical_lines(path):
+            match = DIRECTIVE_RE.match(line)
+            if not match:
+                continue
+            directive, argument = match.group(1), match.group(2).strip()
+
+            if directive in ('ifdef', 'ifndef', 'if'):
+                if directive == 'if':
+                    taken = active and self._evaluate_in(path, argument)
+                else:
+                    taken = active and ((argument.split()[0] in self.macros) == (directive == 'ifdef'))
+                conditions.append((taken, taken, active))
+                active = taken
+            elif directive == 'elif' and conditions:
+                _active, already_taken, parent = conditions[-1]
+                taken = parent and not already_taken and self._evaluate_in(path, argument)
+                conditions[-1] = (taken, already_taken or taken, parent)
+                active = taken
+            elif directive == 'else' and conditions:
+                _active, already_taken, parent = conditions[-1]
+                taken = parent and not already_taken
+                conditions[-1] = (taken, True, parent)
+                active = taken
+            elif directive == 'endif' and conditions:
+                active = conditions.pop()[2]
+            elif not active:
+                continue
+            elif directive == 'define':
+                define = DEFINE_RE.match(argument)
+                if define and not define.group(2):
+                    self.macros[define.group(1)] = define.group(3).strip()
+            elif directive == 'undef':
+                self.macros.pop(argument.split()[0], None)
+            elif directive == 'include':
+                include = INCLUDE_RE.match(argument)
+                if include:
+                    include_path = self._resolve_include(current_dir, include.group(1), include.group(2))
+                    if include_path is not None:
+                        self._parse_file(include_path)
+# end of class ChipConfigParser
+
+
+# #################################################################
+#  load_chip_config function
+#  Returns the ChipConfigIndex of the configuration file at path,
+#  from the in-memory cache, the on-disk cache (cache_file, None to
+#  disable it) or by parsing the file if no cached index is up to date
+# #################################################################
+def load_chip_config(path, include_dirs=(), cache_file=DEFAULT_CACHE_FILE):
+
+    path = os.path.abspath(path)
+    include_dirs = [os.path.abspath(directory) for directory in include_dirs]
+    key = '|'.join([path] + include_dirs)
+
+    index = _index_cache.get(key)
+    if index is not None and index.is_up_to_date():
+        return index
+
+    cache = {}
+    if cache_file is not None:
+        try:
+            with open(cache_file, 'r') as f:
+                cache = json.load(f)
+            if cache.get('version') != CACHE_VERSION:
+                cache = {}
+        except (OSError, ValueError):
+            cache = {}
+
+    entries = cache.setdefault('entries', {})
+    if key in entries:
+        index = ChipConfigIndex.from_dict(entries[key])
+        if index.is_up_to_date():
+            _index_cache[key] = index
+            return index
+
+    index = ChipConfigParser(include_dirs).parse(path)
+    _index_cache[key] = index
+
+    if cache_file is not None:
+        entries[key] = index.to_dict()
+        cache['version'] = CACHE_VERSION
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            temp_file = cache_file + '.tmp'
+            with open(temp_file, 'w') as f:
+                json.dump(cache, f)
+            os.replace(temp_file, cache_file)
+        except OSError:
+            # the cache is only an optimization
+            pass
+
+    return index
+# end of function load_chip_config
+
+
+# #################################################################
+#  main function
+# #################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Show the macros defined by a CHIP configuration file')
+    parser.add_argument('-I', '--include-dir', action='append', default=[],
+                        help='directory searched for included files (may be repeated)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not use the on-disk cache')
+    parser.add_argument('chip_config', help='path to CHIPProjectConfig.h')
+    parser.add_argument('names', nargs='*', help='macros to show (default: all)')
+    args = parser.parse_args()
+
+    index = load_chip_config(args.chip_config, args.include_dir, None if args.no_cache else DEFAULT_CACHE_FILE)
+
+    for name in args.names or sorted(index.macros):
+        print(f"{name} = {index.get(name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,15 +26,44 @@ Usage examples:
 Creating OTA image file:
 ./ST_ota_image_tool.py --cc CHIPProjectConfig.h my-firmware.bin my-firmware.ota
 
+Creating OTA image file directly from the M4 and M0 binaries (the Matter binary
+assembled by CreateMatterBin.py is only written if --matter-bin is given):
+./ST_ota_image_tool.py --cc CHIPProjectConfig.h -m4 myapp-SBSFU.sfb -m0 M0.bin my-firmware.ota
+
+Creating all OTA image files described in a JSON or CSV manifest:
+./ST_ota_image_tool.py --cc CHIPProjectConfig.h --batch manifest.json
+
 """
 
-import re
 import argparse
+import copy
+import csv
+import hashlib
+import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 # === import chiptool libraries ===
 from ota_image_tool import validate_header_attributes as OTA_validate_header_attributes
 from ota_image_tool import generate_image as OTA_generate_image
+from ota_image_tool import generate_payload_summary as OTA_generate_payload_summary
+from ota_image_tool import generate_header_tlv as OTA_generate_header_tlv
+from ota_image_tool import generate_header as OTA_generate_header
+from ota_image_tool import write_image as OTA_write_image
+from ota_image_tool import write_image_single_pass as OTA_write_image_single_pass
+from ota_image_tool import progress_chunks as OTA_progress_chunks
+from ota_image_tool import DIGEST_ALL_ALGORITHMS as OTA_DIGEST_ALL_ALGORITHMS
+
+# === import custom libraries ===
+from CreateMatterBin import make_header as CMB_make_header
+from CreateMatterBin import matter_bin_chunks as CMB_matter_bin_chunks
+from ST_chip_config import load_chip_config
+
+# header attributes which can be set for each image of a batch manifest
+BATCH_HEADER_ATTRIBUTES = ('vendor_id', 'product_id', 'version', 'version_str', 'digest_algorithm',
+                           'min_version', 'max_version', 'release_notes')
+BATCH_INT_ATTRIBUTES = ('vendor_id', 'product_id', 'version', 'min_version', 'max_version')
 
 # #################################################################
 #  class HeaderAttributes
@@ -75,39 +104,25 @@ class HeaderAttributes:
 # #################################################################
 #  extract_data_from_chip_config function
 #  This function extract data from the CHIP configuration file
-#  (CHIPProjectConfig.h)       
+#  (CHIPProjectConfig.h) and the files it includes, using the cached
+#  macro index of ST_chip_config.py
 #  Returns: VENDOR_ID, PRODUCT_ID, SW_VERSION, SW_VERSION_STRING
 # #################################################################
-def extract_data_from_chip_config(file_chip_config):
+def extract_data_from_chip_config(file_chip_config, include_dirs=()):
 
-    chip_config_file = None
     val_vendor_id = None
     val_product_id = None
     val_sw_version = None
     val_sw_version_string = None
 
     try:
-        with open(file_chip_config, 'r') as f:
-            chip_config_file = f.read()            
-            f.close()
-
-            # split the content in a list of lines
-            lines = chip_config_file.splitlines()
-
-            # Extract infos
-            for line in lines:
-                if line.startswith('#define CHIP_DEVICE_CONFIG_DEVICE_VENDOR_ID'):
-                    val_vendor_id = re.search(r'(\S+)$', line).group(1)
+        chip_config = load_chip_config(file_chip_config, include_dirs)
 
-                elif line.startswith('#define CHIP_DEVICE_CONFIG_DEVICE_PRODUCT_ID'):
-                    val_product_id = re.search(r'(\S+)$', line).group(1)
-
-                elif line.startswith('#define CHIP_DEVICE_CONFIG_DEVICE_SOFTWARE_VERSION '):
-                    # note: keep the space after the word VERSION in order to distinguish this case from VERSION_STRING
-                    val_sw_version = re.search(r'(\S+)$', line).group(1)
-
-                elif line.startswith('#define CHIP_DEVICE_CONFIG_DEVICE_SOFTWARE_VERSION_STRING'):
-                    val_sw_version_string = re.search(r'"(.+)"$', line).group(1)     
+        # Extract infos
+        val_vendor_id = chip_config.get('CHIP_DEVICE_CONFIG_DEVICE_VENDOR_ID')
+        val_product_id = chip_config.get('CHIP_DEVICE_CONFIG_DEVICE_PRODUCT_ID')
+        val_sw_version = chip_config.get('CHIP_DEVICE_CONFIG_DEVICE_SOFTWARE_VERSION')
+        val_sw_version_string = chip_config.get_str('CHIP_DEVICE_CONFIG_DEVICE_SOFTWARE_VERSION_STRING')
 
     except:
         print("Error opening CHIPProjectConfig.h")
@@ -116,10 +131,227 @@ def extract_data_from_chip_config(file_chip_config):
 #end of function extract_data_from_chip_config
 
 
+# #################################################################
+#  read_digest_file function
+#  This function reads the digest of input_file from a digest file
+#  in sha256sum format, as written by CreateMatterBin.py -da
+#  The digest algorithm is given by the suffix of the digest file
+#  (<input file>.<digest algorithm>) and must be digest_algorithm
+#  Returns: digest (bytes)
+# #################################################################
+def read_digest_file(digest_file, input_file, digest_algorithm):
+
+    file_algorithm = os.path.splitext(digest_file)[1][1:].lower()
+    if file_algorithm != digest_algorithm.lower():
+        sys.stderr.write(f'error: {digest_file} is not a {digest_algorithm} digest file '
+                         f'(expected <input file>.{digest_algorithm}), use -da to set the digest algorithm\n')
+        sys.exit(1)
+
+    with open(digest_file, 'r') as f:
+        hex_digest, file_name = f.readline().split(None, 1)
+
+    if file_name.strip().lstrip('*') != os.path.basename(input_file):
+        sys.stderr.write(f'error: {digest_file} is not the digest of {input_file}\n')
+        sys.exit(1)
+
+    if os.path.getmtime(digest_file) < os.path.getmtime(input_file):
+        sys.stderr.write(f'error: {digest_file} is older than {input_file}\n')
+        sys.exit(1)
+
+    digest = bytes.fromhex(hex_digest)
+    if len(digest) != hashlib.new(digest_algorithm).digest_size:
+        sys.stderr.write(f'error: {digest_file} is not a {digest_algorithm} digest\n')
+        sys.exit(1)
+
+    return digest
+#end of function read_digest_file
+
+
+# #################################################################
+#  hex_int function
+#  Returns: value converted to int, strings being parsed as hexadecimal
+#           (as in CHIPProjectConfig.h), None if value is None
+# #################################################################
+def hex_int(value):
+    if value is None or isinstance(value, int):
+        return value
+    return int(value, 16)
+#end of function hex_int
+
+
+# #################################################################
+#  read_batch_manifest function
+#  This function reads a JSON or CSV manifest describing a set of
+#  OTA images. Each entry gives input_file (or input_files, separated
+#  by ';' in CSV), output_file and any of BATCH_HEADER_ATTRIBUTES.
+#  Missing attributes are taken from defaults (HeaderAttributes).
+#  Relative paths are relative to the manifest directory.
+#  Returns: list of HeaderAttributes objects
+# #################################################################
+def read_batch_manifest(manifest_file, defaults):
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+
+    with open(manifest_file, 'r', newline='') as f:
+        if manifest_file.lower().endswith('.csv'):
+            entries = list(csv.DictReader(f))
+        else:
+            entries = json.load(f)
+            if isinstance(entries, dict):
+                entries = entries['images']
+
+    images = []
+    for index, entry in enumerate(entries):
+        input_files = entry.get('input_files') or entry.get('input_file')
+        output_file = entry.get('output_file')
+        if not input_files or not output_file:
+            sys.stderr.write(f'error: manifest entry {index} is missing input_file or output_file\n')
+            sys.exit(1)
+        if isinstance(input_files, str):
+            input_files = input_files.split(';')
+
+        ota_args = HeaderAttributes(
+            [os.path.join(manifest_dir, path.strip()) for path in input_files],
+            os.path.join(manifest_dir, output_file.strip()),
+            defaults.vendor_id,
+            defaults.product_id,
+            defaults.version,
+            defaults.version_str,
+            defaults.digest_algorithm,
+            defaults.min_version,
+            defaults.max_version,
+            defaults.release_notes)
+
+        for attribute in BATCH_HEADER_ATTRIBUTES:
+            value = entry.get(attribute)
+            if value is None or value == '':
+                continue
+            if attribute in BATCH_INT_ATTRIBUTES and isinstance(value, str):
+                value = int(value, 0)
+            setattr(ota_args, attribute, value)
+
+        if ota_args.digest_algorithm not in OTA_DIGEST_ALL_ALGORITHMS:
+            sys.stderr.write(f'error: manifest entry {index} ({output_file}) has an unsupported digest_algorithm '
+                             f'{ota_args.digest_algorithm}\n')
+            sys.exit(1)
+
+        if (ota_args.vendor_id is None) or (ota_args.product_id is None) or (ota_args.version is None) or \
+           (ota_args.version_str is None):
+            sys.stderr.write(f'error: manifest entry {index} ({output_file}) has incomplete header attributes\n')
+            sys.exit(1)
+
+        images.append(ota_args)
+
+    return images
+#end of function read_batch_manifest
+
+
+# #################################################################
+#  hash_payload function
+#  Worker function of build_batch hashing one distinct payload
+#  Returns: payload size, payload digest
+# #################################################################
+def hash_payload(input_files, digest_algorithm):
+    return OTA_generate_payload_summary(
+        HeaderAttributes(input_files, None, None, None, None, None, digest_algorithm))
+#end of function hash_payload
+
+
+# #################################################################
+#  write_batch_image function
+#  Worker function of build_batch writing one OTA image whose
+#  payload has already been hashed
+#  Returns: path to the OTA image
+# #################################################################
+def write_batch_image(ota_args, payload_size, payload_digest):
+    header_tlv = OTA_generate_header_tlv(ota_args, payload_size, payload_digest)
+    OTA_write_image(ota_args, OTA_generate_header(header_tlv, payload_size))
+    return ota_args.output_file
+#end of function write_batch_image
+
+
+# #################################################################
+#  build_batch function
+#  Build all OTA images described in a manifest: each distinct
+#  payload (input files + digest algorithm) is hashed once, then all
+#  images are written in parallel across a process pool.
+#  Returns: list of paths to the OTA images
+# #################################################################
+def build_batch(manifest_file, defaults, jobs=None):
+
+    images = read_batch_manifest(manifest_file, defaults)
+
+    for ota_args in images:
+        OTA_validate_header_attributes(ota_args)
+    print(f"OTA: validate_header_attributes done for {len(images)} images.")
+
+    payload_keys = [(tuple(ota_args.input_files), ota_args.digest_algorithm) for ota_args in images]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        hash_futures = {key: executor.submit(hash_payload, list(key[0]), key[1])
+                        for key in dict.fromkeys(payload_keys)}
+        payload_summaries = {key: future.result() for key, future in hash_futures.items()}
+        print(f"OTA: {len(payload_summaries)} distinct payloads hashed.")
+
+        image_futures = [executor.submit(write_batch_image, ota_args, *payload_summaries[key])
+                         for ota_args, key in zip(images, payload_keys)]
+        output_files = [future.result() for future in image_futures]
+
+    for output_file in output_files:
+        print(f"OTA: {output_file} done.")
+
+    return output_files
+#end of function build_batch
+
+
+# #################################################################
+#  tee_chunks function
+#  Yield chunks, writing each of them to out_file as well
+# #################################################################
+def tee_chunks(chunks, out_file):
+    for chunk in chunks:
+        out_file.write(chunk)
+        yield chunk
+#end of function tee_chunks
+
+
+# #################################################################
+#  generate_matter_image function
+#  Generate the OTA image ota_file, with the header attributes of
+#  ota_args, whose payload is the Matter binary assembled from the M4
+#  and M0 (optional) binaries as done by CreateMatterBin.py. The
+#  Matter binary is streamed through the hasher to the OTA image in a
+#  single pass, and is also written to matter_bin only if it is
+#  specified.
+#  progress (optional) is called with the processed and total sizes
+#  (see ota_image_tool.progress_chunks)
+# #################################################################
+def generate_matter_image(ota_args, ota_file, file_path_M4, file_path_M0=None, matter_bin=None, progress=None):
+
+    image_args = copy.copy(ota_args)
+    image_args.output_file = ota_file
+
+    M4BinarySize = os.path.getsize(file_path_M4)
+    M0BinarySize = os.path.getsize(file_path_M0) if file_path_M0 else 0
+    Header = CMB_make_header(M4BinarySize, M0BinarySize)
+    payload_size = len(Header) + M4BinarySize + M0BinarySize
+
+    chunks = CMB_matter_bin_chunks(Header, file_path_M4, file_path_M0)
+    if progress is not None:
+        chunks = OTA_progress_chunks(chunks, payload_size, progress)
+
+    if matter_bin:
+        with open(matter_bin, 'wb') as f:
+            OTA_write_image_single_pass(image_args, payload_size, tee_chunks(chunks, f))
+    else:
+        OTA_write_image_single_pass(image_args, payload_size, chunks)
+#end of function generate_matter_image
+
+
 # #################################################################
 #  parse_input_args function
 #  This function parse input arguments
-#  Returns: HeaderAttributes object
+#  Returns: HeaderAttributes object, parsed arguments
 # #################################################################
 def parse_input_args():
 
@@ -132,6 +364,8 @@ def parse_input_args():
     #            SW version string.
     parser.add_argument('-cc', '--chip-config', type=str,
                                help='path to CHIPProjectConfig.h')
+    parser.add_argument('-ci', '--chip-config-include', action='append', default=[],
+                               help='directory searched for the files included by CHIPProjectConfig.h (may be repeated)')
     
     # parameters: used to specify explicitly some parameters 
     # Will override value extracted from CHIPProjectConfig.h if specified
@@ -146,9 +380,31 @@ def parse_input_args():
     parser.add_argument('-da', '--digest-algorithm',
                                help='Digest algorithm')    
 
-    # parameters
-    parser.add_argument('input_file', help='Path to input image payload file')
-    parser.add_argument('output_file', help='Path to output image file')
+    # parameter: digest of the input file computed by CreateMatterBin.py -da, so that
+    #            the input file does not need to be hashed again
+    parser.add_argument('-df', '--digest-file', type=str,
+                               help='path to the digest file of the input file (<input file>.<digest algorithm>)')
+
+    # parameters: M4 and M0 binaries to assemble into the payload, as done by
+    #             CreateMatterBin.py. In that case the only positional parameter is
+    #             the output image file.
+    parser.add_argument('-m4', type=str,
+                               help='full path to M4 bin file')
+    parser.add_argument('-m0', type=str,
+                               help='full path to M0 bin file')
+    parser.add_argument('-bo', '--matter-bin', type=str,
+                               help='path to write the assembled Matter bin file to (not written by default)')
+
+    # parameters: batch mode, the header attributes above are used as default values
+    # for the images of the manifest
+    parser.add_argument('-b', '--batch', type=str,
+                               help='path to a JSON or CSV manifest of OTA images to build')
+    parser.add_argument('-j', '--jobs', type=int,
+                               help='number of worker processes in batch mode (default: number of CPUs)')
+
+    # parameters (not used in batch mode)
+    parser.add_argument('input_file', nargs='?', help='Path to input image payload file')
+    parser.add_argument('output_file', nargs='?', help='Path to output image file')
 
     # default values
     vendor_id = product_id = sw_version = sw_version_string = None
@@ -162,9 +418,18 @@ def parse_input_args():
 
     print(args)
 
+    input_files = [args.input_file]
+    output_file = args.output_file
+    if args.m4 is not None:
+        # the payload is assembled from the M4/M0 binaries: the only positional
+        # parameter is the output image file
+        input_files = []
+        if output_file is None:
+            output_file = args.input_file
+
     # extract data from CHIP config file if specified
     if args.chip_config is not None:
-        vendor_id, product_id, sw_version, sw_version_string = extract_data_from_chip_config(args.chip_config)
+        vendor_id, product_id, sw_version, sw_version_string = extract_data_from_chip_config(args.chip_config, args.chip_config_include)
 
     if args.vendor_id is not None:
         vendor_id = args.vendor_id
@@ -182,16 +447,18 @@ def parse_input_args():
         digest_algorithm = args.digest_algorithm    
 
     # checkings    
-    if (vendor_id is None) or (product_id is None) or (sw_version is None):
+    if args.batch is None and \
+       ((vendor_id is None) or (product_id is None) or (sw_version is None) or
+        (args.input_file is None and args.m4 is None) or (output_file is None)):
         sys.stderr.write('error: invalid arguments\n')
         sys.exit(1)
 
     build_ota_args = HeaderAttributes(
-        [args.input_file], 
-        args.output_file,
-        int(vendor_id, 16),
-        int(product_id, 16),
-        int(sw_version),
+        input_files, 
+        output_file,
+        hex_int(vendor_id),
+        hex_int(product_id),
+        int(sw_version) if sw_version is not None else None,
         sw_version_string,
         digest_algorithm,
         min_version,
@@ -200,7 +467,7 @@ def parse_input_args():
 
     build_ota_args.print()
 
-    return build_ota_args
+    return build_ota_args, args
 # end of function parse_input_args  
 
 # #################################################################
@@ -209,15 +476,28 @@ def parse_input_args():
 if __name__ == "__main__":
     """ Main starts here """
 
-    ota_args = parse_input_args()
+    ota_args, args = parse_input_args()
 
     print("-=-=-=-=-=-=-=-=-=-=-")
 
-    # call CHIPTOOL functions
-    OTA_validate_header_attributes(ota_args)    
-    print("OTA: validate_header_attributes done.")
-
-    OTA_generate_image(ota_args)                  
-    print("OTA: generate_image done.")   
+    if args.batch is not None:
+        build_batch(args.batch, ota_args, args.jobs)
+    elif args.m4 is not None:
+        OTA_validate_header_attributes(ota_args)    
+        print("OTA: validate_header_attributes done.")
+
+        generate_matter_image(ota_args, ota_args.output_file, args.m4, args.m0, args.matter_bin)
+        print("OTA: generate_matter_image done.")   
+    else:
+        # call CHIPTOOL functions
+        OTA_validate_header_attributes(ota_args)    
+        print("OTA: validate_header_attributes done.")
+
+        payload_digest = None
+        if args.digest_file is not None:
+            payload_digest = read_digest_file(args.digest_file, args.input_file, ota_args.digest_algorithm)
+
+        OTA_generate_image(ota_args, payload_digest)                  
+        print("OTA: generate_image done.")   
 
     print("-=-=-=-=-=-=-=-=-=-=-")
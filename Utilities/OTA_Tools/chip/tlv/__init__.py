@@ -28,8 +28,10 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
+import array
 import struct
-from collections import OrderedDict
+from collections import namedtuple
+from itertools import groupby
 from collections.abc import Mapping, Sequence
 from enum import Enum
 
@@ -101,6 +103,19 @@ ElementTypes = {
     0x18: "End of Collection",
 }
 
+# Precompiled little-endian formats used by the reader
+_UINT8 = struct.Struct("<B")
+_UINT16 = struct.Struct("<H")
+_UINT32 = struct.Struct("<L")
+_UINT64 = struct.Struct("<Q")
+_INT8 = struct.Struct("<b")
+_INT16 = struct.Struct("<h")
+_INT32 = struct.Struct("<l")
+_INT64 = struct.Struct("<q")
+_FLOAT32 = struct.Struct("<f")
+_FLOAT64 = struct.Struct("<d")
+_VENDOR_PROFILE = struct.Struct("<HH")
+
 TagControls = {
     0x00: "Anonymous",
     0x20: "Context 1-byte",
@@ -113,10 +128,111 @@ TagControls = {
 }
 
 
+# Encoded control byte and tag of the writer, keyed by element type, tag, value length, enclosing
+# container type and implicit profile. The number of entries is bounded as tags can be arbitrary.
+_CONTROL_AND_TAG_CACHE_SIZE = 4096
+_controlAndTagCache = {}
+
+# Tag field decoders of the reader, indexed by tag control: (kind, tag number format)
+_TAG_ANONYMOUS = 0
+_TAG_CONTEXT = 1
+_TAG_COMMON_PROFILE = 2
+_TAG_IMPLICIT_PROFILE = 3
+_TAG_FULLY_QUALIFIED = 4
+
+# Size of the tag field following the control byte, indexed by tag control
+_TAG_FIELD_SIZES = {
+    TLV_TAG_CONTROL_ANONYMOUS: 0,
+    TLV_TAG_CONTROL_CONTEXT_SPECIFIC: 1,
+    TLV_TAG_CONTROL_COMMON_PROFILE_2Bytes: 2,
+    TLV_TAG_CONTROL_COMMON_PROFILE_4Bytes: 4,
+    TLV_TAG_CONTROL_IMPLICIT_PROFILE_2Bytes: 2,
+    TLV_TAG_CONTROL_IMPLICIT_PROFILE_4Bytes: 4,
+    TLV_TAG_CONTROL_FULLY_QUALIFIED_6Bytes: 6,
+    TLV_TAG_CONTROL_FULLY_QUALIFIED_8Bytes: 8,
+}
+
+_TAG_DECODERS = {
+    TLV_TAG_CONTROL_ANONYMOUS: (_TAG_ANONYMOUS, None),
+    TLV_TAG_CONTROL_CONTEXT_SPECIFIC: (_TAG_CONTEXT, _UINT8),
+    TLV_TAG_CONTROL_COMMON_PROFILE_2Bytes: (_TAG_COMMON_PROFILE, _UINT16),
+    TLV_TAG_CONTROL_COMMON_PROFILE_4Bytes: (_TAG_COMMON_PROFILE, _UINT32),
+    TLV_TAG_CONTROL_IMPLICIT_PROFILE_2Bytes: (_TAG_IMPLICIT_PROFILE, _UINT16),
+    TLV_TAG_CONTROL_IMPLICIT_PROFILE_4Bytes: (_TAG_IMPLICIT_PROFILE, _UINT32),
+    TLV_TAG_CONTROL_FULLY_QUALIFIED_6Bytes: (_TAG_FULLY_QUALIFIED, _UINT16),
+    TLV_TAG_CONTROL_FULLY_QUALIFIED_8Bytes: (_TAG_FULLY_QUALIFIED, _UINT32),
+}
+
+# Value decoders of the reader, indexed by element type: (kind, value or length format, or constant value)
+_VALUE_FIXED = 0
+_VALUE_UINT = 1
+_VALUE_FLOAT32 = 2
+_VALUE_CONSTANT = 3
+_VALUE_UTF8_STRING = 4
+_VALUE_BYTE_STRING = 5
+_VALUE_STRUCTURE = 6
+_VALUE_ARRAY = 7
+_VALUE_END_OF_CONTAINER = 8
+
+_VALUE_DECODERS = (
+    (_VALUE_FIXED, _INT8),
+    (_VALUE_FIXED, _INT16),
+    (_VALUE_FIXED, _INT32),
+    (_VALUE_FIXED, _INT64),
+    (_VALUE_UINT, _UINT8),
+    (_VALUE_UINT, _UINT16),
+    (_VALUE_UINT, _UINT32),
+    (_VALUE_UINT, _UINT64),
+    (_VALUE_CONSTANT, False),
+    (_VALUE_CONSTANT, True),
+    (_VALUE_FLOAT32, _FLOAT32),
+    (_VALUE_FIXED, _FLOAT64),
+    (_VALUE_UTF8_STRING, _UINT8),
+    (_VALUE_UTF8_STRING, _UINT16),
+    (_VALUE_UTF8_STRING, _UINT32),
+    (_VALUE_UTF8_STRING, _UINT64),
+    (_VALUE_BYTE_STRING, _UINT8),
+    (_VALUE_BYTE_STRING, _UINT16),
+    (_VALUE_BYTE_STRING, _UINT32),
+    (_VALUE_BYTE_STRING, _UINT64),
+    (_VALUE_CONSTANT, None),
+    (_VALUE_STRUCTURE, None),
+    (_VALUE_ARRAY, None),
+    (_VALUE_ARRAY, None),
+    (_VALUE_END_OF_CONTAINER, None),
+)
+
+
+def _elementSkip(controlByte):
+    """Returns how TLVScanner skips an element with the given control byte: (size of the control byte,
+    tag and fixed-size value, format of the string length or None, change of the container depth),
+    or None if the element type is not supported"""
+    elementType = controlByte & 0x1F
+    if elementType > TLVEndOfContainer:
+        return None
+    valueKind, valueStruct = _VALUE_DECODERS[elementType]
+    size = 1 + _TAG_FIELD_SIZES[controlByte & 0xE0]
+    if valueKind in (_VALUE_FIXED, _VALUE_UINT, _VALUE_FLOAT32):
+        return (size + valueStruct.size, None, 0)
+    if valueKind in (_VALUE_UTF8_STRING, _VALUE_BYTE_STRING):
+        return (size, valueStruct, 0)
+    if valueKind in (_VALUE_STRUCTURE, _VALUE_ARRAY):
+        return (size, None, 1)
+    if valueKind == _VALUE_END_OF_CONTAINER:
+        return (size, None, -1)
+    return (size, None, 0)
+
+
+# Skip descriptions of the scanner, indexed by control byte
+_ELEMENT_SKIPS = tuple(_elementSkip(controlByte) for controlByte in range(256))
+
+
 class uint(int):
     '''
     NewType will not return a class until Python 3.10, as Python 3.10 is not widely used, we still need to construct a class so it can work as a type.
     '''
+    # no per-instance __dict__: decoded values are as compact as plain ints
+    __slots__ = ()
 
     def __init__(self, val: int):
         if (val < 0):
@@ -132,13 +248,89 @@ class float32(float):
         It is backed by an ordinary float, which means there will be precision loss at the time
         the value is converted to TLV.
     '''
-    pass
+    # no per-instance __dict__: decoded values are as compact as plain floats
+    __slots__ = ()
+
+
+# Record classes of the compact decoding, keyed by tuple of member tags. The number of
+# entries is bounded as the tags of the decoded structures can be arbitrary.
+_RECORD_CLASS_CACHE_SIZE = 4096
+_recordClasses = {}
+
+
+class TLVRecord(tuple):
+    '''A structure decoded by TLVReader.get(compact=True): the tuple of the values of its
+    members, in encoding order. The tags of the members are held by the class, which is
+    shared by all the records with the same tags, so a record takes the memory of a tuple.
+
+    Members are accessed by position or by tag with get(); asdict() returns the dictionary
+    representation built by TLVReader.get().
+    '''
+    __slots__ = ()
+    _tags = ()
+    _positions = {}
+
+    @property
+    def tags(self):
+        """The tags of the members, "Any" for anonymous members"""
+        return self._tags
+
+    def get(self, tag, default=None):
+        """Returns the value of the member with the given tag, or default"""
+        position = self._positions.get(tag)
+        return default if position is None else self[position]
+
+    def items(self):
+        """Returns the (tag, value) pairs of the members"""
+        return zip(self._tags, self)
+
+    def asdict(self):
+        """Returns the dictionary representation of the record, nested records being
+        converted to dictionaries and arrays to lists"""
+        return {tag: _compactToPlain(value) for tag, value in zip(self._tags, self)}
+
+    def __repr__(self):
+        return "TLVRecord(%r)" % dict(zip(self._tags, self))
+
+    def __reduce__(self):
+        return (makeRecord, (self._tags, tuple(self)))
+
+
+def makeRecord(tags, values):
+    """Returns the TLVRecord of the given member tags and values"""
+    tags = tuple(tags)
+    recordClass = _recordClasses.get(tags)
+    if recordClass is None:
+        recordClass = type("TLVRecord", (TLVRecord,), {
+            "__slots__": (),
+            "_tags": tags,
+            "_positions": {tag: position for position, tag in enumerate(tags)},
+        })
+        if len(_recordClasses) < _RECORD_CLASS_CACHE_SIZE:
+            _recordClasses[tags] = recordClass
+    return recordClass(values)
+
+
+def _compactToPlain(value):
+    """Convert a value of the compact decoding to the representation of TLVReader.get()"""
+    if isinstance(value, TLVRecord):
+        return value.asdict()
+    if value.__class__ is tuple:
+        return [_compactToPlain(element) for element in value]
+    return value
 
 
 class TLVWriter(object):
-    def __init__(self, encoding=None, implicitProfile=None):
+    def __init__(self, encoding=None, implicitProfile=None, sortDicts=True):
+        """encoding is the object into which encoded TLV data is written (see the encoding property).
+
+        If sortDicts is False, the elements of plain dicts are encoded in their iteration order
+        instead of being sorted by tag: this saves the sort when the caller builds its dicts
+        with keys already in tag order.
+        """
         self._encoding = encoding if encoding is not None else bytearray()
         self._implicitProfile = implicitProfile
+        self._sortDicts = sortDicts
         self._containerStack = []
 
     @property
@@ -183,7 +375,8 @@ class TLVWriter(object):
           map object are expected to be tag values, as described below for the tag argument.
           Map values are encoded recursively, using the same rules as defined for the val
           argument. The encoding order of elements depends on the type of the map object.
-          Elements within a dict are automatically encoded tag numerical order. Elements
+          Elements within a dict are automatically encoded tag numerical order (unless the
+          writer was created with sortDicts=False). Elements
           within other forms of mapping object (e.g. OrderedDict) are encoded in the
           object's natural iteration order.
         - Sequence-like objects (e.g. arrays) are written as TLV arrays. Elements within
@@ -196,7 +389,10 @@ class TLVWriter(object):
           the first integer encoded as the profile id and the second as the tag number.
         If tag is None, it is encoded as a TLV anonymous tag.
         """
-        if val is None:
+        putValue = _putByType.get(val.__class__)
+        if putValue is not None:
+            putValue(self, tag, val)
+        elif val is None:
             self.putNull(tag)
         elif isinstance(val, Enum):
             self.putUnsignedInt(tag, val)
@@ -215,22 +411,72 @@ class TLVWriter(object):
         elif isinstance(val, bytes) or isinstance(val, bytearray):
             self.putBytes(tag, val)
         elif isinstance(val, Mapping):
-            self.startStructure(tag)
-            if type(val) == dict:
-                val = OrderedDict(
-                    sorted(val.items(),
-                           key=lambda item: tlvTagToSortKey(item[0]))
-                )
-            for containedTag, containedVal in val.items():
-                self.put(containedTag, containedVal)
-            self.endContainer()
+            self._putMapping(tag, val)
         elif isinstance(val, Sequence):
-            self.startArray(tag)
+            self._putSequence(tag, val)
+        elif hasattr(val, "dtype") and hasattr(val, "tolist"):
+            # NumPy arrays and scalars, encoded as the equivalent Python objects
+            self.put(tag, val.tolist())
+        else:
+            raise ValueError("Attempt to TLV encode unsupported value")
+
+    def _putMapping(self, tag, val):
+        self.startStructure(tag)
+        items = val.items()
+        if type(val) == dict and self._sortDicts:
+            items = sorted(items, key=lambda item: tlvTagToSortKey(item[0]))
+        for containedTag, containedVal in items:
+            self.put(containedTag, containedVal)
+        self.endContainer()
+
+    def _putSequence(self, tag, val):
+        self.startArray(tag)
+        if len(val) < _BULK_ARRAY_MIN_LENGTH or not self._putHomogeneousArray(val):
             for containedVal in val:
                 self.put(None, containedVal)
-            self.endContainer()
+        self.endContainer()
+
+    def _putHomogeneousArray(self, val):
+        """Write the elements of an array whose elements are all ints, uints, floats or float32s (or of an
+        array.array of numbers) in bulk, with the same encoding as put() would give them one by one.
+
+        Returns False if the array is not homogeneous."""
+        if isinstance(val, array.array):
+            if val.typecode in "fd":
+                elementType = float
+            elif val.typecode in "bBhHiIlLqQ":
+                elementType = int
+            else:
+                return False
         else:
-            raise ValueError("Attempt to TLV encode unsupported value")
+            elementTypes = set(map(type, val))
+            if len(elementTypes) != 1:
+                return False
+            elementType = elementTypes.pop()
+
+        if elementType is float:
+            self._encoding.extend(_packArrayRun(TLV_TYPE_FLOATING_POINT_NUMBER | 1, "d", val))
+        elif elementType is float32:
+            self._encoding.extend(_packArrayRun(TLV_TYPE_FLOATING_POINT_NUMBER, "f", val))
+        elif elementType is int or elementType is uint:
+            if elementType is int:
+                baseType, widths, widthOf = TLV_TYPE_SIGNED_INTEGER, _SIGNED_WIDTHS, _signedWidth
+            else:
+                baseType, widths, widthOf = TLV_TYPE_UNSIGNED_INTEGER, _UNSIGNED_WIDTHS, _unsignedWidth
+            low = min(val)
+            high = max(val)
+            lowWidth = widthOf(low)
+            # the width is monotonic on each side of 0: all the elements have the same width if
+            # the lowest and highest ones do and have the same sign (or fit in one byte)
+            if lowWidth == widthOf(high) and (low >= 0 or high < 0 or lowWidth == 0):
+                runs = [(lowWidth, val)]
+            else:
+                runs = [(width, list(run)) for width, run in groupby(val, widthOf)]
+            for width, run in runs:
+                self._encoding.extend(_packArrayRun(baseType | width, widths[width], run))
+        else:
+            return False
+        return True
 
     def putSignedInt(self, tag, val):
         """Write a value as a TLV signed integer with the specified TLV tag."""
@@ -248,8 +494,7 @@ class TLVWriter(object):
         controlAndTag = self._encodeControlAndTag(
             TLV_TYPE_SIGNED_INTEGER, tag, lenOfLenOrVal=len(val)
         )
-        self._encoding.extend(controlAndTag)
-        self._encoding.extend(val)
+        self._encoding.extend(controlAndTag + val)
 
     def putUnsignedInt(self, tag, val):
         """Write a value as a TLV unsigned integer with the specified TLV tag."""
@@ -257,8 +502,7 @@ class TLVWriter(object):
         controlAndTag = self._encodeControlAndTag(
             TLV_TYPE_UNSIGNED_INTEGER, tag, lenOfLenOrVal=len(val)
         )
-        self._encoding.extend(controlAndTag)
-        self._encoding.extend(val)
+        self._encoding.extend(controlAndTag + val)
 
     def putFloat(self, tag, val):
         """Write a value as a TLV float with the specified TLV tag."""
@@ -266,8 +510,7 @@ class TLVWriter(object):
         controlAndTag = self._encodeControlAndTag(
             TLV_TYPE_FLOATING_POINT_NUMBER, tag, lenOfLenOrVal=len(val)
         )
-        self._encoding.extend(controlAndTag)
-        self._encoding.extend(val)
+        self._encoding.extend(controlAndTag + val)
 
     def putDouble(self, tag, val):
         """Write a value as a TLV double with the specified TLV tag."""
@@ -275,8 +518,7 @@ class TLVWriter(object):
         controlAndTag = self._encodeControlAndTag(
             TLV_TYPE_FLOATING_POINT_NUMBER, tag, lenOfLenOrVal=len(val)
         )
-        self._encoding.extend(controlAndTag)
-        self._encoding.extend(val)
+        self._encoding.extend(controlAndTag + val)
 
     def putString(self, tag, val):
         """Write a value as a TLV string with the specified TLV tag."""
@@ -285,8 +527,7 @@ class TLVWriter(object):
         controlAndTag = self._encodeControlAndTag(
             TLV_TYPE_UTF8_STRING, tag, lenOfLenOrVal=len(valLen)
         )
-        self._encoding.extend(controlAndTag)
-        self._encoding.extend(valLen)
+        self._encoding.extend(controlAndTag + valLen)
         self._encoding.extend(val)
 
     def putBytes(self, tag, val):
@@ -295,8 +536,7 @@ class TLVWriter(object):
         controlAndTag = self._encodeControlAndTag(
             TLV_TYPE_BYTE_STRING, tag, lenOfLenOrVal=len(valLen)
         )
-        self._encoding.extend(controlAndTag)
-        self._encoding.extend(valLen)
+        self._encoding.extend(controlAndTag + valLen)
         self._encoding.extend(val)
 
     def putBool(self, tag, val):
@@ -322,7 +562,7 @@ class TLVWriter(object):
         self._verifyValidContainerType(containerType)
         controlAndTag = self._encodeControlAndTag(containerType, tag)
         self._encoding.extend(controlAndTag)
-        self._containerStack.insert(0, containerType)
+        self._containerStack.append(containerType)
 
     def startStructure(self, tag):
         """Start writing a TLV structure with the specified TLV tag."""
@@ -338,11 +578,26 @@ class TLVWriter(object):
 
     def endContainer(self):
         """End writing the current TLV container."""
-        self._containerStack.pop(0)
+        self._containerStack.pop()
         controlAndTag = self._encodeControlAndTag(TLVEndOfContainer, None)
         self._encoding.extend(controlAndTag)
 
     def _encodeControlAndTag(self, type, tag, lenOfLenOrVal=0):
+        containerType = self._containerStack[-1] if self._containerStack else None
+        try:
+            key = (type, tag.__class__, tag, lenOfLenOrVal, containerType, self._implicitProfile)
+            return _controlAndTagCache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable tag, rejected below
+            key = None
+        controlAndTag = self._packControlAndTag(type, tag, lenOfLenOrVal, containerType)
+        if key is not None and len(_controlAndTagCache) < _CONTROL_AND_TAG_CACHE_SIZE:
+            _controlAndTagCache[key] = controlAndTag
+        return controlAndTag
+
+    def _packControlAndTag(self, type, tag, lenOfLenOrVal, containerType):
         controlByte = type
         if lenOfLenOrVal == 2:
             controlByte |= 1
@@ -353,8 +608,7 @@ class TLVWriter(object):
         if tag is None:
             if (
                 type != TLVEndOfContainer
-                and len(self._containerStack) != 0
-                and self._containerStack[0] == TLV_TYPE_STRUCTURE
+                and containerType == TLV_TYPE_STRUCTURE
             ):
                 raise ValueError(
                     "Attempt to encode anonymous tag within TLV structure")
@@ -364,11 +618,11 @@ class TLVWriter(object):
             if tag < 0 or tag > UINT8_MAX:
                 raise ValueError(
                     "Context-specific TLV tag number out of range")
-            if len(self._containerStack) == 0:
+            if containerType is None:
                 raise ValueError(
                     "Attempt to encode context-specific TLV tag at top level"
                 )
-            if self._containerStack[0] == TLV_TYPE_ARRAY:
+            if containerType == TLV_TYPE_ARRAY:
                 raise ValueError(
                     "Attempt to encode context-specific tag within TLV array"
                 )
@@ -385,10 +639,7 @@ class TLVWriter(object):
                     raise ValueError("Invalid object given for TLV profile id")
                 if profile < 0 or profile > UINT32_MAX:
                     raise ValueError("TLV profile id value out of range")
-            if (
-                len(self._containerStack) != 0
-                and self._containerStack[0] == TLV_TYPE_ARRAY
-            ):
+            if containerType == TLV_TYPE_ARRAY:
                 raise ValueError(
                     "Attempt to encode profile-specific tag within TLV array"
                 )
@@ -414,7 +665,7 @@ class TLVWriter(object):
                     return struct.pack("<BHHH", controlByte, vendorId, profileNum, tagNum)
                 else:
                     controlByte |= TLV_TAG_CONTROL_FULLY_QUALIFIED_8Bytes
-                    return struct.pack("<BHHL", controlByte, vendorId, profileNum, profile, tagNum)
+                    return struct.pack("<BHHL", controlByte, vendorId, profileNum, tagNum)
         raise ValueError("Invalid object given for TLV tag")
 
     @staticmethod
@@ -443,252 +694,704 @@ class TLVWriter(object):
             raise ValueError("Invalid TLV container type")
 
 
+# Minimal length of the arrays whose elements are written in bulk
+_BULK_ARRAY_MIN_LENGTH = 4
+
+# struct codes of the integer widths, indexed by the element type length field
+_UNSIGNED_WIDTHS = "BHLQ"
+_SIGNED_WIDTHS = "bhlq"
+
+
+def _unsignedWidth(val):
+    """Return the length field of the minimal unsigned integer encoding of val"""
+    if val < 0:
+        raise ValueError("Integer value out of range")
+    if val <= UINT8_MAX:
+        return 0
+    if val <= UINT16_MAX:
+        return 1
+    if val <= UINT32_MAX:
+        return 2
+    if val <= UINT64_MAX:
+        return 3
+    raise ValueError("Integer value out of range")
+
+
+def _signedWidth(val):
+    """Return the length field of the minimal signed integer encoding of val"""
+    if INT8_MIN <= val <= INT8_MAX:
+        return 0
+    if INT16_MIN <= val <= INT16_MAX:
+        return 1
+    if INT32_MIN <= val <= INT32_MAX:
+        return 2
+    if INT64_MIN <= val <= INT64_MAX:
+        return 3
+    raise ValueError("Integer value out of range")
+
+
+def _packArrayRun(controlByte, code, values):
+    """Return the encoding of anonymous elements with the same control byte, whose values are packed
+    with the struct code: the values are packed at once and interleaved with the control bytes."""
+    count = len(values)
+    size = struct.calcsize("<" + code)
+    stride = size + 1
+    packed = struct.pack("<%d%s" % (count, code), *values)
+    encoding = bytearray(stride * count)
+    encoding[0::stride] = bytes((controlByte,)) * count
+    for index in range(size):
+        encoding[1 + index::stride] = packed[index::size]
+    return encoding
+
+
+# Bulk decoders of the array elements with a fixed size, indexed by control byte (anonymous tag):
+# (struct of the element skipping its control byte, value type conversion)
+_ARRAY_RUN_DECODERS = {
+    elementType: (struct.Struct("<x" + valueStruct.format[1:]),
+                  uint if valueKind == _VALUE_UINT else float32 if valueKind == _VALUE_FLOAT32 else None)
+    for elementType, (valueKind, valueStruct) in enumerate(_VALUE_DECODERS)
+    if valueKind in (_VALUE_FIXED, _VALUE_UINT, _VALUE_FLOAT32)
+}
+
+# Writer methods of the exact types of values, tried by TLVWriter.put before its isinstance chain
+_putByType = {
+    bool: TLVWriter.putBool,
+    uint: TLVWriter.putUnsignedInt,
+    int: TLVWriter.putSignedInt,
+    float32: TLVWriter.putFloat,
+    float: TLVWriter.putDouble,
+    str: TLVWriter.putString,
+    bytes: TLVWriter.putBytes,
+    bytearray: TLVWriter.putBytes,
+    dict: TLVWriter._putMapping,
+    list: TLVWriter._putSequence,
+    tuple: TLVWriter._putSequence,
+}
+
+
+def _decodeTag(tlv, offset, tagControl):
+    """The control byte specifies the type of a TLV element and how its tag, length and value fields are encoded.
+    The control byte consists of two subfields: an element type field which occupies the lower 5 bits,
+    and a tag control field which occupies the upper 3 bits. The element type field encodes the element’s type
+    as well as how the corresponding length and value fields are encoded.  In the case of Booleans and the
+    null value, the element type field also encodes the value itself.
+
+    Returns the tag encoded at offset, after the control byte, as a context tag number, a (profile, tag number)
+    tuple or None, the length of its tag number field and the offset following the tag."""
+    tagKind, tagStruct = _TAG_DECODERS[tagControl]
+    if tagKind == _TAG_ANONYMOUS:
+        return None, 0, offset
+    if tagKind == _TAG_FULLY_QUALIFIED:
+        (vendorId, profileNum) = _VENDOR_PROFILE.unpack_from(tlv, offset)
+        offset += 4
+        profile = (vendorId << 16) | profileNum
+    else:
+        profile = 0 if tagKind == _TAG_COMMON_PROFILE else None
+    (tagNum,) = tagStruct.unpack_from(tlv, offset)
+    offset += tagStruct.size
+    if tagKind == _TAG_CONTEXT:
+        return tagNum, tagStruct.size, offset
+    return (profile, tagNum), tagStruct.size, offset
+
+
+def _putDecodedValue(out, tag, value):
+    """Store a decoded value into its container, the dictionary or list out"""
+    if tag is not None:
+        out[tag] = value
+    elif isinstance(out, Mapping):
+        out["Any"] = value
+    elif isinstance(out, Sequence):
+        out.append(value)
+    else:
+        raise ValueError("Attempt to decode unsupported TLV tag")
+
+
 class TLVReader(object):
-    def __init__(self, tlv):
+    def __init__(self, tlv, trace=False):
         self._tlv = tlv
         self._bytesRead = 0
-        self._decodings = []
+        self._decodings = [] if trace else None
+        self._decoded = False
 
     @property
     def decoding(self):
+        """The decoding trace of the elements read by get().
+
+        The trace is a list holding one dictionary per element, describing its tag control,
+        type, tag, lengths and value. Unless the reader was created with trace=True, get()
+        only builds the Python values: the trace is then computed on first access by decoding
+        the encoding again, which must not have been modified in between.
+        """
+        if self._decodings is None:
+            self._decodings = []
+            if self._decoded:
+                bytesRead = self._bytesRead
+                self._bytesRead = 0
+                with memoryview(self._tlv) as view, view.cast("B") as tlv:
+                    self._get(tlv, self._decodings, {})
+                self._bytesRead = bytesRead
         return self._decodings
 
-    def get(self):
-        """Get the dictionary representation of tlv data"""
-        out = {}
-        self._get(self._tlv, self._decodings, out)
+    def get(self, compact=False):
+        """Get the dictionary representation of tlv data.
+
+        With compact=True, structures are decoded into TLVRecord tuples and arrays into tuples
+        instead of dictionaries and lists, which takes much less memory for large decoded trees;
+        the top-level elements are returned as a TLVRecord too. The decoding trace is then
+        built on first access to decoding, even if the reader was created with trace=True.
+        """
+        # Decode through a read-only view so that no part of the encoding is copied,
+        # the view is released afterwards so the underlying buffer can be resized again.
+        with memoryview(self._tlv) as view, view.cast("B") as tlv:
+            if compact:
+                self._decodings = None
+                out = self._getCompact(tlv)
+            else:
+                out = {}
+                self._get(tlv, self._decodings, out)
+        self._decoded = True
         return out
 
-    def _decodeControlByte(self, tlv, decoding):
-        (controlByte,) = struct.unpack(
-            "<B", tlv[self._bytesRead: self._bytesRead + 1])
-        controlTypeIndex = controlByte & 0xE0
-        decoding["tagControl"] = TagControls[controlTypeIndex]
-        elementtypeIndex = controlByte & 0x1F
-        decoding["type"] = ElementTypes[elementtypeIndex]
-        self._bytesRead += 1
-
-    def _decodeControlAndTag(self, tlv, decoding):
-        """The control byte specifies the type of a TLV element and how its tag, length and value fields are encoded.
-        The control byte consists of two subfields: an element type field which occupies the lower 5 bits,
-        and a tag control field which occupies the upper 3 bits. The element type field encodes the element’s type
-        as well as how the corresponding length and value fields are encoded.  In the case of Booleans and the
-        null value, the element type field also encodes the value itself."""
-
-        self._decodeControlByte(tlv, decoding)
-
-        if decoding["tagControl"] == "Anonymous":
-            decoding["tag"] = None
-            decoding["tagLen"] = 0
-        elif decoding["tagControl"] == "Context 1-byte":
-            (decoding["tag"],) = struct.unpack(
-                "<B", tlv[self._bytesRead: self._bytesRead + 1]
-            )
-            decoding["tagLen"] = 1
+    def _readArrayRun(self, tlv, controlByte):
+        """Decode the run of anonymous fixed-size elements with the same control byte starting at the
+        current position: the control bytes are compared with a strided slice and the values unpacked
+        at once. Returns the list of the values, or None if the run is shorter than two elements."""
+        runStruct, convert = _ARRAY_RUN_DECODERS[controlByte]
+        stride = runStruct.size
+        start = self._bytesRead
+        # start offsets of the elements fully contained in the encoding are below lastStart
+        lastStart = len(tlv) - stride + 1
+        if start + stride >= lastStart or tlv[start + stride] != controlByte:
+            return None
+
+        control = bytes((controlByte,))
+        end = start
+        window = 16
+        while True:
+            stop = min(end + window * stride, lastStart)
+            controls = bytes(tlv[end: stop: stride])
+            sameCount = len(controls) - len(controls.lstrip(control))
+            end += sameCount * stride
+            if sameCount < len(controls) or stop == lastStart:
+                break
+            window *= 2
+
+        self._bytesRead = end
+        if convert is None:
+            return [val for (val,) in runStruct.iter_unpack(tlv[start: end])]
+        return [convert(val) for (val,) in runStruct.iter_unpack(tlv[start: end])]
+
+    def _readBytes(self, tlv, length):
+        if self._bytesRead + length > len(tlv):
+            raise struct.error(
+                "unpack requires a buffer of %d bytes" % length)
+        return bytes(tlv[self._bytesRead: self._bytesRead + length])
+
+    def _getCompact(self, tlv):
+        """Decode the elements of tlv into TLVRecord and tuples, nested containers being
+        tracked on an explicit stack"""
+        tlvLen = len(tlv)
+        # tags and values of the current container, the top-level elements acting as a structure
+        tags = []
+        values = []
+        isArray = False
+        # stack of (tags, values, isArray, tag of the container) of the enclosing containers
+        stack = []
+
+        while self._bytesRead < tlvLen:
+            controlByte = tlv[self._bytesRead]
+            if isArray and controlByte in _ARRAY_RUN_DECODERS:
+                run = self._readArrayRun(tlv, controlByte)
+                if run is not None:
+                    values.extend(run)
+                    continue
             self._bytesRead += 1
-        elif decoding["tagControl"] == "Common Profile 2-byte":
-            profile = 0
-            (tag,) = struct.unpack(
-                "<H", tlv[self._bytesRead: self._bytesRead + 2])
-            decoding["profileTag"] = (profile, tag)
-            decoding["tagLen"] = 2
-            self._bytesRead += 2
-        elif decoding["tagControl"] == "Common Profile 4-byte":
-            profile = 0
-            (tag,) = struct.unpack(
-                "<L", tlv[self._bytesRead: self._bytesRead + 4])
-            decoding["profileTag"] = (profile, tag)
-            decoding["tagLen"] = 4
-            self._bytesRead += 4
-        elif decoding["tagControl"] == "Implicit Profile 2-byte":
-            profile = None
-            (tag,) = struct.unpack(
-                "<H", tlv[self._bytesRead: self._bytesRead + 2])
-            decoding["profileTag"] = (profile, tag)
-            decoding["tagLen"] = 2
-            self._bytesRead += 2
-        elif decoding["tagControl"] == "Implicit Profile 4-byte":
-            profile = None
-            (tag,) = struct.unpack(
-                "<L", tlv[self._bytesRead: self._bytesRead + 4])
-            decoding["profileTag"] = (profile, tag)
-            decoding["tagLen"] = 4
-            self._bytesRead += 4
-        elif decoding["tagControl"] == "Fully Qualified 6-byte":
-            (vendorId, profileNum) = struct.unpack(
-                "<HH", tlv[self._bytesRead: self._bytesRead + 4])
-            profile = (vendorId << 16) | profileNum
-            (tag,) = struct.unpack(
-                "<H", tlv[self._bytesRead + 4: self._bytesRead + 6])
-            decoding["profileTag"] = (profile, tag)
-            decoding["tagLen"] = 2
-            self._bytesRead += 6
-        elif decoding["tagControl"] == "Fully Qualified 8-byte":
-            (vendorId, profileNum) = struct.unpack(
-                "<HH", tlv[self._bytesRead: self._bytesRead + 4])
-            profile = (vendorId << 16) | profileNum
-            (tag,) = struct.unpack(
-                "<L", tlv[self._bytesRead + 4: self._bytesRead + 8])
-            decoding["profileTag"] = (profile, tag)
-            decoding["tagLen"] = 4
-            self._bytesRead += 8
-
-    def _decodeStrLength(self, tlv, decoding):
-        """UTF-8 or Byte StringLength fields are encoded in 0, 1, 2 or 4 byte widths, as specified by
-        the element type field. If the element type needs a length field grab the next bytes as length"""
-        if "length" in decoding["type"]:
-            if "1-byte" in decoding["type"]:
-                (decoding["strDataLen"],) = struct.unpack(
-                    "<B", tlv[self._bytesRead: self._bytesRead + 1]
-                )
-                decoding["strDataLenLen"] = 1
-                self._bytesRead += 1
-            elif "2-byte" in decoding["type"]:
-                (decoding["strDataLen"],) = struct.unpack(
-                    "<H", tlv[self._bytesRead: self._bytesRead + 2]
-                )
-                decoding["strDataLenLen"] = 2
-                self._bytesRead += 2
-            elif "4-byte" in decoding["type"]:
-                (decoding["strDataLen"],) = struct.unpack(
-                    "<L", tlv[self._bytesRead: self._bytesRead + 4]
-                )
-                decoding["strDataLenLen"] = 4
-                self._bytesRead += 4
-            elif "8-byte" in decoding["type"]:
-                (decoding["strDataLen"],) = struct.unpack(
-                    "<Q", tlv[self._bytesRead: self._bytesRead + 8]
-                )
-                decoding["strDataLenLen"] = 8
-                self._bytesRead += 8
-        else:
-            decoding["strDataLen"] = 0
-            decoding["strDataLenLen"] = 0
-
-    def _decodeVal(self, tlv, decoding):
-        """decode primitive tlv value to the corresponding python value, tlv array and path are decoded as
-        python list, tlv structure is decoded as python dictionary"""
-        if decoding["type"] == "Structure":
-            decoding["value"] = {}
-            decoding["Structure"] = []
-            self._get(tlv, decoding["Structure"], decoding["value"])
-        elif decoding["type"] == "Array":
-            decoding["value"] = []
-            decoding["Array"] = []
-            self._get(tlv, decoding["Array"], decoding["value"])
-        elif decoding["type"] == "Path":
-            decoding["value"] = []
-            decoding["Path"] = []
-            self._get(tlv, decoding["Path"], decoding["value"])
-        elif decoding["type"] == "Null":
-            decoding["value"] = None
-        elif decoding["type"] == "End of Collection":
-            decoding["value"] = None
-        elif decoding["type"] == "Boolean True":
-            decoding["value"] = True
-        elif decoding["type"] == "Boolean False":
-            decoding["value"] = False
-        elif decoding["type"] == "Unsigned Integer 1-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<B", tlv[self._bytesRead: self._bytesRead + 1]
-            )
-            decoding["value"] = uint(decoding["value"])
-            self._bytesRead += 1
-        elif decoding["type"] == "Signed Integer 1-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<b", tlv[self._bytesRead: self._bytesRead + 1]
-            )
+            elementType = controlByte & 0x1F
+            if elementType > TLVEndOfContainer:
+                raise ValueError("Attempt to decode unsupported TLV type")
+
+            tag, _tagLen, self._bytesRead = _decodeTag(tlv, self._bytesRead, controlByte & 0xE0)
+            valueKind, valueStruct = _VALUE_DECODERS[elementType]
+
+            if valueKind == _VALUE_FIXED:
+                (value,) = valueStruct.unpack_from(tlv, self._bytesRead)
+                self._bytesRead += valueStruct.size
+            elif valueKind == _VALUE_UINT:
+                (value,) = valueStruct.unpack_from(tlv, self._bytesRead)
+                value = uint(value)
+                self._bytesRead += valueStruct.size
+            elif valueKind == _VALUE_UTF8_STRING or valueKind == _VALUE_BYTE_STRING:
+                (strDataLen,) = valueStruct.unpack_from(tlv, self._bytesRead)
+                self._bytesRead += valueStruct.size
+                value = self._readBytes(tlv, strDataLen)
+                self._bytesRead += strDataLen
+                if valueKind == _VALUE_UTF8_STRING:
+                    try:
+                        value = str(value, "utf-8")
+                    except Exception:
+                        pass
+            elif valueKind == _VALUE_FLOAT32:
+                (value,) = valueStruct.unpack_from(tlv, self._bytesRead)
+                value = float32(value)
+                self._bytesRead += valueStruct.size
+            elif valueKind == _VALUE_CONSTANT:
+                value = valueStruct
+            elif valueKind == _VALUE_STRUCTURE or valueKind == _VALUE_ARRAY:
+                stack.append((tags, values, isArray, tag))
+                tags = []
+                values = []
+                isArray = valueKind == _VALUE_ARRAY
+                continue
+            elif stack:
+                # end of container
+                value = tuple(values) if isArray else makeRecord(tags, values)
+                tags, values, isArray, tag = stack.pop()
+            else:
+                break
+
+            if not isArray:
+                tags.append("Any" if tag is None else tag)
+            values.append(value)
+
+        # containers left open by a truncated encoding are closed, as done by _get()
+        while stack:
+            value = tuple(values) if isArray else makeRecord(tags, values)
+            tags, values, isArray, tag = stack.pop()
+            if not isArray:
+                tags.append("Any" if tag is None else tag)
+            values.append(value)
+        return makeRecord(tags, values)
+
+    def _get(self, tlv, decodings, out):
+        """Decode the elements of tlv up to the end of the current container into out. Elements are
+        dispatched on the integer tag control and element type of their control byte; the decoding
+        trace, with its descriptive strings, is only built when decodings is not None."""
+        tlvLen = len(tlv)
+        # without trace, runs of fixed-size elements of arrays are decoded in bulk
+        bulkArray = decodings is None and out.__class__ is list
+
+        while self._bytesRead < tlvLen:
+            controlByte = tlv[self._bytesRead]
+            if bulkArray and controlByte in _ARRAY_RUN_DECODERS:
+                run = self._readArrayRun(tlv, controlByte)
+                if run is not None:
+                    out.extend(run)
+                    continue
             self._bytesRead += 1
-        elif decoding["type"] == "Unsigned Integer 2-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<H", tlv[self._bytesRead: self._bytesRead + 2]
-            )
-            decoding["value"] = uint(decoding["value"])
-            self._bytesRead += 2
-        elif decoding["type"] == "Signed Integer 2-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<h", tlv[self._bytesRead: self._bytesRead + 2]
-            )
-            self._bytesRead += 2
-        elif decoding["type"] == "Unsigned Integer 4-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<L", tlv[self._bytesRead: self._bytesRead + 4]
-            )
-            decoding["value"] = uint(decoding["value"])
-            self._bytesRead += 4
-        elif decoding["type"] == "Signed Integer 4-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<l", tlv[self._bytesRead: self._bytesRead + 4]
-            )
-            self._bytesRead += 4
-        elif decoding["type"] == "Unsigned Integer 8-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<Q", tlv[self._bytesRead: self._bytesRead + 8]
-            )
-            decoding["value"] = uint(decoding["value"])
-            self._bytesRead += 8
-        elif decoding["type"] == "Signed Integer 8-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<q", tlv[self._bytesRead: self._bytesRead + 8]
-            )
-            self._bytesRead += 8
-        elif decoding["type"] == "Floating Point 4-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<f", tlv[self._bytesRead: self._bytesRead + 4]
-            )
-            decoding["value"] = float32(decoding["value"])
-            self._bytesRead += 4
-        elif decoding["type"] == "Floating Point 8-byte value":
-            (decoding["value"],) = struct.unpack(
-                "<d", tlv[self._bytesRead: self._bytesRead + 8]
-            )
-            self._bytesRead += 8
-        elif "UTF-8 String" in decoding["type"]:
-            (val,) = struct.unpack(
-                "<%ds" % decoding["strDataLen"],
-                tlv[self._bytesRead: self._bytesRead + decoding["strDataLen"]],
-            )
-            try:
-                decoding["value"] = str(val, "utf-8")
-            except Exception as ex:
-                decoding["value"] = val
-            self._bytesRead += decoding["strDataLen"]
-        elif "Byte String" in decoding["type"]:
-            (val,) = struct.unpack(
-                "<%ds" % decoding["strDataLen"],
-                tlv[self._bytesRead: self._bytesRead + decoding["strDataLen"]],
-            )
-
-            decoding["value"] = val
-            self._bytesRead += decoding["strDataLen"]
+            tagControl = controlByte & 0xE0
+            elementType = controlByte & 0x1F
+            if elementType > TLVEndOfContainer:
+                raise ValueError("Attempt to decode unsupported TLV type")
+
+            tag, tagLen, self._bytesRead = _decodeTag(tlv, self._bytesRead, tagControl)
+            valueKind, valueStruct = _VALUE_DECODERS[elementType]
+
+            if decodings is not None:
+                decoding = {
+                    "tagControl": TagControls[tagControl],
+                    "type": ElementTypes[elementType],
+                }
+                if isinstance(tag, tuple):
+                    decoding["profileTag"] = tag
+                else:
+                    decoding["tag"] = tag
+                decoding["tagLen"] = tagLen
+                decoding["strDataLen"] = 0
+                decoding["strDataLenLen"] = 0
+                decodings.append(decoding)
+
+            if valueKind == _VALUE_FIXED:
+                (value,) = valueStruct.unpack_from(tlv, self._bytesRead)
+                self._bytesRead += valueStruct.size
+            elif valueKind == _VALUE_UINT:
+                (value,) = valueStruct.unpack_from(tlv, self._bytesRead)
+                value = uint(value)
+                self._bytesRead += valueStruct.size
+            elif valueKind == _VALUE_UTF8_STRING or valueKind == _VALUE_BYTE_STRING:
+                (strDataLen,) = valueStruct.unpack_from(tlv, self._bytesRead)
+                self._bytesRead += valueStruct.size
+                value = self._readBytes(tlv, strDataLen)
+                self._bytesRead += strDataLen
+                if valueKind == _VALUE_UTF8_STRING:
+                    try:
+                        value = str(value, "utf-8")
+                    except Exception:
+                        pass
+                if decodings is not None:
+                    decoding["strDataLen"] = strDataLen
+                    decoding["strDataLenLen"] = valueStruct.size
+            elif valueKind == _VALUE_FLOAT32:
+                (value,) = valueStruct.unpack_from(tlv, self._bytesRead)
+                value = float32(value)
+                self._bytesRead += valueStruct.size
+            elif valueKind == _VALUE_CONSTANT:
+                value = valueStruct
+            elif valueKind == _VALUE_STRUCTURE:
+                value = {}
+            else:
+                # array, path or end of container
+                value = [] if valueKind == _VALUE_ARRAY else None
+
+            if decodings is not None:
+                decoding["value"] = value
+
+            if valueKind == _VALUE_END_OF_CONTAINER:
+                return
+
+            if valueKind == _VALUE_STRUCTURE or valueKind == _VALUE_ARRAY:
+                containerDecodings = None
+                if decodings is not None:
+                    containerDecodings = decoding[decoding["type"]] = []
+                self._get(tlv, containerDecodings, value)
+
+            if tag is not None:
+                out[tag] = value
+            elif isinstance(out, Mapping):
+                out["Any"] = value
+            elif isinstance(out, Sequence):
+                out.append(value)
+            else:
+                raise ValueError("Attempt to decode unsupported TLV tag")
+
+
+TLV_EVENT_START_CONTAINER = "startContainer"
+TLV_EVENT_VALUE = "value"
+TLV_EVENT_END_CONTAINER = "endContainer"
+
+TLVEvent = namedtuple("TLVEvent", ["kind", "tag", "type", "value"])
+TLVEvent.__doc__ = """An event of TLVStreamReader.
+
+kind is TLV_EVENT_START_CONTAINER, TLV_EVENT_VALUE or TLV_EVENT_END_CONTAINER.
+tag is the tag of the element (None for anonymous elements and container ends).
+type is the element type of the element (lower 5 bits of its control byte), for a
+container end the type of the container being closed.
+value is the decoded value of TLV_EVENT_VALUE events, None otherwise."""
+
+
+class TLVStreamReader(object):
+    """Incremental (pull) TLV parser.
+
+    The encoding is read from a binary file-like object (anything with a read() method,
+    e.g. an open file or socket.makefile("rb")), an iterable of bytes-like chunks or a
+    bytes-like object. Iterating over the reader yields TLVEvent tuples; the encoding is
+    consumed as the events are pulled.
+
+    Only a bounded buffer is kept in memory: the unread part of the current chunk, and at
+    most the largest element of the encoding. Nested containers are tracked on an explicit
+    stack, so the nesting depth is not limited by the Python recursion limit.
+    """
+
+    def __init__(self, source, chunkSize=64 * 1024):
+        if hasattr(source, "read"):
+            self._chunks = iter(lambda: source.read(chunkSize), b"")
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            view = memoryview(source).cast("B")
+            self._chunks = (view[i: i + chunkSize]
+                            for i in range(0, len(view), chunkSize))
         else:
+            self._chunks = iter(source)
+        self._buffer = bytearray()
+        self._pos = 0
+        self._bytesRead = 0
+        self._containerStack = []
+
+    @property
+    def bytesRead(self):
+        """Number of bytes of the encoding consumed so far"""
+        return self._bytesRead
+
+    @property
+    def depth(self):
+        """Number of containers opened and not yet closed"""
+        return len(self._containerStack)
+
+    def _fill(self, length):
+        """Make length bytes available in the buffer from the current position.
+
+        Returns False if the encoding ends before."""
+        available = len(self._buffer) - self._pos
+        if available >= length:
+            return True
+        if self._pos:
+            del self._buffer[: self._pos]
+            self._pos = 0
+        while available < length:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return False
+            self._buffer += chunk
+            available = len(self._buffer)
+        return True
+
+    def _need(self, length):
+        if not self._fill(length):
+            raise ValueError("Truncated TLV encoding")
+
+    def _take(self, length):
+        self._need(length)
+        start = self._pos
+        self._pos += length
+        self._bytesRead += length
+        with memoryview(self._buffer) as view:
+            return bytes(view[start: start + length])
+
+    def _unpack(self, fieldStruct):
+        self._need(fieldStruct.size)
+        (value,) = fieldStruct.unpack_from(self._buffer, self._pos)
+        self._pos += fieldStruct.size
+        self._bytesRead += fieldStruct.size
+        return value
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """Return the next TLVEvent of the encoding"""
+        if not self._fill(1):
+            if self._containerStack:
+                raise ValueError("Truncated TLV encoding")
+            raise StopIteration
+
+        controlByte = self._buffer[self._pos]
+        tagControl = controlByte & 0xE0
+        elementType = controlByte & 0x1F
+        if elementType > TLVEndOfContainer:
             raise ValueError("Attempt to decode unsupported TLV type")
 
-    def _get(self, tlv, decodings, out):
-        endOfEncoding = False
+        tagFieldSize = _TAG_FIELD_SIZES[tagControl]
+        self._need(1 + tagFieldSize)
+        tag, _tagLen, _offset = _decodeTag(self._buffer, self._pos + 1, tagControl)
+        self._pos += 1 + tagFieldSize
+        self._bytesRead += 1 + tagFieldSize
+
+        valueKind, valueStruct = _VALUE_DECODERS[elementType]
+
+        if valueKind == _VALUE_STRUCTURE or valueKind == _VALUE_ARRAY:
+            self._containerStack.append(elementType)
+            return TLVEvent(TLV_EVENT_START_CONTAINER, tag, elementType, None)
+        if valueKind == _VALUE_END_OF_CONTAINER:
+            if not self._containerStack:
+                raise ValueError("TLV end of container outside of a container")
+            return TLVEvent(TLV_EVENT_END_CONTAINER, None, self._containerStack.pop(), None)
+
+        if valueKind == _VALUE_FIXED:
+            value = self._unpack(valueStruct)
+        elif valueKind == _VALUE_UINT:
+            value = uint(self._unpack(valueStruct))
+        elif valueKind == _VALUE_FLOAT32:
+            value = float32(self._unpack(valueStruct))
+        elif valueKind == _VALUE_CONSTANT:
+            value = valueStruct
+        else:
+            value = self._take(self._unpack(valueStruct))
+            if valueKind == _VALUE_UTF8_STRING:
+                try:
+                    value = str(value, "utf-8")
+                except Exception:
+                    pass
+        return TLVEvent(TLV_EVENT_VALUE, tag, elementType, value)
+
+    def get(self):
+        """Get the dictionary representation of the remaining tlv data, as TLVReader.get() does,
+        building nested containers without recursion"""
+        out = {}
+        # stack of (container, tag of the container in its parent)
+        stack = []
+        current = out
+        for event in self:
+            if event.kind == TLV_EVENT_START_CONTAINER:
+                stack.append((current, event.tag))
+                current = {} if event.type == TLV_TYPE_STRUCTURE else []
+            elif event.kind == TLV_EVENT_END_CONTAINER:
+                value = current
+                current, tag = stack.pop()
+                _putDecodedValue(current, tag, value)
+            else:
+                _putDecodedValue(current, event.tag, event.value)
+        return out
+
+
+class TLVScanner(object):
+    """Random access to the elements of a TLV encoding, without decoding it.
 
-        while len(tlv[self._bytesRead:]) > 0 and endOfEncoding == False:
-            decoding = {}
-            self._decodeControlAndTag(tlv, decoding)
-            self._decodeStrLength(tlv, decoding)
-            self._decodeVal(tlv, decoding)
-            decodings.append(decoding)
+    Elements are located by their path from the root element (the first element of the
+    encoding): a sequence holding, for each level, the tag of a structure or path member
+    (a context tag number or a (profile, tag number) tuple) or the index of an array element.
+    The empty path is the root element itself.
 
-            if decoding["type"] == "End of Collection":
-                endOfEncoding = True
+    The elements which are not on the path are skipped using their encoded lengths: only the
+    control bytes and the tags of the members of the traversed containers are read. As TLV
+    containers do not encode their length, skipping a container still steps over its elements.
+
+    buildIndex() walks the encoding once and returns the offset of every element by path.
+    A scanner given this index (e.g. cached with pickle, it only holds tuples and integers)
+    finds an element in O(depth) instead of O(size of the encoding). With maxDepth, only the
+    elements up to that depth are indexed and deeper lookups are scanned from the deepest
+    indexed container.
+    """
+
+    def __init__(self, tlv, index=None):
+        self._tlv = tlv
+        self._index = index
+
+    @property
+    def index(self):
+        """The index of the offsets of the elements by path, None if it was not built nor given"""
+        return self._index
+
+    def skip(self, offset=0):
+        """Returns the offset following the element starting at offset"""
+        with memoryview(self._tlv) as view, view.cast("B") as tlv:
+            return self._skip(tlv, offset)
+
+    def children(self, path=()):
+        """Returns the list of the (tag or index, offset) of the elements of the container at path"""
+        with memoryview(self._tlv) as view, view.cast("B") as tlv:
+            offset = self._find(tlv, path)
+            if offset is None:
+                raise KeyError(path)
+            return list(self._children(tlv, offset))
+
+    def find(self, path=()):
+        """Returns the offset of the element at path, None if there is no such element"""
+        with memoryview(self._tlv) as view, view.cast("B") as tlv:
+            return self._find(tlv, path)
+
+    def get(self, path=(), default=None):
+        """Returns the value of the element at path, decoded as TLVReader.get() does,
+        or default if there is no such element"""
+        with memoryview(self._tlv) as view, view.cast("B") as tlv:
+            offset = self._find(tlv, path)
+            if offset is None:
+                return default
+            out = TLVReader(tlv[offset: self._skip(tlv, offset)]).get()
+        (value,) = out.values()
+        return value
+
+    def buildIndex(self, maxDepth=None):
+        """Build, keep and return the index of the offsets of the elements of the encoding,
+        a dictionary keyed by path tuple, up to maxDepth levels below the root element"""
+        index = {}
+        with memoryview(self._tlv) as view, view.cast("B") as tlv:
+            if len(tlv):
+                self._indexElements(tlv, maxDepth, index)
+        self._index = index
+        return index
+
+    @staticmethod
+    def _skip(tlv, offset):
+        tlvLen = len(tlv)
+        depth = 0
+        while True:
+            if offset >= tlvLen:
+                raise ValueError("Truncated TLV encoding")
+            skip = _ELEMENT_SKIPS[tlv[offset]]
+            if skip is None:
+                raise ValueError("Attempt to decode unsupported TLV type")
+            size, lengthStruct, depthChange = skip
+            offset += size
+            if lengthStruct is not None:
+                if offset + lengthStruct.size > tlvLen:
+                    raise ValueError("Truncated TLV encoding")
+                (strDataLen,) = lengthStruct.unpack_from(tlv, offset)
+                offset += lengthStruct.size + strDataLen
+            elif depthChange:
+                depth += depthChange
+                if depth < 0:
+                    raise ValueError("Unexpected TLV end of container")
+            if depth == 0:
+                if offset > tlvLen:
+                    raise ValueError("Truncated TLV encoding")
+                return offset
+
+    @staticmethod
+    def _children(tlv, offset):
+        """Yields the (tag or index, offset) of the elements of the container starting at offset,
+        nothing if the element at offset is not a container"""
+        controlByte = tlv[offset]
+        elementType = controlByte & 0x1F
+        if elementType not in (TLV_TYPE_STRUCTURE, TLV_TYPE_ARRAY, TLV_TYPE_PATH):
+            return
+        isArray = elementType == TLV_TYPE_ARRAY
+        offset += 1 + _TAG_FIELD_SIZES[controlByte & 0xE0]
+        index = 0
+        while True:
+            if offset >= len(tlv):
+                raise ValueError("Truncated TLV encoding")
+            controlByte = tlv[offset]
+            if controlByte == TLVEndOfContainer:
+                return
+            # skipping first checks that the whole element, including its tag, is in the encoding
+            end = TLVScanner._skip(tlv, offset)
+            if isArray:
+                yield index, offset
+                index += 1
             else:
-                if "profileTag" in list(decoding.keys()):
-                    out[decoding["profileTag"]] = decoding["value"]
-                elif "tag" in list(decoding.keys()):
-                    if decoding["tag"] is not None:
-                        out[decoding["tag"]] = decoding["value"]
-                    else:
-                        if isinstance(out, Mapping):
-                            out["Any"] = decoding["value"]
-                        elif isinstance(out, Sequence):
-                            out.append(decoding["value"])
-                else:
-                    raise ValueError("Attempt to decode unsupported TLV tag")
+                tag, _tagLen, _valueOffset = _decodeTag(tlv, offset + 1, controlByte & 0xE0)
+                yield tag, offset
+            offset = end
+
+    def _find(self, tlv, path):
+        path = tuple(path)
+        offset = 0
+        depth = 0
+        if self._index is not None:
+            # start from the deepest indexed element of the path
+            for depth in range(len(path), -1, -1):
+                indexed = self._index.get(path[:depth])
+                if indexed is not None:
+                    offset = indexed
+                    break
+            else:
+                return None
+        if offset >= len(tlv):
+            return None
+        for step in path[depth:]:
+            for key, childOffset in self._children(tlv, offset):
+                if key == step:
+                    offset = childOffset
+                    break
+            else:
+                return None
+        return offset
+
+    @staticmethod
+    def _indexElements(tlv, maxDepth, index):
+        """Index the root element and its elements up to maxDepth in a single pass over tlv"""
+        tlvLen = len(tlv)
+        index[()] = 0
+        skip = _ELEMENT_SKIPS[tlv[0]]
+        if skip is None or skip[2] != 1 or maxDepth == 0:
+            return
+        # stack of [path, is an array, index of the next element] of the open containers
+        stack = [[(), tlv[0] & 0x1F == TLV_TYPE_ARRAY, 0]]
+        offset = skip[0]
+        while stack:
+            if offset >= tlvLen:
+                raise ValueError("Truncated TLV encoding")
+            controlByte = tlv[offset]
+            if controlByte == TLVEndOfContainer:
+                stack.pop()
+                offset += 1
+                continue
+            skip = _ELEMENT_SKIPS[controlByte]
+            if skip is None:
+                raise ValueError("Attempt to decode unsupported TLV type")
+            if offset + skip[0] > tlvLen:
+                raise ValueError("Truncated TLV encoding")
+            container = stack[-1]
+            if container[1]:
+                key = container[2]
+                container[2] += 1
+            else:
+                key, _tagLen, _valueOffset = _decodeTag(tlv, offset + 1, controlByte & 0xE0)
+            path = container[0] + (key,)
+            index[path] = offset
+            if skip[2] == 1 and (maxDepth is None or len(path) < maxDepth):
+                stack.append([path, controlByte & 0x1F == TLV_TYPE_ARRAY, 0])
+                offset += skip[0]
+            else:
+                offset = TLVScanner._skip(tlv, offset)
 
 
 def tlvTagToSortKey(tag):
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#
+#   Copyright (c) 2024 STMicroelectronics International N.V.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+#
+#   @file
+#         Throughput benchmark of the Chip TLV reader and writer.
+#
+#   Decodes attribute dumps (an array of attribute report structures) of
+#   increasing sizes: the throughput must stay constant as the dump grows,
+#   i.e. decoding time must be linear in the size of the encoding.
+#
+#   With --encode, encodes the attribute reports one by one instead, as done
+#   for mass OTA header or factory data generation, with a new TLVWriter per
+#   report, with and without sorting the dicts (sortDicts=False), and with the
+#   pre-optimization writer of chip.tlv.reference as the baseline.
+#
+#   With --suite, runs the micro-benchmark suite: TLVWriter.put, TLVReader.get
+#   and TLVReader.get(compact=True) on payloads of typical shapes (flat
+#   structure, deep nesting, long byte strings, large arrays, profile tags),
+#   reporting the operations and bytes per second and the memory allocated
+#   (tracemalloc) per operation.
+#   With --json, the results are also written to a JSON file, to be compared
+#   between revisions of the codec.
+#
+#   Usage examples:
+#   python -m chip.tlv.benchmark
+#   python ./chip/tlv/benchmark.py --sizes 1 4 16 --repeat 5
+#   python ./chip/tlv/benchmark.py --trace
+#   python ./chip/tlv/benchmark.py --stream
+#   python ./chip/tlv/benchmark.py --encode
+#   python ./chip/tlv/benchmark.py --suite --json results.json
+#
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+if not __package__:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from chip.tlv import TLVReader, TLVStreamReader, TLVWriter, uint  # noqa: E402 isort:skip
+from chip.tlv import reference  # noqa: E402 isort:skip
+
+
+def attributeReport(index):
+    """Return the attribute report structure number index of a dump"""
+    values = (
+        uint(index),
+        -index,
+        "attribute-%d" % index,
+        bytes(range(index % 64)),
+        [uint(index), uint(index + 1), False],
+        index * 0.5,
+    )
+    return {
+        0: uint(1 + index % 4),         # endpoint
+        1: uint(0x0300),                # cluster
+        2: uint(index & 0xFFFF),        # attribute
+        3: uint(index),                 # data version
+        4: values[index % len(values)],
+    }
+
+
+def attributeDump(size):
+    """Return the TLV encoding of an attribute dump of at least size bytes"""
+    reports = []
+    encodedSize = 0
+    while encodedSize < size:
+        report = attributeReport(len(reports))
+        writer = TLVWriter()
+        writer.put(None, report)
+        encodedSize += len(writer.encoding)
+        reports.append(report)
+
+    writer = TLVWriter()
+    writer.put(None, reports)
+    return writer.encoding, len(reports)
+
+
+def measure(encoding, repeat, trace=False, stream=False):
+    """Return the best decoding time of encoding in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if stream:
+            TLVStreamReader(io.BytesIO(encoding)).get()
+        else:
+            TLVReader(encoding, trace=trace).get()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def encodeReferenceWriters(reports):
+    """Encode each report with a new pre-optimization TLVWriter (the baseline)"""
+    for report in reports:
+        writer = reference.TLVWriter()
+        writer.put(None, report)
+
+
+def encodeNewWriters(reports):
+    """Encode each report with a new TLVWriter"""
+    for report in reports:
+        writer = TLVWriter()
+        writer.put(None, report)
+
+
+def encodeNewWritersPresorted(reports):
+    """Encode each report with a new TLVWriter, skipping the sort of the dicts"""
+    for report in reports:
+        writer = TLVWriter(sortDicts=False)
+        writer.put(None, report)
+
+
+def encodeBenchmark(sizes, repeat):
+    """Print the encoding throughput of attribute reports with the writer variants"""
+    variants = (
+        ('reference', encodeReferenceWriters),
+        ('new writer', encodeNewWriters),
+        ('presorted', encodeNewWritersPresorted),
+    )
+    print('%12s%12s%16s%12s%12s%16s' % ('size (MiB)', 'reports', 'writer', 'time (s)', 'MB/s', 'reports/s'))
+    for sizeMb in sizes:
+        encoding, count = attributeDump(int(sizeMb * 1024 * 1024))
+        reports = [attributeReport(index) for index in range(count)]
+        for name, function in variants:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function(reports)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print('%12.2f%12d%16s%12.3f%12.2f%16.0f' % (len(encoding) / (1024 * 1024), count, name, best,
+                                                        len(encoding) / (1024 * 1024) / best, count / best))
+
+
+def flatStructPayload():
+    """Flat structure of 32 context-tagged members, as an OTA header or a factory data record"""
+    return {tag: (uint(tag * 1000) if tag % 3 else "member-%d" % tag) for tag in range(32)}
+
+
+def deepNestingPayload(depth=64):
+    """Structures and arrays nested depth levels deep"""
+    payload = uint(depth)
+    for level in range(depth):
+        payload = {0: uint(level), 1: payload} if level % 2 else [payload, uint(level)]
+    return payload
+
+
+def longByteStringsPayload():
+    """Structure of four 64 KiB byte strings, as certificates or firmware chunks"""
+    return {tag: bytes(range(256)) * 256 for tag in range(4)}
+
+
+def largeArrayPayload():
+    """Array of 10000 unsigned integers"""
+    return [uint(value) for value in range(10000)]
+
+
+def profileTagsPayload():
+    """Structure of 64 members with common, implicit and fully-qualified profile tags"""
+    profiles = (0, None, 0x235A0000)
+    return {(profiles[tag % 3], tag): uint(tag) for tag in range(64)}
+
+
+SUITE_PAYLOADS = (
+    ('flat struct', flatStructPayload),
+    ('deep nesting', deepNestingPayload),
+    ('long byte strings', longByteStringsPayload),
+    ('large array', largeArrayPayload),
+    ('profile tags', profileTagsPayload),
+)
+
+
+def encodePayload(payload):
+    writer = TLVWriter()
+    writer.put(None, payload)
+    return writer.encoding
+
+
+def decodePayload(encoding):
+    return TLVReader(encoding).get()
+
+
+def decodePayloadCompact(encoding):
+    return TLVReader(encoding).get(compact=True)
+
+
+def measureOperation(function, argument, repeat, minTime):
+    """Return the best time of one call of function(argument) in seconds, each run calling it
+    as many times as needed to last at least minTime seconds"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function(argument)
+        elapsed = time.perf_counter() - start
+        if elapsed >= minTime:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function(argument)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def measureAllocations(function, argument):
+    """Return the peak of the memory allocated while calling function(argument) once and the
+    memory still allocated by its result, in bytes"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = function(argument)
+        current, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+    return peak - before, current - before
+
+
+def suiteBenchmark(repeat, minTime, jsonFile=None):
+    """Print, and optionally write to jsonFile, the results of the micro-benchmark suite"""
+    results = []
+    print('%20s%10s%12s%14s%12s%14s%14s' % ('payload', 'operation', 'size (B)', 'ops/s', 'MB/s',
+                                            'alloc peak', 'alloc kept'))
+    for name, payloadFunction in SUITE_PAYLOADS:
+        payload = payloadFunction()
+        encoding = encodePayload(payload)
+        for operation, function, argument in (('encode', encodePayload, payload),
+                                              ('decode', decodePayload, encoding),
+                                              ('compact', decodePayloadCompact, encoding)):
+            elapsed = measureOperation(function, argument, repeat, minTime)
+            allocPeak, allocKept = measureAllocations(function, argument)
+            result = {
+                'payload': name,
+                'operation': operation,
+                'size': len(encoding),
+                'opsPerSec': 1 / elapsed,
+                'bytesPerSec': len(encoding) / elapsed,
+                'allocPeak': allocPeak,
+                'allocKept': allocKept,
+            }
+            results.append(result)
+            print('%20s%10s%12d%14.0f%12.2f%14d%14d' % (name, operation, len(encoding), result['opsPerSec'],
+                                                        result['bytesPerSec'] / (1024 * 1024), allocPeak, allocKept))
+
+    if jsonFile is not None:
+        with open(jsonFile, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'machine': platform.machine(),
+                'repeat': repeat,
+                'minTime': minTime,
+                'results': results,
+            }, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chip TLV reader and writer benchmark')
+    parser.add_argument('-s', '--sizes', type=float, nargs='+', default=[1, 2, 4, 8],
+                        help='Sizes of the attribute dumps in MiB')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of runs, the best one is reported')
+    parser.add_argument('-t', '--trace', action='store_true',
+                        help='Build the decoding trace while decoding')
+    parser.add_argument('--stream', action='store_true',
+                        help='Decode with TLVStreamReader, reading the encoding from a file object')
+    parser.add_argument('-e', '--encode', action='store_true',
+                        help='Measure the encoding of the attribute reports instead of the decoding')
+    parser.add_argument('--suite', action='store_true',
+                        help='Run the encode/decode micro-benchmark suite on payloads of typical shapes')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Minimum duration of a run of the suite in seconds')
+    parser.add_argument('-j', '--json', help='Path to the JSON file the results of the suite are written to')
+    args = parser.parse_args()
+
+    if args.suite:
+        suiteBenchmark(args.repeat, args.min_time, args.json)
+        return
+
+    if args.encode:
+        encodeBenchmark(args.sizes, args.repeat)
+        return
+
+    print('%12s%12s%12s%12s%16s' % ('size (MiB)', 'reports', 'time (s)', 'MB/s', 'reports/s'))
+    for sizeMb in args.sizes:
+        encoding, reports = attributeDump(int(sizeMb * 1024 * 1024))
+        elapsed = measure(encoding, args.repeat, args.trace, args.stream)
+        print('%12.2f%12d%12.3f%12.2f%16.0f' % (len(encoding) / (1024 * 1024), reports, elapsed,
+                                                len(encoding) / (1024 * 1024) / elapsed, reports / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#
+#   Copyright (c) 2020 Project CHIP Authors
+#   Copyright (c) 2019-2020 Google LLC.
+#   All rights reserved.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+#
+#   @file
+#         Reference Chip TLV writer, as it was before the optimizations of chip.tlv.
+#
+#   Used by benchmark.py --encode as the baseline of the TLVWriter throughput.
+#   It is not used by the tools: its encodings are identical to the ones of
+#   chip.tlv.TLVWriter.
+#
+
+import struct
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from enum import Enum
+
+from chip.tlv import (INT8_MAX, INT8_MIN, INT16_MAX, INT16_MIN, INT32_MAX, INT32_MIN, INT64_MAX, INT64_MIN,
+                      TLV_TAG_CONTROL_ANONYMOUS, TLV_TAG_CONTROL_COMMON_PROFILE_2Bytes,
+                      TLV_TAG_CONTROL_COMMON_PROFILE_4Bytes, TLV_TAG_CONTROL_CONTEXT_SPECIFIC,
+                      TLV_TAG_CONTROL_FULLY_QUALIFIED_6Bytes, TLV_TAG_CONTROL_FULLY_QUALIFIED_8Bytes,
+                      TLV_TAG_CONTROL_IMPLICIT_PROFILE_2Bytes, TLV_TAG_CONTROL_IMPLICIT_PROFILE_4Bytes,
+                      TLV_TYPE_ARRAY, TLV_TYPE_BYTE_STRING, TLV_TYPE_FLOATING_POINT_NUMBER, TLV_TYPE_NULL,
+                      TLV_TYPE_PATH, TLV_TYPE_SIGNED_INTEGER, TLV_TYPE_STRUCTURE, TLV_TYPE_UNSIGNED_INTEGER,
+                      TLV_TYPE_UTF8_STRING, UINT8_MAX, UINT16_MAX, UINT32_MAX, UINT64_MAX, TLVBoolean_False,
+                      TLVBoolean_True, TLVEndOfContainer, float32, tlvTagToSortKey, uint)
+
+
+class TLVWriter(object):
+    def __init__(self, encoding=None, implicitProfile=None):
+        self._encoding = encoding if encoding is not None else bytearray()
+        self._implicitProfile = implicitProfile
+        self._containerStack = []
+
+    @property
+    def encoding(self):
+        """The object into which encoded TLV data is written.
+
+        By default this is a bytearray object.
+        """
+        return self._encoding
+
+    @encoding.setter
+    def encoding(self, val):
+        self._encoding = val
+
+    @property
+    def implicitProfile(self):
+        """The Chip profile id used when encoding implicit profile tags.
+
+        Setting this value will result in an implicit profile tag being encoded
+        whenever the profile of the tag to be encoded matches the specified implicit
+        profile id.
+
+        Setting this value to None (the default) disabled encoding of implicit
+        profile tags.
+        """
+        return self._implicitProfile
+
+    @implicitProfile.setter
+    def implicitProfile(self, val):
+        self._implicitProfile = val
+
+    def put(self, tag, val):
+        """Write a value in TLV format with the specified TLV tag.
+
+        val can be a Python object which will be encoded as follows:
+        - Python bools, floats and strings are encoded as their respective TLV types.
+        - Python ints are encoded as unsigned TLV integers if zero or positive; signed TLV
+          integers if negative.
+        - None is encoded as a TLV Null.
+        - bytes and bytearray objects are encoded as TVL byte strings.
+        - Mapping-like objects (e.g. dict) are encoded as TLV structures.  The keys of the
+          map object are expected to be tag values, as described below for the tag argument.
+          Map values are encoded recursively, using the same rules as defined for the val
+          argument. The encoding order of elements depends on the type of the map object.
+          Elements within a dict are automatically encoded tag numerical order. Elements
+          within other forms of mapping object (e.g. OrderedDict) are encoded in the
+          object's natural iteration order.
+        - Sequence-like objects (e.g. arrays) are written as TLV arrays. Elements within
+          the array are encoded recursively, using the same rules as defined for the val
+          argument.
+
+        tag can be a small int (0-255), a tuple of two integers, or None.
+        If tag is an integer, it is encoded as a TLV context-specific tag.
+        If tag is a two-integer tuple, it is encoded as a TLV profile-specific tag, with
+          the first integer encoded as the profile id and the second as the tag number.
+        If tag is None, it is encoded as a TLV anonymous tag.
+        """
+        if val is None:
+            self.putNull(tag)
+        elif isinstance(val, Enum):
+            self.putUnsignedInt(tag, val)
+        elif isinstance(val, bool):
+            self.putBool(tag, val)
+        elif isinstance(val, uint):
+            self.putUnsignedInt(tag, val)
+        elif isinstance(val, int):
+            self.putSignedInt(tag, val)
+        elif isinstance(val, float32):
+            self.putFloat(tag, val)
+        elif isinstance(val, float):
+            self.putDouble(tag, val)
+        elif isinstance(val, str):
+            self.putString(tag, val)
+        elif isinstance(val, bytes) or isinstance(val, bytearray):
+            self.putBytes(tag, val)
+        elif isinstance(val, Mapping):
+            self.startStructure(tag)
+            if type(val) == dict:
+                val = OrderedDict(
+                    sorted(val.items(),
+                           key=lambda item: tlvTagToSortKey(item[0]))
+                )
+            for containedTag, containedVal in val.items():
+                self.put(containedTag, containedVal)
+            self.endContainer()
+        elif isinstance(val, Sequence):
+            self.startArray(tag)
+            for containedVal in val:
+                self.put(None, containedVal)
+            self.endContainer()
+        else:
+            raise ValueError("Attempt to TLV encode unsupported value")
+
+    def putSignedInt(self, tag, val):
+        """Write a value as a TLV signed integer with the specified TLV tag."""
+        if val >= INT8_MIN and val <= INT8_MAX:
+            format = "<b"
+        elif val >= INT16_MIN and val <= INT16_MAX:
+            format = "<h"
+        elif val >= INT32_MIN and val <= INT32_MAX:
+            format = "<l"
+        elif val >= INT64_MIN and val <= INT64_MAX:
+            format = "<q"
+        else:
+            raise ValueError("Integer value out of range")
+        val = struct.pack(format, val)
+        controlAndTag = self._encodeControlAndTag(
+            TLV_TYPE_SIGNED_INTEGER, tag, lenOfLenOrVal=len(val)
+        )
+        self._encoding.extend(controlAndTag)
+        self._encoding.extend(val)
+
+    def putUnsignedInt(self, tag, val):
+        """Write a value as a TLV unsigned integer with the specified TLV tag."""
+        val = self._encodeUnsignedInt(val)
+        controlAndTag = self._encodeControlAndTag(
+            TLV_TYPE_UNSIGNED_INTEGER, tag, lenOfLenOrVal=len(val)
+        )
+        self._encoding.extend(controlAndTag)
+        self._encoding.extend(val)
+
+    def putFloat(self, tag, val):
+        """Write a value as a TLV float with the specified TLV tag."""
+        val = struct.pack("f", val)
+        controlAndTag = self._encodeControlAndTag(
+            TLV_TYPE_FLOATING_POINT_NUMBER, tag, lenOfLenOrVal=len(val)
+        )
+        self._encoding.extend(controlAndTag)
+        self._encoding.extend(val)
+
+    def putDouble(self, tag, val):
+        """Write a value as a TLV double with the specified TLV tag."""
+        val = struct.pack("d", val)
+        controlAndTag = self._encodeControlAndTag(
+            TLV_TYPE_FLOATING_POINT_NUMBER, tag, lenOfLenOrVal=len(val)
+        )
+        self._encoding.extend(controlAndTag)
+        self._encoding.extend(val)
+
+    def putString(self, tag, val):
+        """Write a value as a TLV string with the specified TLV tag."""
+        val = val.encode("utf-8")
+        valLen = self._encodeUnsignedInt(len(val))
+        controlAndTag = self._encodeControlAndTag(
+            TLV_TYPE_UTF8_STRING, tag, lenOfLenOrVal=len(valLen)
+        )
+        self._encoding.extend(controlAndTag)
+        self._encoding.extend(valLen)
+        self._encoding.extend(val)
+
+    def putBytes(self, tag, val):
+        """Write a value as a TLV byte string with the specified TLV tag."""
+        valLen = self._encodeUnsignedInt(len(val))
+        controlAndTag = self._encodeControlAndTag(
+            TLV_TYPE_BYTE_STRING, tag, lenOfLenOrVal=len(valLen)
+        )
+        self._encoding.extend(controlAndTag)
+        self._encoding.extend(valLen)
+        self._encoding.extend(val)
+
+    def putBool(self, tag, val):
+        """Write a value as a TLV boolean with the specified TLV tag."""
+        if val:
+            type = TLVBoolean_True
+        else:
+            type = TLVBoolean_False
+        controlAndTag = self._encodeControlAndTag(type, tag)
+        self._encoding.extend(controlAndTag)
+
+    def putNull(self, tag):
+        """Write a TLV null with the specified TLV tag."""
+        controlAndTag = self._encodeControlAndTag(TLV_TYPE_NULL, tag)
+        self._encoding.extend(controlAndTag)
+
+    def startContainer(self, tag, containerType):
+        """Start writing a TLV container with the specified TLV tag.
+
+        containerType can be one of TLV_TYPE_STRUCTURE, TLV_TYPE_ARRAY or
+        TLV_TYPE_PATH.
+        """
+        self._verifyValidContainerType(containerType)
+        controlAndTag = self._encodeControlAndTag(containerType, tag)
+        self._encoding.extend(controlAndTag)
+        self._containerStack.insert(0, containerType)
+
+    def startStructure(self, tag):
+        """Start writing a TLV structure with the specified TLV tag."""
+        self.startContainer(tag, containerType=TLV_TYPE_STRUCTURE)
+
+    def startArray(self, tag):
+        """Start writing a TLV array with the specified TLV tag."""
+        self.startContainer(tag, containerType=TLV_TYPE_ARRAY)
+
+    def startPath(self, tag):
+        """Start writing a TLV path with the specified TLV tag."""
+        self.startContainer(tag, containerType=TLV_TYPE_PATH)
+
+    def endContainer(self):
+        """End writing the current TLV container."""
+        self._containerStack.pop(0)
+        controlAndTag = self._encodeControlAndTag(TLVEndOfContainer, None)
+        self._encoding.extend(controlAndTag)
+
+    def _encodeControlAndTag(self, type, tag, lenOfLenOrVal=0):
+        controlByte = type
+        if lenOfLenOrVal == 2:
+            controlByte |= 1
+        elif lenOfLenOrVal == 4:
+            controlByte |= 2
+        elif lenOfLenOrVal == 8:
+            controlByte |= 3
+        if tag is None:
+            if (
+                type != TLVEndOfContainer
+                and len(self._containerStack) != 0
+                and self._containerStack[0] == TLV_TYPE_STRUCTURE
+            ):
+                raise ValueError(
+                    "Attempt to encode anonymous tag within TLV structure")
+            controlByte |= TLV_TAG_CONTROL_ANONYMOUS
+            return struct.pack("<B", controlByte)
+        if isinstance(tag, int):
+            if tag < 0 or tag > UINT8_MAX:
+                raise ValueError(
+                    "Context-specific TLV tag number out of range")
+            if len(self._containerStack) == 0:
+                raise ValueError(
+                    "Attempt to encode context-specific TLV tag at top level"
+                )
+            if self._containerStack[0] == TLV_TYPE_ARRAY:
+                raise ValueError(
+                    "Attempt to encode context-specific tag within TLV array"
+                )
+            controlByte |= TLV_TAG_CONTROL_CONTEXT_SPECIFIC
+            return struct.pack("<BB", controlByte, tag)
+        if isinstance(tag, tuple):
+            (profile, tagNum) = tag
+            if not isinstance(tagNum, int):
+                raise ValueError("Invalid object given for TLV tag")
+            if tagNum < 0 or tagNum > UINT32_MAX:
+                raise ValueError("TLV tag number out of range")
+            if profile != None:
+                if not isinstance(profile, int):
+                    raise ValueError("Invalid object given for TLV profile id")
+                if profile < 0 or profile > UINT32_MAX:
+                    raise ValueError("TLV profile id value out of range")
+            if (
+                len(self._containerStack) != 0
+                and self._containerStack[0] == TLV_TYPE_ARRAY
+            ):
+                raise ValueError(
+                    "Attempt to encode profile-specific tag within TLV array"
+                )
+            if profile is None or profile == self._implicitProfile:
+                if tagNum <= UINT16_MAX:
+                    controlByte |= TLV_TAG_CONTROL_IMPLICIT_PROFILE_2Bytes
+                    return struct.pack("<BH", controlByte, tagNum)
+                else:
+                    controlByte |= TLV_TAG_CONTROL_IMPLICIT_PROFILE_4Bytes
+                    return struct.pack("<BL", controlByte, tagNum)
+            elif profile == 0:
+                if tagNum <= UINT16_MAX:
+                    controlByte |= TLV_TAG_CONTROL_COMMON_PROFILE_2Bytes
+                    return struct.pack("<BH", controlByte, tagNum)
+                else:
+                    controlByte |= TLV_TAG_CONTROL_COMMON_PROFILE_4Bytes
+                    return struct.pack("<BL", controlByte, tagNum)
+            else:
+                vendorId = (profile >> 16) & 0xFFFF
+                profileNum = (profile >> 0) & 0xFFFF
+                if tagNum <= UINT16_MAX:
+                    controlByte |= TLV_TAG_CONTROL_FULLY_QUALIFIED_6Bytes
+                    return struct.pack("<BHHH", controlByte, vendorId, profileNum, tagNum)
+                else:
+                    controlByte |= TLV_TAG_CONTROL_FULLY_QUALIFIED_8Bytes
+                    return struct.pack("<BHHL", controlByte, vendorId, profileNum, profile, tagNum)
+        raise ValueError("Invalid object given for TLV tag")
+
+    @staticmethod
+    def _encodeUnsignedInt(val):
+        if val < 0:
+            raise ValueError("Integer value out of range")
+        if val <= UINT8_MAX:
+            format = "<B"
+        elif val <= UINT16_MAX:
+            format = "<H"
+        elif val <= UINT32_MAX:
+            format = "<L"
+        elif val <= UINT64_MAX:
+            format = "<Q"
+        else:
+            raise ValueError("Integer value out of range")
+        return struct.pack(format, val)
+
+    @staticmethod
+    def _verifyValidContainerType(containerType):
+        if (
+            containerType != TLV_TYPE_STRUCTURE
+            and containerType != TLV_TYPE_ARRAY
+            and containerType != TLV_TYPE_PATH
+        ):
+            raise ValueError("Invalid TLV container type")
+
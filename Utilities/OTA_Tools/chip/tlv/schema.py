@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+#
+#   Copyright (c) 2024 STMicroelectronics International N.V.
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+#
+#   @file
+#         Compiled encoders/decoders of fixed-shape Chip TLV structures.
+#
+#   A TLVSchema declares once the fields (context tag, type, optionality) of an
+#   anonymous TLV structure, such as the OTA image header. The schema compiles
+#   an encoder with precomputed control bytes, packing consecutive fixed-size
+#   fields with a single struct format, and a decoder which does not build any
+#   intermediate decoding structure.
+#
+#   The encodings are identical to the ones of TLVWriter.put() on a dict holding
+#   the same values, and decode() returns the same dict as TLVReader.get()['Any'].
+#
+
+import struct
+from collections import namedtuple
+
+from chip.tlv import (TLV_TAG_CONTROL_CONTEXT_SPECIFIC, TLV_TYPE_BOOLEAN, TLV_TYPE_BYTE_STRING,
+                      TLV_TYPE_FLOATING_POINT_NUMBER, TLV_TYPE_SIGNED_INTEGER, TLV_TYPE_STRUCTURE,
+                      TLV_TYPE_UNSIGNED_INTEGER, TLV_TYPE_UTF8_STRING, TLVEndOfContainer, TLVReader,
+                      UINT8_MAX, float32, uint)
+from chip.tlv import (_VALUE_BYTE_STRING, _VALUE_CONSTANT, _VALUE_DECODERS, _VALUE_FIXED, _VALUE_FLOAT32,
+                      _VALUE_UINT, _VALUE_UTF8_STRING)
+
+# Field types: (element types accepted by the decoder, struct code of fixed-size types)
+FIELD_TYPES = {
+    "uint": (range(0x04, 0x08), None),
+    "uint8": (range(0x04, 0x08), "B"),
+    "uint16": (range(0x04, 0x08), "H"),
+    "uint32": (range(0x04, 0x08), "L"),
+    "uint64": (range(0x04, 0x08), "Q"),
+    "int": (range(0x00, 0x04), None),
+    "int8": (range(0x00, 0x04), "b"),
+    "int16": (range(0x00, 0x04), "h"),
+    "int32": (range(0x00, 0x04), "l"),
+    "int64": (range(0x00, 0x04), "q"),
+    "utf8": (range(0x0C, 0x10), None),
+    "bytes": (range(0x10, 0x14), None),
+    "bool": (range(0x08, 0x0A), None),
+    "float32": (range(0x0A, 0x0C), "f"),
+    "double": (range(0x0A, 0x0C), "d"),
+}
+
+# Element type field of fixed-size types (the length is encoded in the two lowest bits)
+_FIXED_ELEMENT_TYPES = {
+    "B": TLV_TYPE_UNSIGNED_INTEGER | 0, "H": TLV_TYPE_UNSIGNED_INTEGER | 1,
+    "L": TLV_TYPE_UNSIGNED_INTEGER | 2, "Q": TLV_TYPE_UNSIGNED_INTEGER | 3,
+    "b": TLV_TYPE_SIGNED_INTEGER | 0, "h": TLV_TYPE_SIGNED_INTEGER | 1,
+    "l": TLV_TYPE_SIGNED_INTEGER | 2, "q": TLV_TYPE_SIGNED_INTEGER | 3,
+    "f": TLV_TYPE_FLOATING_POINT_NUMBER | 0, "d": TLV_TYPE_FLOATING_POINT_NUMBER | 1,
+}
+
+# Minimal width encodings of integers: (struct code, lowest value, highest value)
+_UNSIGNED_WIDTHS = (("B", 0, 0xFF), ("H", 0, 0xFFFF), ("L", 0, 0xFFFFFFFF), ("Q", 0, 0xFFFFFFFFFFFFFFFF))
+_SIGNED_WIDTHS = (("b", -0x80, 0x7F), ("h", -0x8000, 0x7FFF),
+                  ("l", -0x80000000, 0x7FFFFFFF), ("q", -0x8000000000000000, 0x7FFFFFFFFFFFFFFF))
+
+_STRUCTURE_START = bytes([TLV_TYPE_STRUCTURE])
+_END_OF_CONTAINER = bytes([TLVEndOfContainer])
+
+
+TLVField = namedtuple("TLVField", ["tag", "type", "optional"], defaults=[False])
+TLVField.__doc__ = """A field of a TLVSchema.
+
+tag is the context-specific tag number of the field (0-255).
+type is one of the FIELD_TYPES: "uint" and "int" are encoded with the minimal width, as
+TLVWriter does, "uintN"/"intN" with a fixed width; "utf8", "bytes", "bool", "float32" and
+"double" are encoded as the corresponding TLV types.
+optional fields may be absent (or None) in the encoded values."""
+
+
+class _SchemaFallback(Exception):
+    """Raised by the compiled decoder on any encoding it does not handle itself"""
+
+
+class TLVSchema(object):
+    def __init__(self, fields):
+        """Compile the encoder and decoder of an anonymous TLV structure made of fields (TLVField)."""
+        self._fields = sorted(fields, key=lambda field: int(field.tag))
+        tags = [int(field.tag) for field in self._fields]
+        if len(set(tags)) != len(tags):
+            raise ValueError("Duplicate TLV schema tag")
+        for field in self._fields:
+            if not 0 <= int(field.tag) <= UINT8_MAX:
+                raise ValueError("Context-specific TLV tag number out of range")
+            if field.type not in FIELD_TYPES:
+                raise ValueError("Unsupported TLV schema field type %r" % (field.type,))
+
+        self._encodeSteps = self._compileEncoder()
+        self._elementTypes, self._fixedRuns = self._compileDecoder()
+
+    @property
+    def fields(self):
+        """The fields of the schema, in tag order."""
+        return tuple(self._fields)
+
+    def _compileEncoder(self):
+        """Return the list of the encoding functions of the fields: each one appends the encoding
+        of its field(s) to a list of parts"""
+        steps = []
+        run = []
+        for field in self._fields:
+            code = FIELD_TYPES[field.type][1]
+            if code is not None and not field.optional:
+                run.append(field)
+                continue
+            if run:
+                steps.append(self._fixedRunEncoder(run))
+                run = []
+            steps.append(self._fieldEncoder(field))
+        if run:
+            steps.append(self._fixedRunEncoder(run))
+        return steps
+
+    @staticmethod
+    def _fixedRunEncoder(fields):
+        """Encoder of consecutive required fixed-size fields, packed with a single struct format"""
+        fixedStruct = struct.Struct("<" + "".join("BB" + FIELD_TYPES[field.type][1] for field in fields))
+        layout = [(TLV_TAG_CONTROL_CONTEXT_SPECIFIC | _FIXED_ELEMENT_TYPES[FIELD_TYPES[field.type][1]],
+                   int(field.tag)) for field in fields]
+
+        def encodeFixedRun(values, parts):
+            args = []
+            for controlByte, tag in layout:
+                val = values.get(tag)
+                if val is None:
+                    raise ValueError("Missing TLV field %d" % tag)
+                args += (controlByte, tag, val)
+            try:
+                parts.append(fixedStruct.pack(*args))
+            except struct.error:
+                raise ValueError("Integer value out of range")
+        return encodeFixedRun
+
+    @staticmethod
+    def _fieldEncoder(field):
+        """Encoder of a single field"""
+        tag = int(field.tag)
+        optional = field.optional
+        code = FIELD_TYPES[field.type][1]
+
+        def value(values):
+            val = values.get(tag)
+            if val is None and not optional:
+                raise ValueError("Missing TLV field %d" % tag)
+            return val
+
+        if field.type in ("uint", "int"):
+            baseType, widths = ((TLV_TYPE_UNSIGNED_INTEGER, _UNSIGNED_WIDTHS) if field.type == "uint"
+                                else (TLV_TYPE_SIGNED_INTEGER, _SIGNED_WIDTHS))
+            variants = [(struct.Struct("<BB" + widthCode), low, high,
+                         TLV_TAG_CONTROL_CONTEXT_SPECIFIC | baseType | index)
+                        for index, (widthCode, low, high) in enumerate(widths)]
+
+            def encodeInteger(values, parts):
+                val = value(values)
+                if val is None:
+                    return
+                for intStruct, low, high, controlByte in variants:
+                    if low <= val <= high:
+                        parts.append(intStruct.pack(controlByte, tag, val))
+                        return
+                raise ValueError("Integer value out of range")
+            return encodeInteger
+
+        if field.type in ("utf8", "bytes"):
+            baseType = TLV_TYPE_UTF8_STRING if field.type == "utf8" else TLV_TYPE_BYTE_STRING
+            variants = [(struct.Struct("<BB" + widthCode), high, TLV_TAG_CONTROL_CONTEXT_SPECIFIC | baseType | index)
+                        for index, (widthCode, _low, high) in enumerate(_UNSIGNED_WIDTHS)]
+            isText = field.type == "utf8"
+
+            def encodeString(values, parts):
+                val = value(values)
+                if val is None:
+                    return
+                if isText:
+                    val = val.encode("utf-8")
+                length = len(val)
+                for lengthStruct, high, controlByte in variants:
+                    if length <= high:
+                        parts.append(lengthStruct.pack(controlByte, tag, length))
+                        parts.append(val)
+                        return
+            return encodeString
+
+        if field.type == "bool":
+            encodings = {False: bytes([TLV_TAG_CONTROL_CONTEXT_SPECIFIC | TLV_TYPE_BOOLEAN, tag]),
+                         True: bytes([TLV_TAG_CONTROL_CONTEXT_SPECIFIC | TLV_TYPE_BOOLEAN | 1, tag])}
+
+            def encodeBool(values, parts):
+                val = value(values)
+                if val is not None:
+                    parts.append(encodings[bool(val)])
+            return encodeBool
+
+        fixedStruct = struct.Struct("<BB" + code)
+        controlByte = TLV_TAG_CONTROL_CONTEXT_SPECIFIC | _FIXED_ELEMENT_TYPES[code]
+
+        def encodeFixed(values, parts):
+            val = value(values)
+            if val is None:
+                return
+            try:
+                parts.append(fixedStruct.pack(controlByte, tag, val))
+            except struct.error:
+                raise ValueError("Integer value out of range")
+        return encodeFixed
+
+    def _compileDecoder(self):
+        """Return the element types accepted for each tag, and the fixed runs of the schema indexed by
+        the tag of their first field: (struct, [(control byte, tag)], encoded size)"""
+        elementTypes = {int(field.tag): frozenset(FIELD_TYPES[field.type][0]) for field in self._fields}
+        fixedRuns = {}
+        run = []
+        for field in self._fields + [None]:
+            if field is not None and FIELD_TYPES[field.type][1] is not None and not field.optional:
+                run.append(field)
+                continue
+            if len(run) > 1:
+                fixedStruct = struct.Struct("<" + "".join("BB" + FIELD_TYPES[f.type][1] for f in run))
+                layout = [(TLV_TAG_CONTROL_CONTEXT_SPECIFIC | _FIXED_ELEMENT_TYPES[FIELD_TYPES[f.type][1]],
+                           int(f.tag), FIELD_TYPES[f.type][1]) for f in run]
+                fixedRuns[int(run[0].tag)] = (fixedStruct, layout)
+            run = []
+        return elementTypes, fixedRuns
+
+    def encode(self, values):
+        """Encode values, a mapping of field tags to values, as an anonymous TLV structure.
+
+        Returns the encoding as bytes. Raises ValueError if a required field is missing or a
+        value does not fit its field type.
+        """
+        parts = [_STRUCTURE_START]
+        for step in self._encodeSteps:
+            step(values, parts)
+        parts.append(_END_OF_CONTAINER)
+        return b"".join(parts)
+
+    def decode(self, tlv):
+        """Decode an anonymous TLV structure into a dict of tags to values.
+
+        The result is the same as TLVReader(tlv).get()['Any']: encodings which do not follow
+        the schema (unknown tags, other tag forms or types, nested containers...) are decoded
+        by TLVReader.
+        """
+        try:
+            with memoryview(tlv) as view, view.cast("B") as data:
+                return self._decode(data)
+        except _SchemaFallback:
+            return TLVReader(tlv).get()["Any"]
+
+    def _decode(self, data):
+        end = len(data)
+        if end < 2 or data[0] != TLV_TYPE_STRUCTURE:
+            raise _SchemaFallback()
+
+        out = {}
+        elementTypes = self._elementTypes
+        fixedRuns = self._fixedRuns
+        offset = 1
+        while True:
+            if offset >= end:
+                raise _SchemaFallback()
+            controlByte = data[offset]
+            if controlByte == TLVEndOfContainer:
+                offset += 1
+                break
+            if controlByte & 0xE0 != TLV_TAG_CONTROL_CONTEXT_SPECIFIC or offset + 1 >= end:
+                raise _SchemaFallback()
+            tag = data[offset + 1]
+            elementType = controlByte & 0x1F
+            if elementType not in elementTypes.get(tag, ()) or tag in out:
+                raise _SchemaFallback()
+
+            fixedRun = fixedRuns.get(tag)
+            if fixedRun is not None and offset + fixedRun[0].size <= end:
+                fixedStruct, layout = fixedRun
+                unpacked = fixedStruct.unpack_from(data, offset)
+                if all(unpacked[3 * index] == expectedControlByte and unpacked[3 * index + 1] == expectedTag
+                       for index, (expectedControlByte, expectedTag, _code) in enumerate(layout)):
+                    for index, (_controlByte, fieldTag, code) in enumerate(layout):
+                        val = unpacked[3 * index + 2]
+                        out[fieldTag] = (uint(val) if code in "BHLQ" else float32(val) if code == "f" else val)
+                    offset += fixedStruct.size
+                    continue
+
+            offset += 2
+            valueKind, valueStruct = _VALUE_DECODERS[elementType]
+            try:
+                if valueKind == _VALUE_CONSTANT:
+                    val = valueStruct
+                else:
+                    (val,) = valueStruct.unpack_from(data, offset)
+                    offset += valueStruct.size
+                    if valueKind == _VALUE_UINT:
+                        val = uint(val)
+                    elif valueKind == _VALUE_FLOAT32:
+                        val = float32(val)
+                    elif valueKind == _VALUE_UTF8_STRING or valueKind == _VALUE_BYTE_STRING:
+                        if offset + val > end:
+                            raise _SchemaFallback()
+                        length = val
+                        val = bytes(data[offset: offset + length])
+                        offset += length
+                        if valueKind == _VALUE_UTF8_STRING:
+                            try:
+                                val = str(val, "utf-8")
+                            except Exception:
+                                pass
+                    elif valueKind != _VALUE_FIXED:
+                        raise _SchemaFallback()
+            except struct.error:
+                raise _SchemaFallback()
+            out[tag] = val
+
+        if offset != end:
+            raise _SchemaFallback()
+        return out
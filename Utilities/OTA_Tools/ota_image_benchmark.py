@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# Copyright(c) 2024 STMicroelectronics International N.V.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Matter OTA image tool throughput benchmark.
+
+Measures the throughput (MB/s) of the payload copy done when extracting the payload of
+an OTA image and when rewriting its header, comparing the former Python-level
+1 KiB chunk loop with the copy_file_data() path used by ota_image_tool.py.
+
+Usage examples:
+
+./ota_image_benchmark.py
+./ota_image_benchmark.py --size 64 --repeat 5
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
+
+import ota_image_tool
+
+
+def read_chunk(file, size=1024):
+    """
+    Reference Python-level chunk loop formerly used by ota_image_tool.py to copy the payload
+    """
+    while data := file.read(size):
+        yield data
+
+
+def legacy_remove_header(args: object) -> None:
+    """
+    Reference implementation of remove_header() copying through read_chunk()
+    """
+    image_start = ota_image_tool.full_header_size(args)
+    with open(args.image_file, 'rb') as file:
+        with open(args.output_file, 'wb') as outfile:
+            file.seek(image_start)
+            for chunk in read_chunk(file):
+                outfile.write(chunk)
+
+
+def legacy_update_header_args(args: object) -> None:
+    """
+    Reference implementation of update_header_args() copying through read_chunk()
+    """
+    _magic, _total_size, _header_size, header_tlv = ota_image_tool.parse_header(args)
+    update_args = change_header_args(args.image_file, args.output_file, header_tlv)
+    new_header_tlv = ota_image_tool.generate_header_tlv(update_args, header_tlv[ota_image_tool.HeaderTag.PAYLOAD_SIZE],
+                                                        header_tlv[ota_image_tool.HeaderTag.DIGEST])
+    header = ota_image_tool.generate_header(new_header_tlv, header_tlv[ota_image_tool.HeaderTag.PAYLOAD_SIZE])
+
+    with open(args.image_file, 'rb') as infile:
+        with open(args.output_file, 'wb') as outfile:
+            outfile.write(header)
+            infile.seek(ota_image_tool.full_header_size(args))
+            for chunk in read_chunk(infile):
+                outfile.write(chunk)
+
+
+def change_header_args(image_file: str, output_file: str, header_tlv: dict = None):
+    """
+    Arguments of the change_header command bumping the version string only
+    """
+    args = SimpleNamespace(image_file=image_file, output_file=output_file,
+                           vendor_id=None, product_id=None, version=None, version_str='benchmark',
+                           digest_algorithm=None, min_version=None, max_version=None, release_notes=None)
+
+    if header_tlv is not None:
+        args.vendor_id = header_tlv[ota_image_tool.HeaderTag.VENDOR_ID]
+        args.product_id = header_tlv[ota_image_tool.HeaderTag.PRODUCT_ID]
+        args.version = header_tlv[ota_image_tool.HeaderTag.VERSION]
+        args.digest_algorithm = 'sha256'
+
+    return args
+
+
+def create_image(work_dir: str, size_mb: int) -> str:
+    """
+    Create an OTA image with a random payload of size_mb MiB
+    """
+    payload_file = os.path.join(work_dir, 'payload.bin')
+    with open(payload_file, 'wb') as file:
+        for _ in range(size_mb):
+            file.write(os.urandom(1024 * 1024))
+
+    image_file = os.path.join(work_dir, 'image.ota')
+    ota_image_tool.generate_image(SimpleNamespace(
+        vendor_id=0xDEAD, product_id=0xBEEF, version=1, version_str='1.0', digest_algorithm='sha256',
+        min_version=None, max_version=None, release_notes=None,
+        input_files=[payload_file], output_file=image_file))
+
+    return image_file
+
+
+def measure(function, args: object, size: int, repeat: int) -> float:
+    """
+    Return the best throughput of function(args) in MB/s
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return size / (1024 * 1024) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Matter OTA image tool throughput benchmark')
+    parser.add_argument('-s', '--size', type=int, default=32, help='Payload size in MiB')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of runs, the best one is reported')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        image_file = create_image(work_dir, args.size)
+        output_file = os.path.join(work_dir, 'output.bin')
+        size = os.path.getsize(image_file)
+
+        extract_args = SimpleNamespace(image_file=image_file, output_file=output_file)
+        change_args = change_header_args(image_file, output_file)
+
+        results = [
+            ('extract', measure(legacy_remove_header, extract_args, size, args.repeat),
+             measure(ota_image_tool.remove_header, extract_args, size, args.repeat)),
+            ('change_header', measure(legacy_update_header_args, change_args, size, args.repeat),
+             measure(lambda a: ota_image_tool.update_header_args(change_header_args(a.image_file, a.output_file)),
+                     change_args, size, args.repeat)),
+        ]
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(f'Payload size: {args.size} MiB, best of {args.repeat} runs')
+    print(f'{"command":<16}{"before (MB/s)":>16}{"after (MB/s)":>16}')
+    for command, before, after in results:
+        print(f'{command:<16}{before:>16.1f}{after:>16.1f}')
+
+
+if __name__ == "__main__":
+    main()
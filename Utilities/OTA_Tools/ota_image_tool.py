@@ -27,18 +27,33 @@ Creating OTA image file:
 
 Showing OTA image file info:
 ./ota_image_tool.py show my-firmware.ota
+
+Verifying OTA image files (or all OTA image files of a directory):
+./ota_image_tool.py verify my-firmware.ota images/
+
+Computing payload digests for several algorithms in one pass:
+./ota_image_tool.py digest -da sha256 -da sha512 -j digests.json my-firmware.bin
 """
 
 import argparse
+import concurrent.futures
+import errno
 import hashlib
+import json
+import mmap
 import os
+import queue
+import stat
 import struct
 import sys
+import tempfile
+import threading
 from enum import IntEnum
 
 sys.path.insert(0, os.path.join(
     os.path.dirname(__file__), '../controller/python'))
-from chip.tlv import TLVReader, TLVWriter, uint  # noqa: E402 isort:skip
+from chip.tlv import TLVScanner  # noqa: E402 isort:skip
+from chip.tlv.schema import TLVField, TLVSchema  # noqa: E402 isort:skip
 
 HEADER_MAGIC = 0x1BEEF11E
 FIXED_HEADER_FORMAT = '<IQI'
@@ -65,6 +80,15 @@ DIGEST_ALL_ALGORITHMS = hashlib.algorithms_available.intersection(
 # into memory fully before processing.
 PAYLOAD_BUFFER_SIZE = 16 * 1024
 
+# Maximum number of bytes handed to the kernel by a single copy_file_range/sendfile
+# call, and buffer size used when the copy falls back to reads and writes.
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Errors meaning the kernel cannot copy between the given files, in which case the
+# next copy method is tried.
+COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF, errno.ENOTSOCK,
+                        errno.EOPNOTSUPP, errno.ENOTSUP, errno.EPERM, errno.ETXTBSY}
+
 
 class HeaderTag(IntEnum):
     VENDOR_ID = 0
@@ -79,6 +103,20 @@ class HeaderTag(IntEnum):
     DIGEST = 9
 
 
+HEADER_TLV_SCHEMA = TLVSchema([
+    TLVField(HeaderTag.VENDOR_ID, 'uint'),
+    TLVField(HeaderTag.PRODUCT_ID, 'uint'),
+    TLVField(HeaderTag.VERSION, 'uint'),
+    TLVField(HeaderTag.VERSION_STRING, 'utf8'),
+    TLVField(HeaderTag.PAYLOAD_SIZE, 'uint'),
+    TLVField(HeaderTag.MIN_VERSION, 'uint', optional=True),
+    TLVField(HeaderTag.MAX_VERSION, 'uint', optional=True),
+    TLVField(HeaderTag.RELEASE_NOTES_URL, 'utf8', optional=True),
+    TLVField(HeaderTag.DIGEST_TYPE, 'uint'),
+    TLVField(HeaderTag.DIGEST, 'bytes'),
+])
+
+
 def warn(message: str):
     sys.stderr.write(f'warning: {message}\n')
 
@@ -124,52 +162,77 @@ def generate_payload_summary(args: object):
     Calculate total size and hash of all concatenated input payload files
     """
 
-    total_size = 0
-    digest = hashlib.new(args.digest_algorithm)
-
-    if digest.digest_size < (256 // 8):
+    if hashlib.new(args.digest_algorithm).digest_size < (256 // 8):
         warn('Using digest length below 256 bits is not recommended')
 
-    for path in args.input_files:
-        with open(path, 'rb') as file:
-            while True:
-                chunk = file.read(PAYLOAD_BUFFER_SIZE)
-                if not chunk:
-                    break
-                total_size += len(chunk)
-                digest.update(chunk)
+    total_size, digests = generate_payload_digests(payload_files_chunks(args.input_files),
+                                                   [args.digest_algorithm])
 
-    return total_size, digest.digest()
+    return total_size, digests[args.digest_algorithm]
 
 
-def generate_header_tlv(args: object, payload_size: int, payload_digest: bytes):
+def _hash_worker(digest, chunks: queue.Queue):
+    while (chunk := chunks.get()) is not None:
+        digest.update(chunk)
+
+
+def generate_payload_digests(payload_chunks, digest_algorithms: list, threaded: bool = False):
     """
-    Generate anonymous TLV structure with fields describing the OTA image contents
+    Calculate total size and digests of a payload for several algorithms in a single pass
+
+    With threaded set, each digest is computed by its own worker thread, so that hashlib,
+    which releases the GIL on large buffers, hashes a chunk while the next one is read.
+    Returns the total size and a dictionary of digests keyed by algorithm name.
     """
 
-    fields = {
-        HeaderTag.VENDOR_ID: uint(args.vendor_id),
-        HeaderTag.PRODUCT_ID: uint(args.product_id),
-        HeaderTag.VERSION: uint(args.version),
-        HeaderTag.VERSION_STRING: args.version_str,
-        HeaderTag.PAYLOAD_SIZE: uint(payload_size),
-        HeaderTag.DIGEST_TYPE: uint(DIGEST_ALGORITHM_ID[args.digest_algorithm]),
-        HeaderTag.DIGEST: payload_digest,
-    }
+    digests = {algorithm: hashlib.new(algorithm) for algorithm in digest_algorithms}
+    total_size = 0
 
-    if args.min_version is not None:
-        fields.update({HeaderTag.MIN_VERSION: uint(args.min_version)})
+    if not threaded:
+        for chunk in payload_chunks:
+            total_size += len(chunk)
+            for digest in digests.values():
+                digest.update(chunk)
+    else:
+        queues = [queue.Queue(maxsize=4) for _ in digests]
+        workers = [threading.Thread(target=_hash_worker, args=(digest, chunks), daemon=True)
+                   for digest, chunks in zip(digests.values(), queues)]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for chunk in payload_chunks:
+                # payload chunks may be views on a reused buffer
+                chunk = bytes(chunk)
+                total_size += len(chunk)
+                for chunks in queues:
+                    chunks.put(chunk)
+        finally:
+            for chunks in queues:
+                chunks.put(None)
+            for worker in workers:
+                worker.join()
 
-    if args.max_version is not None:
-        fields.update({HeaderTag.MAX_VERSION: uint(args.max_version)})
+    return total_size, {algorithm: digest.digest() for algorithm, digest in digests.items()}
 
-    if args.release_notes is not None:
-        fields.update({HeaderTag.RELEASE_NOTES_URL: args.release_notes})
 
-    writer = TLVWriter()
-    writer.put(None, fields)
+def generate_header_tlv(args: object, payload_size: int, payload_digest: bytes):
+    """
+    Generate anonymous TLV structure with fields describing the OTA image contents
+    """
 
-    return writer.encoding
+    return HEADER_TLV_SCHEMA.encode({
+        HeaderTag.VENDOR_ID: args.vendor_id,
+        HeaderTag.PRODUCT_ID: args.product_id,
+        HeaderTag.VERSION: args.version,
+        HeaderTag.VERSION_STRING: args.version_str,
+        HeaderTag.PAYLOAD_SIZE: payload_size,
+        HeaderTag.MIN_VERSION: args.min_version,
+        HeaderTag.MAX_VERSION: args.max_version,
+        HeaderTag.RELEASE_NOTES_URL: args.release_notes,
+        HeaderTag.DIGEST_TYPE: DIGEST_ALGORITHM_ID[args.digest_algorithm],
+        HeaderTag.DIGEST: payload_digest,
+    })
 
 
 def generate_header(header_tlv: bytes, payload_size: int):
@@ -196,21 +259,222 @@ def write_image(args: object, header: bytes):
 
         for path in args.input_files:
             with open(path, 'rb') as file:
-                while True:
-                    chunk = file.read(PAYLOAD_BUFFER_SIZE)
-                    if not chunk:
-                        break
-                    out_file.write(chunk)
+                copy_file_data(file, out_file)
+
+
+def _copy_file_range(in_fd: int, out_fd: int, in_offset: int, out_offset: int, count: int) -> int:
+    return os.copy_file_range(in_fd, out_fd, count, in_offset, out_offset)
+
+
+def _sendfile(in_fd: int, out_fd: int, in_offset: int, out_offset: int, count: int) -> int:
+    os.lseek(out_fd, out_offset, os.SEEK_SET)
+    return os.sendfile(out_fd, in_fd, in_offset, count)
+
+
+KERNEL_COPY_FUNCTIONS = [function for name, function in (('copy_file_range', _copy_file_range),
+                                                          ('sendfile', _sendfile))
+                         if hasattr(os, name)]
+
+
+def copy_file_data(in_file, out_file, size: int = None) -> int:
+    """
+    Copy size bytes, or everything up to the end of in_file if size is None, from the
+    current position of in_file to the current position of out_file
+
+    The copy is done by the kernel (copy_file_range, then sendfile) when the platform and
+    the files allow it, otherwise it falls back to reading into a single reused buffer.
+    Both file positions are advanced past the copied data. Returns the number of bytes copied.
+    """
+
+    copied = 0
+
+    def remaining():
+        return COPY_CHUNK_SIZE if size is None else min(size - copied, COPY_CHUNK_SIZE)
+
+    out_file.flush()
+    in_offset = in_file.tell()
+    out_offset = out_file.tell()
+
+    try:
+        in_fd = in_file.fileno()
+        out_fd = out_file.fileno()
+        kernel_copy_functions = KERNEL_COPY_FUNCTIONS
+    except OSError:
+        kernel_copy_functions = []
+
+    for kernel_copy in kernel_copy_functions:
+        try:
+            while remaining() > 0:
+                count = kernel_copy(in_fd, out_fd, in_offset + copied, out_offset + copied, remaining())
+                if count == 0:
+                    break
+                copied += count
+            break
+        except OSError as e:
+            if e.errno not in COPY_FALLBACK_ERRNOS:
+                raise
+    else:
+        in_file.seek(in_offset + copied)
+        out_file.seek(out_offset + copied)
+        buffer = memoryview(bytearray(COPY_CHUNK_SIZE))
+        while remaining() > 0:
+            count = in_file.readinto(buffer[:remaining()])
+            if not count:
+                break
+            out_file.write(buffer[:count])
+            copied += count
+
+    in_file.seek(in_offset + copied)
+    out_file.seek(out_offset + copied)
+
+    return copied
+
+
+def payload_files_size(input_files: list):
+    """
+    Return the total size of the input payload files, or None if it cannot be known
+    without reading them (e.g. one of the inputs is a pipe)
+    """
+
+    total_size = 0
+
+    for path in input_files:
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        total_size += file_stat.st_size
+
+    return total_size
+
+
+def payload_files_chunks(input_files: list, start: int = 0):
+    """
+    Yield the content of all concatenated input payload files in chunks
+
+    The payload starts at offset start of the first input file. The chunks are views on
+    a single reused buffer, so each of them must be consumed before requesting the next one.
+    """
+
+    buffer = memoryview(bytearray(PAYLOAD_BUFFER_SIZE))
+
+    for path in input_files:
+        with open(path, 'rb') as file:
+            if start:
+                file.seek(start)
+                start = 0
+            while True:
+                count = file.readinto(buffer)
+                if not count:
+                    break
+                yield buffer[:count]
+
+
+def write_image_single_pass(args: object, payload_size: int, payload_chunks):
+    """
+    Write OTA image file reading the payload only once
+
+    The header size only depends on the payload size and on the digest length, so
+    room for it is reserved first, the payload is hashed while being copied after
+    it, and the final header is written at the beginning of the file at the end.
+    """
+
+    digest = hashlib.new(args.digest_algorithm)
+
+    if digest.digest_size < (256 // 8):
+        warn('Using digest length below 256 bits is not recommended')
+
+    placeholder_tlv = generate_header_tlv(args, payload_size, bytes(digest.digest_size))
+    header_size = len(generate_header(placeholder_tlv, payload_size))
+
+    with open(args.output_file, 'wb') as out_file:
+        out_file.seek(header_size)
+
+        copied_size = 0
+        for chunk in payload_chunks:
+            copied_size += len(chunk)
+            digest.update(chunk)
+            out_file.write(chunk)
+
+        if copied_size != payload_size:
+            error('Payload size changed while generating image')
+
+        header_tlv = generate_header_tlv(args, payload_size, digest.digest())
+        header = generate_header(header_tlv, payload_size)
+        assert len(header) == header_size
+
+        out_file.seek(0)
+        out_file.write(header)
+
+
+def write_image_spooled(args: object, payload_chunks):
+    """
+    Write OTA image file for a payload of unknown size reading it only once
+
+    The payload is hashed while being spooled to a temporary file, which is then
+    copied after the header.
+    """
+
+    digest = hashlib.new(args.digest_algorithm)
+
+    if digest.digest_size < (256 // 8):
+        warn('Using digest length below 256 bits is not recommended')
+
+    with tempfile.TemporaryFile() as spool_file:
+        payload_size = 0
+        for chunk in payload_chunks:
+            payload_size += len(chunk)
+            digest.update(chunk)
+            spool_file.write(chunk)
+
+        header_tlv = generate_header_tlv(args, payload_size, digest.digest())
+        header = generate_header(header_tlv, payload_size)
+
+        with open(args.output_file, 'wb') as out_file:
+            out_file.write(header)
+            spool_file.seek(0)
+            copy_file_data(spool_file, out_file)
+
+
+def progress_chunks(payload_chunks, total_size: int, progress):
+    """
+    Yield payload chunks, calling progress(processed_size, total_size) after each of them
+
+    total_size is None if unknown. progress may raise an exception to abort the processing.
+    """
 
+    processed_size = 0
 
-def generate_image(args: object):
+    for chunk in payload_chunks:
+        yield chunk
+        processed_size += len(chunk)
+        progress(processed_size, total_size)
+
+
+def generate_image(args: object, payload_digest: bytes = None, progress=None):
     """
     Generate OTA image header and write it along with payload files to the OTA image file
+
+    If payload_digest is given, it is trusted to be the args.digest_algorithm digest of the
+    payload files, which are then only copied after the header.
+    If progress is given, it is called as described in progress_chunks() while the payload
+    is processed.
     """
-    payload_size, payload_digest = generate_payload_summary(args)
-    header_tlv = generate_header_tlv(args, payload_size, payload_digest)
-    header = generate_header(header_tlv, payload_size)
-    write_image(args, header)
+    payload_size = payload_files_size(args.input_files)
+    payload_chunks = payload_files_chunks(args.input_files)
+
+    if progress is not None:
+        payload_chunks = progress_chunks(payload_chunks, payload_size, progress)
+
+    if payload_digest is not None and payload_size is not None:
+        header_tlv = generate_header_tlv(args, payload_size, payload_digest)
+        write_image(args, generate_header(header_tlv, payload_size))
+    elif payload_size is not None:
+        write_image_single_pass(args, payload_size, payload_chunks)
+    else:
+        write_image_spooled(args, payload_chunks)
 
 
 def parse_header(args: object):
@@ -222,11 +486,32 @@ def parse_header(args: object):
         fixed_header = file.read(struct.calcsize(FIXED_HEADER_FORMAT))
         magic, total_size, header_size = struct.unpack(
             FIXED_HEADER_FORMAT, fixed_header)
-        header_tlv = TLVReader(file.read(header_size)).get()['Any']
+        header_tlv = HEADER_TLV_SCHEMA.decode(file.read(header_size))
 
         return magic, total_size, header_size, header_tlv
 
 
+def read_header_fields(image_file: str, tags: list) -> dict:
+    """
+    Read the given header fields of an OTA image file. The other fields of the header TLV
+    are skipped without being decoded; the fields not present in the header are omitted
+    """
+
+    with open(image_file, 'rb') as file:
+        fixed_header = file.read(struct.calcsize(FIXED_HEADER_FORMAT))
+        _magic, _total_size, header_size = struct.unpack(
+            FIXED_HEADER_FORMAT, fixed_header)
+        scanner = TLVScanner(file.read(header_size))
+
+    fields = {}
+    for tag in tags:
+        value = scanner.get((tag,))
+        if value is not None:
+            fields[tag] = value
+
+    return fields
+
+
 def full_header_size(args: object) -> int:
     """
     Returns the size of the fixed header + header
@@ -235,11 +520,6 @@ def full_header_size(args: object) -> int:
     return struct.calcsize(FIXED_HEADER_FORMAT) + header_size
 
 
-def read_chunk(file, size=1024):
-    while data := file.read(size):
-        yield data
-
-
 def remove_header(args: object) -> None:
     """
     Removes the header from args.image_file and writes to args.output_file
@@ -248,21 +528,24 @@ def remove_header(args: object) -> None:
     with open(args.image_file, 'rb') as file:
         with open(args.output_file, 'wb') as outfile:
             file.seek(image_start)
-            for chunk in read_chunk(file):
-                outfile.write(chunk)
+            copy_file_data(file, outfile)
 
 
 def show_header(args: object):
     """
-    Parse and present OTA image header in human-readable form
+    Parse and present OTA image header in human-readable form.
+    With args.field, only present the requested fields of the header TLV
     """
 
-    magic, total_size, header_size, header_tlv = parse_header(args)
+    if args.field:
+        header_tlv = read_header_fields(args.image_file, [HeaderTag[name.upper()] for name in args.field])
+    else:
+        magic, total_size, header_size, header_tlv = parse_header(args)
 
-    print(f'Magic: {magic:x}')
-    print(f'Total Size: {total_size}')
-    print(f'Header Size: {header_size}')
-    print(f'Header TLV:')
+        print(f'Magic: {magic:x}')
+        print(f'Total Size: {total_size}')
+        print(f'Header Size: {header_size}')
+        print(f'Header TLV:')
 
     for tag in header_tlv:
         tag_name = HeaderTag(tag).name.replace('_', ' ').title()
@@ -276,14 +559,168 @@ def show_header(args: object):
         print(f'  [{tag}] {tag_name}: {value}')
 
 
+def show_digests(args: object) -> None:
+    """
+    Compute the payload digests of args.input_files (or of the payload of the OTA image
+    args.input_files[0] if args.image is set) for all requested algorithms in a single pass,
+    present them in human-readable form and optionally write them to a JSON report
+    """
+
+    algorithms = sorted(args.digest_algorithm or DIGEST_ALL_ALGORITHMS, key=DIGEST_ALGORITHM_ID.get)
+    header_tlv = None
+    start = 0
+
+    if args.image:
+        if len(args.input_files) != 1:
+            error('A single OTA image file is expected')
+        _magic, _total_size, header_size, header_tlv = parse_header(argparse.Namespace(image_file=args.input_files[0]))
+        start = struct.calcsize(FIXED_HEADER_FORMAT) + header_size
+
+    payload_size, digests = generate_payload_digests(payload_files_chunks(args.input_files, start),
+                                                     algorithms, args.threaded)
+
+    report = {
+        'input_files': args.input_files,
+        'payload_size': payload_size,
+        'digests': {},
+    }
+
+    print(f'Payload Size: {payload_size}')
+    print(f'Digests:')
+
+    for algorithm in algorithms:
+        digest_id = DIGEST_ALGORITHM_ID[algorithm]
+        value = digests[algorithm].hex()
+        report['digests'][algorithm] = {'id': digest_id, 'digest': value}
+
+        if header_tlv is not None and header_tlv[HeaderTag.DIGEST_TYPE] == digest_id:
+            matches = header_tlv[HeaderTag.DIGEST] == digests[algorithm]
+            report['digests'][algorithm]['matches_header'] = matches
+            value += ' (matches header)' if matches else ' (does not match header)'
+
+        print(f'  [{digest_id}] {algorithm.replace("_", "-").upper()}: {value}')
+
+    if args.json is not None:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=4)
+
+
+def verify_image(image_file: str) -> dict:
+    """
+    Verify the consistency of an OTA image
+
+    The total size, header size and payload size fields are checked against the file size,
+    and the payload, accessed through a memory-mapped file, is hashed with the algorithm of
+    the header and compared to the header digest. Returns a dictionary describing the image,
+    whose 'errors' list is empty if the image is valid.
+    """
+
+    result = dict(image_file=image_file, payload_size=None, digest_algorithm=None, errors=[])
+    fixed_header_size = struct.calcsize(FIXED_HEADER_FORMAT)
+
+    with open(image_file, 'rb') as file:
+        file_size = os.fstat(file.fileno()).st_size
+
+        if file_size < fixed_header_size:
+            result['errors'].append('File is smaller than the fixed header')
+            return result
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            magic, total_size, header_size = struct.unpack_from(FIXED_HEADER_FORMAT, image)
+            payload_start = fixed_header_size + header_size
+
+            if magic != HEADER_MAGIC:
+                result['errors'].append(f'Invalid magic {magic:x}')
+                return result
+
+            if total_size != file_size:
+                result['errors'].append(f'Total size {total_size} does not match file size {file_size}')
+
+            if payload_start > file_size:
+                result['errors'].append(f'Header size {header_size} exceeds file size {file_size}')
+                return result
+
+            try:
+                header_tlv = HEADER_TLV_SCHEMA.decode(image[fixed_header_size:payload_start])
+                if not isinstance(header_tlv, dict):
+                    raise TypeError('header TLV is not a structure')
+                payload_size = header_tlv[HeaderTag.PAYLOAD_SIZE]
+                header_digest = header_tlv[HeaderTag.DIGEST]
+                digest_type = header_tlv[HeaderTag.DIGEST_TYPE]
+            except (LookupError, TypeError, ValueError, struct.error):
+                result['errors'].append('Header TLV is invalid')
+                return result
+
+            result['payload_size'] = payload_size
+
+            if payload_size != file_size - payload_start:
+                result['errors'].append(f'Payload size {payload_size} does not match the {file_size - payload_start} '
+                                        f'bytes following the header')
+
+            algorithm = next((key for key, value in DIGEST_ALGORITHM_ID.items() if value == digest_type), None)
+            result['digest_algorithm'] = algorithm
+
+            if algorithm not in DIGEST_ALL_ALGORITHMS:
+                result['errors'].append(f'Unsupported digest type {digest_type}')
+                return result
+
+            digest = hashlib.new(algorithm)
+            with memoryview(image) as view, view[payload_start:] as payload:
+                digest.update(payload)
+
+            if digest.digest() != header_digest:
+                result['errors'].append('Payload digest does not match header digest')
+
+    return result
+
+
+def verify_images(args: object) -> None:
+    """
+    Verify OTA image files, directories being searched for .ota files, concurrently
+    and present the results as a table. Exits with an error if any image is invalid.
+    """
+
+    image_files = []
+    for path in args.image_files:
+        if os.path.isdir(path):
+            image_files += sorted(os.path.join(path, name) for name in os.listdir(path)
+                                  if name.lower().endswith('.ota'))
+        else:
+            image_files.append(path)
+
+    if not image_files:
+        error('No OTA image file found')
+
+    # hashlib releases the GIL while hashing the memory-mapped payloads
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        results = list(executor.map(verify_image, image_files))
+
+    name_width = max(len('Image'), *(len(result['image_file']) for result in results))
+
+    print(f'{"Image":<{name_width}}  {"Payload Size":>12}  {"Digest":<8}  Result')
+    for result in results:
+        payload_size = '' if result['payload_size'] is None else result['payload_size']
+        digest_algorithm = result['digest_algorithm'] or ''
+        status = 'FAILED: ' + '; '.join(result['errors']) if result['errors'] else 'OK'
+        print(f'{result["image_file"]:<{name_width}}  {payload_size:>12}  {digest_algorithm:<8}  {status}')
+
+    failed = sum(1 for result in results if result['errors'])
+    if failed:
+        error(f'{failed} of {len(results)} images failed verification')
+
+    print(f'{len(results)} images verified')
+
+
 def update_header_args(args: object) -> None:
     """
     Generates an image file with a new header
 
     New header values can be specified in args, otherwise the values from args.image_file are used.
-    The new file is written out to args.output_file.
+    The new file is written out to args.output_file, or args.image_file is updated in place if
+    args.in_place is set.
     """
-    _magic, _total_size, _header_size, header_tlv = parse_header(args)
+    _magic, _total_size, header_size, header_tlv = parse_header(args)
+    old_header_size = struct.calcsize(FIXED_HEADER_FORMAT) + header_size
 
     payload_size = header_tlv[HeaderTag.PAYLOAD_SIZE]
     payload_digest = header_tlv[HeaderTag.DIGEST]
@@ -309,12 +746,56 @@ def update_header_args(args: object) -> None:
     new_header_tlv = generate_header_tlv(args, payload_size, payload_digest)
     header = generate_header(new_header_tlv, payload_size)
 
+    if getattr(args, 'in_place', False):
+        rewrite_header_in_place(args.image_file, old_header_size, header)
+        return
+
     with open(args.image_file, 'rb') as infile:
         with open(args.output_file, 'wb') as outfile:
             outfile.write(header)
-            infile.seek(full_header_size(args))
-            for chunk in read_chunk(infile):
-                outfile.write(chunk)
+            infile.seek(old_header_size)
+            copy_file_data(infile, outfile)
+
+
+def rewrite_header_in_place(image_file: str, old_header_size: int, header: bytes) -> None:
+    """
+    Replace the header (fixed header + header TLV) of image_file, of size old_header_size, with header
+
+    When both headers have the same size only the header bytes are written, otherwise the
+    payload is shifted within the file by the size difference.
+    """
+
+    shift = len(header) - old_header_size
+    buffer = memoryview(bytearray(COPY_CHUNK_SIZE))
+
+    with open(image_file, 'r+b') as file:
+        file_size = os.fstat(file.fileno()).st_size
+
+        if shift > 0:
+            # Move the payload towards the end of the file, last chunk first
+            position = file_size
+            while position > old_header_size:
+                count = min(COPY_CHUNK_SIZE, position - old_header_size)
+                position -= count
+                file.seek(position)
+                file.readinto(buffer[:count])
+                file.seek(position + shift)
+                file.write(buffer[:count])
+        elif shift < 0:
+            # Move the payload towards the beginning of the file, first chunk first
+            position = old_header_size
+            while True:
+                file.seek(position)
+                count = file.readinto(buffer)
+                if not count:
+                    break
+                file.seek(position + shift)
+                file.write(buffer[:count])
+                position += count
+            file.truncate(file_size + shift)
+
+        file.seek(0)
+        file.write(header)
 
 
 def main():
@@ -347,8 +828,27 @@ def main():
     create_parser.add_argument('output_file', help='Path to output image file')
 
     show_parser = subcommands.add_parser('show', help='Show OTA image info')
+    show_parser.add_argument('-f', '--field', choices=[tag.name.lower() for tag in HeaderTag], action='append',
+                             help='Only show this header field, may be repeated')
     show_parser.add_argument('image_file', help='Path to OTA image file')
 
+    digest_parser = subcommands.add_parser('digest', help='Compute payload digests for several algorithms in one pass')
+    digest_parser.add_argument('-da', '--digest-algorithm', choices=DIGEST_ALL_ALGORITHMS, action='append',
+                               help='Digest algorithm, may be repeated (default: all available algorithms)')
+    digest_parser.add_argument('-i', '--image', action='store_true',
+                               help='Input file is an OTA image, compute the digests of its payload')
+    digest_parser.add_argument('-t', '--threaded', action='store_true',
+                               help='Compute each digest in a worker thread while the payload is read')
+    digest_parser.add_argument('-j', '--json', help='Path to output JSON report')
+    digest_parser.add_argument('input_files', nargs='+',
+                               help='Path to input image payload file')
+
+    verify_parser = subcommands.add_parser('verify', help='Verify OTA image sizes and payload digest')
+    verify_parser.add_argument('-j', '--jobs', type=int,
+                               help='Number of images verified concurrently')
+    verify_parser.add_argument('image_files', nargs='+',
+                               help='Path to OTA image file or to a directory of OTA image files')
+
     extract_tool = subcommands.add_parser('extract', help='Remove the OTA header from an image file')
     extract_tool.add_argument('image_file', help='Path to OTA image file with header')
     extract_tool.add_argument('output_file', help='Path to put the output file (no header)')
@@ -370,9 +870,11 @@ def main():
                              help='Maximum software version that can be updated to this image')
     change_tool.add_argument(
         '-rn', '--release-notes', help='Release note URL')
+    change_tool.add_argument('-i', '--in-place', action='store_true',
+                             help='Update the input OTA file in place, only rewriting its header when its size is unchanged')
     change_tool.add_argument('image_file',
                              help='Path to input OTA file')
-    change_tool.add_argument('output_file', help='Path to output OTA file')
+    change_tool.add_argument('output_file', nargs='?', help='Path to output OTA file (not used with --in-place)')
 
     args = parser.parse_args()
 
@@ -381,9 +883,15 @@ def main():
         generate_image(args)
     elif args.subcommand == 'show':
         show_header(args)
+    elif args.subcommand == 'digest':
+        show_digests(args)
+    elif args.subcommand == 'verify':
+        verify_images(args)
     elif args.subcommand == 'extract':
         remove_header(args)
     elif args.subcommand == 'change_header':
+        if args.in_place == (args.output_file is not None):
+            error('Either an output file or --in-place must be specified')
         update_header_args(args)
 
 